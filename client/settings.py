@@ -22,6 +22,12 @@ flip_display_axis = True
 # Cluster settings
 cluster_address = "http://10.0.0.253:3524"
 
+# Uploads are sent in chunks, and resumed after up to `upload_retries`
+# failures in a row (e.g. dropped Wi-Fi)
+upload_chunk_size = 512 * 1024
+upload_retries = 5
+upload_timeout = 30
+
 # Local settings
 local_path = os.environ['PWD']
 nprocs = 1
@@ -10,9 +10,10 @@ import calendar
 import requests
 import transfer_data
 import pickle
+import hashlib
 from PIL import Image
 from kinectlib.calibration import affine_calibration
-from settings import cluster_address
+from settings import cluster_address, upload_chunk_size, upload_retries, upload_timeout
 
 local_path = os.environ['PWD']
 
@@ -65,6 +66,63 @@ def redispatch_simulation(sim_id):
     return dispatch(sim)
 
 
+def upload_resumable(sim_id, filename, data):
+    """
+    Uploads the bytes `data` as `filename` of simulation `sim_id`, in chunks of
+    `upload_chunk_size` bytes. After a failure (e.g. a dropped connection) the
+    server is asked how much it received, and the upload continues from there.
+    Gives up after `upload_retries` failures in a row. Returns True once the
+    server holds the whole file.
+    """
+    url = f'{cluster_address}/upload/{sim_id}/{filename}'
+    size = len(data)
+
+    # None until the server has said where to continue from
+    offset = None
+    failures = 0
+
+    while True:
+        try:
+            if offset is None:
+                response = requests.get(f'{url}/status',
+                                        params={'size': size},
+                                        timeout=upload_timeout)
+            else:
+                chunk = data[offset:offset + upload_chunk_size]
+
+                response = requests.put(
+                    url,
+                    params={'offset': offset, 'size': size},
+                    data=chunk,
+                    headers={'X-Chunk-SHA256': hashlib.sha256(chunk).hexdigest()},
+                    timeout=upload_timeout)
+
+            # 409 means the server expects another offset, given in the status
+            if response.status_code != 409:
+                response.raise_for_status()
+
+            status = response.json()
+
+        except (requests.RequestException, ValueError) as e:
+            failures += 1
+
+            if failures > upload_retries:
+                logger(f'upload of {filename} for simulation {sim_id} failed: {e}')
+                return False
+
+            time.sleep(failures)
+            offset = None
+            continue
+
+        if status['complete']:
+            return True
+
+        if offset is not None and status['offset'] > offset:
+            failures = 0
+
+        offset = status['offset']
+
+
 def upload_images(sim_id):
     """
     Upload images for sim_id. Sim can be provided if the function is called either without
@@ -75,18 +133,12 @@ def upload_images(sim_id):
     rgb_file = convert_image_to_bytes(sim['rgb_with_contour'])
     depth_file = convert_image_to_bytes(sim['depth'])
 
-    url = f'{cluster_address}/upload/{sim_id}/rgb_with_contour.png'
-    response = requests.post(url, data=rgb_file)
-
-    if response.status_code != 200:
+    if not upload_resumable(sim_id, 'rgb_with_contour.png', rgb_file):
         logger(
             f'rgb image upload failed for simulation {sim_id}. retry by calling upload_images with a simulation id'
         )
 
-    url = f'{cluster_address}/upload/{sim_id}/depth.png'
-    response = requests.post(url, data=depth_file)
-
-    if response.status_code != 200:
+    if not upload_resumable(sim_id, 'depth.png', depth_file):
         logger(
             f'depth image upload failed for simulation {sim_id}. retry by calling upload_images with a simulation id'
         )
@@ -100,10 +152,9 @@ def upload_pickle_file(sim_id):
     filename = sim_cache_filename(sim_id)
 
     with open(filename, 'rb') as f:
-        url = f'{cluster_address}/upload/{sim_id}/all_data.pickle'
-        response = requests.post(url, data=f)
+        data = f.read()
 
-    if response.status_code != 200:
+    if not upload_resumable(sim_id, 'all_data.pickle', data):
         logger(
             f'sim data upload failed for {sim_id}. retry by calling upload_pickle_file'
         )
@@ -157,12 +208,31 @@ def dispatch(sim):
     return sim['id']
 
 
-def fetch_all():
-    "fetches a list of all simulations and their details from the server"
-    response = requests.get(f'{cluster_address}/simulations')
-    simulations = response.json()
+def fetch_all(fields=None, status=None, page_size=100):
+    """
+    Generator of all simulations and their details from the server, highest ID
+    first. Simulations are fetched a page of `page_size` at a time. `fields`
+    is a list of keys of each simulation to fetch (['*'] for all, a summary by
+    default) and `status` a list of statuses to restrict the simulations to.
+    """
+    params = {'limit': page_size}
+
+    if fields is not None:
+        params['fields'] = ','.join(fields)
+
+    if status is not None:
+        params['status'] = ','.join(status)
+
+    while True:
+        response = requests.get(f'{cluster_address}/simulations', params=params)
+        page = response.json()
+
+        yield from page['simulations']
+
+        if page['next'] is None:
+            break
 
-    return simulations
+        params['before'] = page['next']
 
 
 def fetch_activity():
@@ -26,16 +26,41 @@ def get_print_queue():
     return response.json()['jobs']
 
 
+# Downloaded postcards are kept with their ETag, so that a postcard printed
+# again is only downloaded again if it has changed
+pdf_cache_dir = '/tmp/postcards'
+
+
 def download_pdf(sim_id):
     url = get_print_pdf_url(sim_id)
+
+    filename = f'{pdf_cache_dir}/{sim_id}.pdf'
+    etag_filename = f'{filename}.etag'
+
+    headers = {}
+
+    if os.path.isfile(filename) and os.path.isfile(etag_filename):
+        with open(etag_filename) as f:
+            headers['If-None-Match'] = f.read()
+
     print(f"Downloading {url}")
-    response = requests.get(url, allow_redirects=True)
+    response = requests.get(url, headers=headers, allow_redirects=True)
+
+    if response.status_code == 304:
+        print("Postcard unchanged, using the downloaded copy")
+        return filename
 
-    filename = '/tmp/cache.pdf'
+    os.makedirs(pdf_cache_dir, exist_ok=True)
 
     with open(filename, 'wb') as f:
         f.write(response.content)
 
+    if 'ETag' in response.headers:
+        with open(etag_filename, 'w') as f:
+            f.write(response.headers['ETag'])
+
+    return filename
+
 def mark_as_complete(sim_id):
     url = get_print_finished_url(sim_id)
     response = requests.post(url, allow_redirects=True)
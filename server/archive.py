@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+"""
+Moves finished simulations into cold storage. Everything in a run directory
+that the dashboard doesn't need (VTK files, Elmer meshes and output, the
+uploaded capture, ...) is packed into a compressed zip bundle per simulation
+and removed from the run directory. Files in bundles are still served by
+/simulations/<path>, see `read_archived`.
+
+Run periodically, e.g. from cron:
+
+    python3 archive.py [--days N]
+"""
+import os
+import sys
+import json
+import time
+import fnmatch
+import shutil
+import struct
+import zipfile
+import argparse
+
+import settings
+import utils
+import model
+import catalog
+
+######################################
+## Package variables
+######################################
+
+# Files kept in the run directory, as needed by the dashboard and server
+HOT_PATTERNS = [
+    '*.gif', '*.png', 'postcard.pdf', 'drag.txt', 'drag.dat', 'data.pickle',
+    'avatar_id', 'status.*', 'job_id', 'slurm.*', 'outline*', 'cache.hit',
+    'elapsed.json'
+]
+
+# Header of a gzip stream without file name or time, see `read_archived_gzip`
+GZIP_HEADER = b'\x1f\x8b\x08\x00\x00\x00\x00\x00\x00\xff'
+
+######################################
+## Paths
+######################################
+
+
+def archive_directory():
+    directory = settings.archive_dir.format(root_dir=settings.root_dir)
+
+    utils.ensure_exists(directory)
+
+    return directory
+
+
+def bundle_file(sim_id):
+    return '{archive_dir}/{sim_id}.zip'.format(archive_dir=archive_directory(),
+                                               sim_id=int(sim_id))
+
+
+def index_file():
+    return '{archive_dir}/index.json'.format(archive_dir=archive_directory())
+
+
+def is_hot(filename):
+    return any(fnmatch.fnmatch(filename, pattern) for pattern in HOT_PATTERNS)
+
+
+######################################
+## Archiving
+######################################
+
+
+def archive_simulation(sim_id):
+    """
+    Packs the cold files of a simulation into its bundle and removes them from
+    the run directory. Returns the number of files archived.
+    """
+    run_dir = model.run_directory(sim_id)
+
+    cold = []
+
+    for directory, dirnames, filenames in os.walk(run_dir):
+        for filename in filenames:
+            path = os.path.join(directory, filename)
+            relative = os.path.relpath(path, run_dir)
+
+            if directory != run_dir or not is_hot(filename):
+                cold.append(relative)
+
+    if not cold:
+        return 0
+
+    # write to a temporary file, so that a bundle is never read half-written
+    bundle = bundle_file(sim_id)
+    bundle_tmp = bundle + 'tmp'
+
+    with zipfile.ZipFile(bundle_tmp, 'w', compression=zipfile.ZIP_DEFLATED) as z:
+        for relative in sorted(cold):
+            z.write(os.path.join(run_dir, relative), relative)
+
+    os.rename(bundle_tmp, bundle)
+
+    for relative in cold:
+        os.remove(os.path.join(run_dir, relative))
+
+    # remove the directories left empty (e.g. the Elmer mesh)
+    for entry in os.listdir(run_dir):
+        path = os.path.join(run_dir, entry)
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+
+    return len(cold)
+
+
+def load_index():
+    if not os.path.isfile(index_file()):
+        return {}
+
+    with open(index_file()) as f:
+        return {int(sim_id): entry for sim_id, entry in json.load(f).items()}
+
+
+def archive_finished(days):
+    """
+    Archives simulations that finished more than `days` days ago and are not
+    archived yet. Returns the list of IDs archived.
+    """
+    model.sync_catalog()
+
+    cutoff = time.time() - days * 24 * 3600
+
+    with utils.file_lock(index_file() + '.lock'):
+        index = load_index()
+
+        archived = []
+
+        for sim_id in catalog.finished_before(model.SIM_FINISHED, cutoff):
+            if sim_id in index:
+                continue
+
+            count = archive_simulation(sim_id)
+
+            index[sim_id] = {
+                'bundle': os.path.basename(bundle_file(sim_id)) if count else None,
+                'files': count,
+                'archived_at': time.time(),
+            }
+
+            archived.append(sim_id)
+
+            print('archived {count} files of simulation {sim_id}'.format(
+                count=count, sim_id=sim_id))
+
+        utils.atomic_write(index_file(), json.dumps(index))
+
+    return archived
+
+
+######################################
+## Reading
+######################################
+
+
+def read_archived(sim_id, filename):
+    """
+    Returns the contents of `filename` (relative to the run directory) from the
+    bundle of simulation `sim_id`, or None if it isn't archived
+    """
+    bundle = bundle_file(sim_id)
+
+    if not os.path.isfile(bundle):
+        return None
+
+    with zipfile.ZipFile(bundle) as z:
+        try:
+            return z.read(filename)
+        except KeyError:
+            return None
+
+
+def archived_info(sim_id, filename):
+    """
+    Returns the ZipInfo of `filename` in the bundle of simulation `sim_id`, or
+    None if it isn't archived
+    """
+    bundle = bundle_file(sim_id)
+
+    if not os.path.isfile(bundle):
+        return None
+
+    with zipfile.ZipFile(bundle) as z:
+        try:
+            return z.getinfo(filename)
+        except KeyError:
+            return None
+
+
+def read_archived_gzip(sim_id, filename):
+    """
+    Returns the contents of `filename` from the bundle of simulation `sim_id`
+    as a gzip stream, or None if it isn't archived. The deflate data stored in
+    the bundle is used as is, with a gzip header and trailer (the CRC and size
+    are also in the bundle), so nothing is compressed or decompressed.
+    """
+    info = archived_info(sim_id, filename)
+
+    if info is None or info.compress_type != zipfile.ZIP_DEFLATED:
+        return None
+
+    with open(bundle_file(sim_id), 'rb') as f:
+        # the local file header has its own name and extra field lengths
+        f.seek(info.header_offset)
+        header = f.read(30)
+        name_length, extra_length = struct.unpack('<HH', header[26:30])
+
+        f.seek(info.header_offset + 30 + name_length + extra_length)
+        data = f.read(info.compress_size)
+
+    trailer = struct.pack('<II', info.CRC, info.file_size & 0xffffffff)
+
+    return GZIP_HEADER + data + trailer
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--days',
+                        type=float,
+                        default=settings.archive_after_days,
+                        help='archive simulations finished this many days ago')
+    args = parser.parse_args()
+
+    archived = archive_finished(args.days)
+
+    print('archived {n} simulations'.format(n=len(archived)))
@@ -0,0 +1,145 @@
+import os
+import hashlib
+import mimetypes
+
+from flask import request, Response
+from werkzeug.wsgi import wrap_file
+
+import archive
+
+######################################
+## Package variables
+######################################
+
+# Files of a simulation shown by the dashboards or printed, which are given
+# versioned URLs (see `asset_urls`)
+ASSET_FILES = [
+    'rgb_with_contour.png', 'depth.png', 'left.gif', 'right.gif', 'postcard.pdf'
+]
+
+# For URLs with the current version, and archived files, which never change
+IMMUTABLE = 'public, max-age=31536000, immutable'
+
+# For other URLs, the browser checks with the server (a cheap 304) on each use
+REVALIDATE = 'no-cache'
+
+######################################
+## Versions
+######################################
+
+
+def file_version(path):
+    """
+    Returns a short version of the file at `path`, which changes whenever the
+    file is rewritten, or None if there is no file
+    """
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+
+    return stat_version(stat)
+
+
+def stat_version(stat):
+    """
+    Returns the version of a file from its `os.stat` result, see `file_version`
+    """
+    stamp = '{ino}-{mtime}-{size}'.format(ino=stat.st_ino,
+                                          mtime=stat.st_mtime_ns,
+                                          size=stat.st_size)
+
+    return hashlib.sha1(stamp.encode('utf8')).hexdigest()[:12]
+
+
+def asset_urls(sim_id, run_dir):
+    """
+    Returns the versioned URLs of the assets of a simulation that exist, by
+    filename. These URLs are cached by browsers for good.
+    """
+    urls = {}
+
+    for filename in ASSET_FILES:
+        version = file_version(os.path.join(run_dir, filename))
+
+        if version is not None:
+            urls[filename] = 'simulations/{sim_id}/{filename}?v={version}'.format(
+                sim_id=sim_id, filename=filename, version=version)
+
+    return urls
+
+
+######################################
+## Responses
+######################################
+
+
+def guess_mimetype(filename):
+    return mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+
+
+def conditional(response, etag, cache_control, length):
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = cache_control
+    response.headers['Vary'] = 'Accept-Encoding'
+
+    # answers If-None-Match with 304 and Range with 206
+    return response.make_conditional(request, accept_ranges=True, complete_length=length)
+
+
+def file_response(path):
+    """
+    Returns a response with the file at `path`, cached for good if requested
+    with its current version (?v=), see `asset_urls`
+    """
+    f = open(path, 'rb')
+
+    # the version is taken from the open file, so that it matches the data
+    # served even if the file is replaced in the meantime
+    stat = os.fstat(f.fileno())
+    version = stat_version(stat)
+    length = stat.st_size
+
+    if request.args.get('v') == version:
+        cache_control = IMMUTABLE
+    else:
+        cache_control = REVALIDATE
+
+    response = Response(wrap_file(request.environ, f),
+                        mimetype=guess_mimetype(path),
+                        direct_passthrough=True)
+    response.content_length = length
+    response.last_modified = stat.st_mtime
+
+    return conditional(response, version, cache_control, length)
+
+
+def archived_response(sim_id, filename):
+    """
+    Returns a response with `filename` from the bundle of an archived
+    simulation, or None if it isn't archived. Clients which accept gzip get
+    the compressed data from the bundle as is, unless they ask for a range.
+    """
+    info = archive.archived_info(sim_id, filename)
+
+    if info is None:
+        return None
+
+    etag = '{crc:08x}-{size}'.format(crc=info.CRC, size=info.file_size)
+
+    data = None
+
+    if 'gzip' in request.accept_encodings and 'Range' not in request.headers:
+        data = archive.read_archived_gzip(sim_id, filename)
+
+    if data is not None:
+        response = Response(data, mimetype=guess_mimetype(filename))
+        response.headers['Content-Encoding'] = 'gzip'
+
+        return conditional(response, etag + '-gzip', IMMUTABLE, len(data))
+
+    data = archive.read_archived(sim_id, filename)
+
+    response = Response(data, mimetype=guess_mimetype(filename))
+
+    return conditional(response, etag, IMMUTABLE, len(data))
@@ -0,0 +1,134 @@
+import os
+import json
+import random
+import threading
+
+import utils
+
+
+class AvatarPool:
+    """
+    Assigns avatars to simulations so that no two simulations visible in the
+    UI share one, unless more simulations are visible than there are avatars.
+    The assignments (avatar -> list of simulation IDs) are kept in memory and
+    persisted to `path` as JSON.
+
+    `visible_ids()` returns the IDs of the simulations still visible in the UI.
+    It is only called to release avatars when none are free, or by `release_hidden`.
+    """
+
+    def __init__(self, path, avatars, visible_ids):
+        self.path = path
+        self.avatars = list(avatars)
+        self.visible_ids = visible_ids
+        self.assigned = {}
+        self.free = []
+        self.stamp = None
+        self.lock = threading.Lock()
+
+    def exists(self):
+        return os.path.isfile(self.path)
+
+    def _set_assigned(self, assigned):
+        self.assigned = assigned
+        self.free = [a for a in self.avatars if a not in assigned]
+
+    def _file_stamp(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+
+        return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+    def _load(self):
+        # only read the file if another process has changed it
+        stamp = self._file_stamp()
+
+        if stamp is None or stamp == self.stamp:
+            return
+
+        with open(self.path) as f:
+            assigned = {
+                int(a): [int(sim_id) for sim_id in sim_ids]
+                for a, sim_ids in json.load(f).items()
+            }
+
+        self._set_assigned(assigned)
+        self.stamp = stamp
+
+    def _save(self):
+        utils.atomic_write(self.path, json.dumps(self.assigned))
+        self.stamp = self._file_stamp()
+
+    def rebuild(self, avatars):
+        """
+        Replaces the assignments with `avatars`, a dict of simulation ID -> avatar
+        """
+        assigned = {}
+
+        for sim_id, avatar in avatars.items():
+            if avatar in self.avatars:
+                assigned.setdefault(avatar, []).append(int(sim_id))
+
+        with self.lock, utils.file_lock(self.path + '.lock'):
+            self._set_assigned(assigned)
+            self._save()
+
+    def _release_hidden(self):
+        visible = set(self.visible_ids())
+        changed = False
+
+        for avatar, sim_ids in list(self.assigned.items()):
+            shown = [sim_id for sim_id in sim_ids if sim_id in visible]
+
+            if len(shown) == len(sim_ids):
+                continue
+
+            changed = True
+
+            if shown:
+                self.assigned[avatar] = shown
+            else:
+                del self.assigned[avatar]
+                self.free.append(avatar)
+
+        return changed
+
+    def release_hidden(self):
+        """
+        Releases the avatars of simulations no longer visible in the UI
+        """
+        with self.lock, utils.file_lock(self.path + '.lock'):
+            self._load()
+
+            if self._release_hidden():
+                self._save()
+
+    def reserve(self, sim_id):
+        """
+        Picks a free avatar at random and assigns it to `sim_id`
+        """
+        with self.lock, utils.file_lock(self.path + '.lock'):
+            self._load()
+
+            if not self.free:
+                self._release_hidden()
+
+            if self.free:
+                # swap a random free avatar to the end, to pop it in O(1)
+                i = random.randrange(len(self.free))
+                self.free[i], self.free[-1] = self.free[-1], self.free[i]
+                avatar = self.free.pop()
+            else:
+                # more simulations visible than avatars, so one has to be
+                # shared, picking one of the least shared
+                fewest = min(len(sim_ids) for sim_ids in self.assigned.values())
+                avatar = random.choice([
+                    a for a, sim_ids in self.assigned.items() if len(sim_ids) == fewest
+                ])
+
+            self.assigned.setdefault(avatar, []).append(int(sim_id))
+            self._save()
+
+        return avatar
@@ -0,0 +1,271 @@
+import os
+import json
+import sqlite3
+import threading
+
+import settings
+
+######################################
+## Package variables
+######################################
+
+CATALOG_FILENAME = 'catalog.sqlite'
+
+# Columns stored for each simulation, in table order
+COLUMNS = ('id', 'status', 'drag', 'avatar_id', 'nodes', 'job_id',
+           'created_at', 'started_at', 'finished_at')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS simulations (
+    id INTEGER PRIMARY KEY,
+    status TEXT NOT NULL,
+    drag REAL,
+    avatar_id INTEGER,
+    nodes TEXT,
+    job_id TEXT,
+    created_at REAL,
+    started_at REAL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS simulations_status ON simulations (status, id);
+CREATE INDEX IF NOT EXISTS simulations_drag ON simulations (drag);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+# One connection per thread (sqlite connections can't be shared between
+# threads), keyed on the catalog path so that changing settings.root_dir
+# picks up a new file.
+_local = threading.local()
+
+######################################
+## Connection
+######################################
+
+
+def catalog_path():
+    return '{root_dir}/simulations/{filename}'.format(
+        root_dir=settings.root_dir, filename=CATALOG_FILENAME)
+
+
+def is_built():
+    """
+    Returns True if the catalog has been built from the simulation store.
+    Until then updates are ignored, since the build will pick them up.
+    """
+    if not os.path.isfile(catalog_path()):
+        return False
+
+    row = connect().execute(
+        "SELECT value FROM meta WHERE key = 'built'").fetchone()
+
+    return row is not None
+
+
+def connect():
+    """
+    Returns the sqlite connection for the calling thread, creating the catalog
+    if it doesn't exist. Note, the default rollback journal is used rather than
+    WAL because the simulation store may live on NFS.
+    """
+    path = catalog_path()
+
+    connections = getattr(_local, 'connections', None)
+
+    if connections is None:
+        connections = _local.connections = {}
+
+    if path not in connections:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        conn = sqlite3.connect(path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        conn.executescript(SCHEMA)
+
+        connections[path] = conn
+
+    return connections[path]
+
+
+######################################
+## Updates
+######################################
+
+
+def _encode(fields):
+    if 'nodes' in fields and fields['nodes'] is not None:
+        fields = dict(fields, nodes=json.dumps(list(fields['nodes'])))
+
+    return fields
+
+
+def _decode(row):
+    sim = dict(row)
+
+    sim['nodes'] = json.loads(sim['nodes']) if sim['nodes'] else []
+
+    return sim
+
+
+def upsert(sim_id, **fields):
+    """
+    Insert a simulation into the catalog, or update the given fields if the
+    simulation is already catalogued. A status must be given for new entries.
+    Note, this is an update then an insert rather than an upsert statement, as
+    the sqlite of the Raspberry Pi image may predate 3.24.
+    """
+    if not is_built():
+        return
+
+    fields = _encode(fields)
+    keys = sorted(fields.keys())
+
+    statement = 'UPDATE simulations SET {updates} WHERE id = ?'.format(
+        updates=', '.join('{k} = ?'.format(k=k) for k in keys))
+
+    insert = 'INSERT INTO simulations (id, {cols}) VALUES (?, {marks})'.format(
+        cols=', '.join(keys), marks=', '.join('?' for k in keys))
+
+    conn = connect()
+
+    with conn:
+        cursor = conn.execute(statement, [fields[k] for k in keys] + [int(sim_id)])
+
+        if cursor.rowcount == 0:
+            conn.execute(insert, [int(sim_id)] + [fields[k] for k in keys])
+
+
+def update(sim_id, **fields):
+    """
+    Update fields of a catalogued simulation. Unknown simulations are ignored.
+    """
+    if not is_built():
+        return
+
+    fields = _encode(fields)
+    keys = sorted(fields.keys())
+
+    statement = 'UPDATE simulations SET {updates} WHERE id = ?'.format(
+        updates=', '.join('{k} = ?'.format(k=k) for k in keys))
+
+    conn = connect()
+
+    with conn:
+        conn.execute(statement, [fields[k] for k in keys] + [int(sim_id)])
+
+
+def replace_all(rows):
+    """
+    Replace the whole catalog with `rows`, a list of dicts with keys from
+    COLUMNS. Used when rebuilding the catalog from the simulation store.
+    """
+    rows = [_encode(row) for row in rows]
+
+    conn = connect()
+
+    with conn:
+        conn.execute('DELETE FROM simulations')
+        conn.executemany(
+            'INSERT INTO simulations ({cols}) VALUES ({marks})'.format(
+                cols=', '.join(COLUMNS), marks=', '.join('?' for c in COLUMNS)),
+            [[row.get(c) for c in COLUMNS] for row in rows])
+        conn.execute(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES ('built', '1')")
+
+
+######################################
+## Queries
+######################################
+
+
+def get(sim_id):
+    """
+    Returns the catalog entry for a simulation as a dict, or None
+    """
+    row = connect().execute('SELECT * FROM simulations WHERE id = ?',
+                            (int(sim_id), )).fetchone()
+
+    return _decode(row) if row is not None else None
+
+
+def ids(statuses=None, limit=None, reverse=True, before=None):
+    """
+    Returns simulation IDs ordered by ID (highest first unless `reverse` is
+    False), optionally restricted to a list of `statuses`, to IDs below
+    `before` and to `limit` items.
+    """
+    statement = 'SELECT id FROM simulations'
+    conditions = []
+    args = []
+
+    if statuses is not None:
+        conditions.append('status IN ({marks})'.format(
+            marks=', '.join('?' for s in statuses)))
+        args += list(statuses)
+
+    if before is not None:
+        conditions.append('id < ?')
+        args.append(int(before))
+
+    if conditions:
+        statement += ' WHERE ' + ' AND '.join(conditions)
+
+    statement += ' ORDER BY id DESC' if reverse else ' ORDER BY id ASC'
+
+    if limit is not None:
+        statement += ' LIMIT ?'
+        args.append(int(limit))
+
+    return [row['id'] for row in connect().execute(statement, args)]
+
+
+def unsettled(active_statuses, finished_status, since):
+    """
+    Returns full catalog entries for simulations that may still change: those
+    in one of `active_statuses`, and those that reached `finished_status`
+    after `since` but have no drag yet.
+    """
+    statement = 'SELECT * FROM simulations WHERE status IN ({marks}) ' \
+                'OR (status = ? AND drag IS NULL AND finished_at > ?)'.format(
+                    marks=', '.join('?' for s in active_statuses))
+
+    args = list(active_statuses) + [finished_status, since]
+
+    return [_decode(row) for row in connect().execute(statement, args)]
+
+
+def finished_before(finished_status, cutoff):
+    """
+    Returns IDs of simulations that reached `finished_status` before `cutoff`,
+    oldest first
+    """
+    rows = connect().execute(
+        'SELECT id FROM simulations WHERE status = ? AND finished_at < ? ORDER BY id',
+        (finished_status, cutoff))
+
+    return [row['id'] for row in rows]
+
+
+def drags(limit=None):
+    """
+    Returns a list of (drag, id) for all simulations with a drag (or the
+    `limit` lowest), lowest drag first
+    """
+    statement = 'SELECT drag, id FROM simulations WHERE drag IS NOT NULL ORDER BY drag, id'
+    args = []
+
+    if limit is not None:
+        statement += ' LIMIT ?'
+        args.append(int(limit))
+
+    rows = connect().execute(statement, args)
+
+    return [(row['drag'], row['id']) for row in rows]
+
+
+def max_id():
+    row = connect().execute('SELECT MAX(id) AS id FROM simulations').fetchone()
+
+    return row['id']
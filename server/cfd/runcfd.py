@@ -32,7 +32,9 @@ from cfdpi_step4 import *
 from cfdpi_step5 import *
 from createcontoureps import *
 import computedrag
+import resultfields
 import model
+import settings
 import json
 from images_to_pdf.pdfgen import build_sim_document
 
@@ -52,6 +54,19 @@ if len(sys.argv) > 2:
 # Keep track of timings for each step
 timing = {'elapsed': [], 'steps': []}
 
+# If the outline has been simulated before, steps 1, 2, 3 and 5 are skipped
+# and the cached results are used instead (see model.restore_cached_result)
+cached = model.cached_result(sim_id)
+
+if cached is not None:
+    print("Using cached result {key}".format(key=cached['key']))
+
+    # the cached results were computed with this many processes
+    nprocs = cached['nprocs']
+
+    if not model.wait_for_upload(sim_id, settings.result_cache_upload_wait):
+        print("Photos not uploaded, rendering without them")
+
 print("Starting Step 1 (Model Outline  -->  CFD Mesh)")
 print("###################################################################\n")
 #
@@ -60,7 +75,8 @@ print("###################################################################\n")
 #################################################
 
 start = time.time()
-generate_mesh_from_outline(sim_id, nprocs)
+if cached is None:
+    generate_mesh_from_outline(sim_id, nprocs)
 end = time.time()
 timing['elapsed'].append(end - start)
 timing['steps'].append('Step 1: Read the outline and generate the mesh')
@@ -74,7 +90,8 @@ print("###################################################################\n")
 ##########################################################
 
 start = time.time()
-run_cfd_simulation(sim_id, nprocs)
+if cached is None:
+    run_cfd_simulation(sim_id, nprocs)
 end = time.time()
 timing['elapsed'].append(end - start)
 timing['steps'].append(
@@ -88,8 +105,22 @@ print("###################################################################\n")
 #
 #####################################################
 
+num_timesteps = 10
+
 start = time.time()
-generate_vtk_files(sim_id, nprocs)
+if cached is None:
+    generate_vtk_files(sim_id, nprocs)
+
+    # parse the VTK files once, the next steps read the binary fields
+    try:
+        resultfields.convert_vtk(model.run_directory(sim_id), range(1, num_timesteps + 1))
+    except FileNotFoundError:
+        print("ERROR: no vtk files")
+    except (ValueError, KeyError) as e:
+        # malformed VTK files: the run is marked as failed, and carries on
+        # without results so that it is still finished (but gets no drag)
+        print("ERROR: reading the vtk files failed: {error}".format(error=repr(e)))
+        model.touch_file(sim_id, model.STATUS_FAILED)
 end = time.time()
 timing['elapsed'].append(end - start)
 timing['steps'].append('Step 3: Create .vtk files from Elmer output')
@@ -102,10 +133,11 @@ print("###################################################################\n")
 #
 ##################################################################
 
-num_timesteps = 10
+# The fields of the run, read once and shared by steps 4 and 5
+field_store = resultfields.FieldStore(model.run_directory, range(1, num_timesteps + 1))
 
 start = time.time()
-left, right, rgb, depth = generate_images_vtk(sim_id, nprocs, num_timesteps)
+left, right, rgb, depth = generate_images_vtk(sim_id, nprocs, num_timesteps, field_store)
 end = time.time()
 timing['elapsed'].append(end - start)
 timing['steps'].append(
@@ -124,15 +156,29 @@ print("###################################################################\n")
 ##################################################################
 
 start = time.time()
-drag = computedrag.compute_drag(sim_id, nprocs, num_timesteps)
+if cached is None:
+    drag = computedrag.compute_drag(sim_id, nprocs, num_timesteps, field_store)
+else:
+    drag = cached['drag']
+
+field_store.release(sim_id)
+
+# a run without results has no drag, so it can't enter the leaderboard
+if drag is None:
+    print("ERROR: no drag, the run has no results")
+    model.touch_file(sim_id, model.STATUS_FAILED)
 
-model.set_drag(sim_id, drag)
+failed = model.sim_check_file(sim_id, model.STATUS_FAILED)
+
+if not failed:
+    model.set_drag(sim_id, drag)
 end = time.time()
 timing['elapsed'].append(end - start)
 timing['steps'].append('Step 5: Compute drag from simulation output')
 
-print("Hurrayyyyy! The program is executed successfully.")
-print("\nYou can now display the images\n")
+if not failed:
+    print("Hurrayyyyy! The program is executed successfully.")
+    print("\nYou can now display the images\n")
 
 print("Starting Step 6 (Generate PDF)")
 print("###################################################################\n")
@@ -148,7 +194,14 @@ images = [
     right,
 ]
 
-build_sim_document(sim_id, images)
+if failed:
+    print("Run failed, no PDF")
+else:
+    build_sim_document(sim_id, images)
+
+    if cached is None:
+        model.store_cached_result(sim_id, nprocs, drag)
+
 start = time.time()
 elapsed_time_file = model.run_directory(sim_id) + '/elapsed.json'
 with open(elapsed_time_file, 'w') as outfile:
@@ -6,84 +6,15 @@ import matplotlib.pyplot as plt
 import numpy as np
 import glob
 import model
+import resultfields
 
 import settings
 
 
-def compute_drag_from_vtk(fname_poly, vtkfilename, nprocs):
-
-    # Open the file with read only permit
-    vtkfile = open(vtkfilename, "r")
-
-    # Header
-    line = vtkfile.readline()
-    # Project name
-    line = vtkfile.readline()
-    # ASCII or Binary
-    line = vtkfile.readline()
-    # Grid type
-    line = vtkfile.readline()
-    # Points
-    line = vtkfile.readline()
-    listtemp = " ".join(line.split())
-    listtemp = listtemp.split(" ")
-    numpoints = int(listtemp[1])
-    #print "numpoints=", numpoints
-    # Point coordinates
-    coords = np.zeros((numpoints, 3), dtype=float)
-    for ii in range(numpoints):
-        line = vtkfile.readline()
-        #print("Line {}: {}".format(ii, line.strip()))
-        listtemp = " ".join(line.split())
-        listtemp = listtemp.split(" ")
-        coords[ii, 0] = float(listtemp[0])
-        coords[ii, 1] = float(listtemp[1])
-        coords[ii, 2] = float(listtemp[2])
-
-    # Elements(Cells)
-    line = vtkfile.readline()
-    listtemp = " ".join(line.split())
-    listtemp = listtemp.split(" ")
-    numcells = int(listtemp[1])
-    #print "numcells=", numcells
-    for ii in range(numcells):
-        line = vtkfile.readline()
-
-    # CELL_TYPES
-    line = vtkfile.readline()
-    listtemp = " ".join(line.split())
-    listtemp = listtemp.split(" ")
-    iii = int(listtemp[1])
-    for ii in range(iii):
-        line = vtkfile.readline()
-
-    if (nprocs > 1):
-        # CELL DATA - coloring
-        line = vtkfile.readline()
-        line = vtkfile.readline()
-        line = vtkfile.readline()
-        for ii in range(numcells):
-            line = vtkfile.readline()
-
-    # Point data
-    line = vtkfile.readline()
-    line = vtkfile.readline()
-    line = vtkfile.readline()
-
-    # Pressure
-    pressure = np.zeros((numpoints, 1), dtype=float)
-    for ii in range(numpoints):
-        line = vtkfile.readline()
-        #print("Line {}: {}".format(ii, line.strip()))
-        listtemp = " ".join(line.split())
-        listtemp = listtemp.split(" ")
-        pressure[ii, 0] = float(listtemp[0])
-
-    vtkfile.close()
-
-    ##########
-    ##
-    # read the .poly file and get the points on the outline
+def read_outline(fname_poly):
+    """
+    Returns the coordinates of the points on the outline from the .poly file
+    """
     polyfile = open(fname_poly, "r")
 
     # read the first line and get the number of points on the outline
@@ -110,19 +41,25 @@ def compute_drag_from_vtk(fname_poly, vtkfilename, nprocs):
         coords_outline[ii, 0] = float(listtemp[1])
         coords_outline[ii, 1] = float(listtemp[2])
 
+    polyfile.close()
+
+    return coords_outline
+
+
+def compute_drag_from_fields(coords_outline, coords, pressure):
+
     # Compute drag by summing pressure at all the nodes on the outline
     drag = 0.0
-    for ii in range(numpoints_outline):
+    for ii in range(len(coords_outline)):
         xx = coords_outline[ii, 0]
         yy = coords_outline[ii, 0]
 
-        for jj in range(numpoints):
-            if ((abs(xx - coords[jj, 0]) < 1.0e-6)
-                    and (abs(yy - coords[jj, 0]) < 1.0e-6)):
-                drag = drag + pressure[jj, 0]
-                break
+        # the first node matching the outline point
+        matches = np.flatnonzero((np.abs(xx - coords[:, 0]) < 1.0e-6)
+                                 & (np.abs(yy - coords[:, 0]) < 1.0e-6))
 
-    polyfile.close()
+        if len(matches) > 0:
+            drag = drag + float(pressure[matches[0]])
 
     return drag
 
@@ -130,13 +67,13 @@ def compute_drag_from_vtk(fname_poly, vtkfilename, nprocs):
 ######################################################
 
 
-# Compute drag from the pressure at the nodes on the outline
+# Compute drag from the pressure at the nodes on the outline, None if no
+# timestep could be read
 #
-def compute_drag(sim_id, nprocs, num_timesteps):
+def compute_drag(sim_id, nprocs, num_timesteps, field_store=None):
 
     sim_dir = model.run_directory(sim_id)
 
-    fname_temp = "elmeroutput"
     global drag
 
     filename_drag = sim_dir + "/drag.dat"
@@ -147,20 +84,25 @@ def compute_drag(sim_id, nprocs, num_timesteps):
     drag_list = np.zeros(num_timesteps, dtype=float)
     count = 0
 
+    fname_poly = '{sim_dir}/simulation.poly'.format(sim_dir=sim_dir)
+    coords_outline = read_outline(fname_poly)
+
+    # the fields already loaded by the run, if it shares them
+    store = field_store if field_store is not None else resultfields.FieldStore(
+        model.run_directory, range(1, num_timesteps + 1))
+
     for fnum in range(num_timesteps):
-        vtkfilename = sim_dir + "/" + fname_temp + str(fnum +
-                                                       1).zfill(4) + ".vtk"
-        print(vtkfilename)
+        fields = store.get(sim_id, fnum + 1)
 
-        if (os.path.isfile(vtkfilename) == True):
-            fname_poly = '{sim_dir}/simulation.poly'.format(sim_dir=sim_dir)
-            drag = compute_drag_from_vtk(fname_poly, vtkfilename, nprocs)
+        if fields is not None:
+            drag = compute_drag_from_fields(coords_outline, fields.points,
+                                            fields.pressure)
             drag = -drag
             drag_list[fnum] = drag
             dragfile.write("%04d \t %12.6f \n" % ((fnum + 1), drag))
             count = count + 1
         else:
-            print('File {vtkfilename} not found'.format(vtkfilename=vtkfilename))
+            print('Timestep {timestep} not found'.format(timestep=fnum + 1))
 
     if count > 0:
         plt.figure(1)
@@ -178,6 +120,12 @@ def compute_drag(sim_id, nprocs, num_timesteps):
     else:
         print("ERROR: no vtk files")
 
+    if field_store is None:
+        store.release(sim_id)
+
+    if count == 0:
+        return None
+
     return drag_list[-1]
 
 
@@ -0,0 +1,200 @@
+import time
+import queue
+import threading
+
+import numpyjson
+
+
+def format_event(event_id, name, data):
+    return 'id: {id}\nevent: {name}\ndata: {data}\n\n'.format(
+        id=event_id, name=name, data=numpyjson.dumps(data))
+
+
+def delta(previous, current):
+    """
+    Returns the part of `current` which differs from `previous`: the changed
+    keys of a dict, or the whole value otherwise. None if nothing changed.
+    """
+    if isinstance(previous, dict) and isinstance(current, dict):
+        changed = {k: v for k, v in current.items() if previous.get(k) != v}
+        return changed or None
+
+    if previous == current:
+        return None
+
+    return current
+
+
+class Channel:
+    def __init__(self, name, produce, version):
+        self.name = name
+        self.produce = produce
+        self.version = version
+        self.last_version = None
+        self.latest = None
+
+
+class Subscriber:
+    def __init__(self, channels, queue_size):
+        self.channels = set(channels)
+        self.queue = queue.Queue(queue_size)
+
+
+class EventStream:
+    """
+    Pushes server state to any number of subscribers as server-sent events.
+
+    A single producer thread calls `produce()` of each channel with at least
+    one subscriber every `interval` seconds, and sends the changes since the
+    last call (see `delta`) to all subscribers of the channel. When a channel
+    has a `version()` function and its value is unchanged, the channel isn't
+    produced again. Each interval ends with a "tick" event giving the time.
+
+    A new subscriber first receives the latest full state of its channels.
+    Subscribers that fall `queue_size` events behind are disconnected (the
+    browser reconnects and receives the full state again).
+    """
+
+    def __init__(self, interval, queue_size=100, keepalive=15):
+        self.interval = interval
+        self.queue_size = queue_size
+        self.keepalive = keepalive
+        self.channels = {}
+        self.subscribers = set()
+        self.event_id = 0
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.thread = None
+
+    def add_channel(self, name, produce, version=None):
+        self.channels[name] = Channel(name, produce, version)
+
+    ######################################
+    ## Producer
+    ######################################
+
+    def _subscribed_channels(self):
+        with self.lock:
+            names = set()
+            for subscriber in self.subscribers:
+                names |= subscriber.channels
+
+        return [self.channels[name] for name in sorted(names)]
+
+    def _produce(self, channel):
+        if channel.version is not None:
+            version = channel.version()
+
+            if version is not None and version == channel.last_version:
+                return None
+
+            channel.last_version = version
+
+        current = channel.produce()
+
+        if channel.latest is None:
+            return current, current
+
+        return current, delta(channel.latest, current)
+
+    def _publish(self, name, data):
+        self.event_id += 1
+        message = format_event(self.event_id, name, data)
+
+        for subscriber in list(self.subscribers):
+            if name != 'tick' and name not in subscriber.channels:
+                continue
+
+            try:
+                subscriber.queue.put_nowait(message)
+            except queue.Full:
+                # too slow, disconnect it
+                self.subscribers.discard(subscriber)
+
+    def step(self):
+        """
+        Produces all subscribed channels once and publishes the changes
+        """
+        produced = []
+
+        for channel in self._subscribed_channels():
+            try:
+                result = self._produce(channel)
+            except Exception as e:
+                print('event channel {name} failed: {error}'.format(
+                    name=channel.name, error=repr(e)))
+                channel.last_version = None
+                continue
+
+            if result is not None:
+                produced.append((channel, result))
+
+        with self.lock:
+            for channel, (current, changes) in produced:
+                channel.latest = current
+
+                if changes is not None:
+                    self._publish(channel.name, changes)
+
+            if self.subscribers:
+                self._publish('tick', {'time': time.time()})
+
+    def _run(self):
+        while True:
+            if not self.subscribers:
+                self.wakeup.wait()
+                self.wakeup.clear()
+
+            self.step()
+
+            time.sleep(self.interval)
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._run, daemon=True)
+            self.thread.start()
+
+    ######################################
+    ## Subscribers
+    ######################################
+
+    def subscribe(self, channels):
+        """
+        Returns a generator of server-sent event messages for `channels`
+        """
+        channels = [name for name in channels if name in self.channels]
+
+        subscriber = Subscriber(channels, self.queue_size)
+
+        with self.lock:
+            self.subscribers.add(subscriber)
+
+            initial = [
+                format_event(self.event_id, name, self.channels[name].latest)
+                for name in channels if self.channels[name].latest is not None
+            ]
+
+        self.start()
+        self.wakeup.set()
+
+        def messages():
+            try:
+                yield 'retry: {ms}\n\n'.format(ms=int(self.interval * 1000))
+
+                for message in initial:
+                    yield message
+
+                while subscriber in self.subscribers:
+                    try:
+                        yield subscriber.queue.get(timeout=self.keepalive)
+                    except queue.Empty:
+                        yield ': keepalive\n\n'
+            finally:
+                with self.lock:
+                    self.subscribers.discard(subscriber)
+
+        return messages()
+
+    def subscriber_count(self):
+        with self.lock:
+            return len(self.subscribers)
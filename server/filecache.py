@@ -0,0 +1,93 @@
+import os
+import threading
+from collections import OrderedDict
+
+
+class FileCache:
+    """
+    Least recently used cache of objects loaded from files by `loader(filename)`.
+
+    Entries are keyed on (path, mtime, size), so a rewritten file is loaded
+    again. The cache holds at most `max_bytes`, measured by the size of the
+    files on disk. Files which fail to load (e.g. half-written) are cached as
+    None until they change, rather than being read again on every request.
+    """
+
+    def __init__(self, loader, max_bytes):
+        self.loader = loader
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.paths = {}
+        self.current_bytes = 0
+        self.lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.failures = 0
+        self.evictions = 0
+
+    def load(self, filename):
+        """
+        Returns the object loaded from `filename`, or None if it can't be loaded
+        """
+        stat = os.stat(filename)
+        key = (filename, stat.st_mtime_ns, stat.st_size)
+
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key]
+
+            self.misses += 1
+
+        try:
+            value = self.loader(filename)
+        except Exception as e:
+            print('failed to load {filename}: {error}'.format(filename=filename,
+                                                             error=repr(e)))
+            value = None
+
+        with self.lock:
+            if value is None:
+                self.failures += 1
+
+            self._remove_path(filename)
+
+            if stat.st_size <= self.max_bytes:
+                self.entries[key] = value
+                self.paths[filename] = key
+                self.current_bytes += stat.st_size
+                self._evict()
+
+        return value
+
+    def _remove_path(self, filename):
+        # drop the entry for a previous version of the file
+        key = self.paths.pop(filename, None)
+
+        if key is not None:
+            del self.entries[key]
+            self.current_bytes -= key[2]
+
+    def _evict(self):
+        while self.current_bytes > self.max_bytes:
+            key, value = self.entries.popitem(last=False)
+            del self.paths[key[0]]
+            self.current_bytes -= key[2]
+            self.evictions += 1
+
+    def stats(self):
+        """
+        Returns counters for monitoring the cache
+        """
+        with self.lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'failures': self.failures,
+                'evictions': self.evictions,
+                'entries': len(self.entries),
+                'bytes': self.current_bytes,
+                'max_bytes': self.max_bytes,
+            }
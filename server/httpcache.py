@@ -0,0 +1,173 @@
+import gzip
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from functools import wraps
+
+from flask import request, Response
+from werkzeug.http import http_date
+
+import numpyjson
+
+######################################
+## Package variables
+######################################
+
+# Responses larger than this are gzipped for clients that accept it
+GZIP_MIN_BYTES = 1024
+
+# At most this many responses are kept, the least recently used are dropped.
+# Each query string is cached separately, so this bounds the memory used.
+MAX_RESPONSES = 256
+
+######################################
+## Cached responses
+######################################
+
+
+class CachedResponse:
+    def __init__(self, etag, body):
+        self.etag = etag
+        self.body = body
+        self.gzipped = None
+        self.last_modified = time.time()
+
+    def gzip_body(self):
+        if self.gzipped is None:
+            self.gzipped = gzip.compress(self.body, compresslevel=6)
+
+        return self.gzipped
+
+
+# Last response of each cached view, by request path and query string, in
+# order of use
+responses = OrderedDict()
+responses_lock = threading.Lock()
+
+# Counters for monitoring, updated under responses_lock
+stats = {'not_modified': 0, 'hits': 0, 'misses': 0}
+
+
+def lookup(key):
+    with responses_lock:
+        cached = responses.get(key)
+
+        if cached is not None:
+            responses.move_to_end(key)
+
+        return cached
+
+
+def store(key, cached):
+    with responses_lock:
+        responses[key] = cached
+        responses.move_to_end(key)
+
+        while len(responses) > MAX_RESPONSES:
+            responses.popitem(last=False)
+
+
+def count(name):
+    with responses_lock:
+        stats[name] += 1
+
+
+def current_stats():
+    with responses_lock:
+        return dict(stats)
+
+
+def make_etag(key, version):
+    digest = hashlib.sha1('{key}:{version}'.format(key=key, version=version).encode('utf8'))
+    return digest.hexdigest()
+
+
+def not_modified(cached):
+    """
+    Returns True if the client already holds the cached response
+    """
+    if request.if_none_match:
+        return cached.etag in request.if_none_match
+
+    if request.if_modified_since is not None:
+        return int(cached.last_modified) <= request.if_modified_since.timestamp()
+
+    return False
+
+
+def build_response(cached, status=200):
+    if status == 304:
+        response = Response(status=304)
+    elif 'gzip' in request.accept_encodings and len(cached.body) >= GZIP_MIN_BYTES:
+        response = Response(cached.gzip_body(), mimetype='application/json')
+        response.headers['Content-Encoding'] = 'gzip'
+    else:
+        response = Response(cached.body, mimetype='application/json')
+
+    response.set_etag(cached.etag)
+    response.headers['Last-Modified'] = http_date(cached.last_modified)
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['Vary'] = 'Accept-Encoding'
+
+    return response
+
+
+def cached_json(version):
+    """
+    Decorator for views returning JSON (as a string or a dict). `version()`
+    returns a value which changes whenever the response may have changed, or
+    None if it can't tell (in which case the view is always run).
+
+    While the version is unchanged, the response is not recomputed: clients
+    sending a matching If-None-Match (or If-Modified-Since) receive
+    304 Not Modified, and others receive the stored response.
+    """
+
+    def decorator(view):
+
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            current = version()
+            key = request.full_path
+
+            cached = None
+
+            if current is not None:
+                etag = make_etag(key, current)
+
+                cached = lookup(key)
+
+                if cached is not None and cached.etag != etag:
+                    cached = None
+
+            if cached is not None:
+                if not_modified(cached):
+                    count('not_modified')
+                    return build_response(cached, status=304)
+
+                count('hits')
+                return build_response(cached)
+
+            count('misses')
+
+            body = view(*args, **kwargs)
+
+            if not isinstance(body, (str, bytes)):
+                body = numpyjson.dumps(body)
+
+            if isinstance(body, str):
+                body = body.encode('utf8')
+
+            if current is None:
+                return Response(body, mimetype='application/json')
+
+            cached = CachedResponse(etag, body)
+
+            store(key, cached)
+
+            return build_response(cached)
+
+        return wrapper
+
+    return decorator
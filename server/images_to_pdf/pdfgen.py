@@ -23,7 +23,7 @@ def convert_to_reportlab(im):
 
         return ImageReader(im_data)
 
-    elif type(im) == np.ndarray:
+    elif isinstance(im, np.ndarray):
         im = Image.fromarray(im[:, :, ::-1])
         return convert_to_reportlab(im)
 
@@ -0,0 +1,145 @@
+import os
+import json
+import bisect
+import threading
+
+import utils
+
+
+class Leaderboard:
+    """
+    The `size` lowest drag simulations, kept as a list of (drag, id) sorted by
+    drag (ties are ordered by ID). The list is kept in memory and persisted to
+    `path` as JSON.
+
+    The file is shared between processes (e.g. the server and the archiver).
+    Updates are made under a file lock, and readers reload the file if it has
+    changed.
+
+    Only the top `size` are kept, so when a simulation leaves them (its drag
+    was raised, or it was removed) the list is refilled from
+    `source(limit)`, which returns the lowest (drag, id) pairs of all
+    simulations, lowest first.
+    """
+
+    def __init__(self, path, size, source=None):
+        self.path = path
+        self.size = size
+        self.source = source
+        self.entries = []
+        self.drags = {}
+        self.stamp = None
+        self.lock = threading.Lock()
+
+    def exists(self):
+        return os.path.isfile(self.path)
+
+    def _file_stamp(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+
+        return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+    def _reload(self):
+        stamp = self._file_stamp()
+
+        if stamp is None or stamp == self.stamp:
+            return
+
+        with open(self.path) as f:
+            entries = [(float(drag), int(sim_id)) for drag, sim_id in json.load(f)]
+
+        self.entries = entries
+        self.drags = {sim_id: drag for drag, sim_id in entries}
+        self.stamp = stamp
+
+    def _save(self):
+        utils.atomic_write(self.path, json.dumps(self.entries))
+        self.stamp = self._file_stamp()
+
+    def lowest(self, num_sims=10):
+        """
+        Returns the IDs of the `num_sims` lowest drag simulations, lowest first
+        """
+        with self.lock:
+            self._reload()
+            return [sim_id for drag, sim_id in self.entries[:num_sims]]
+
+    def insert(self, sim_id, drag):
+        """
+        Records the drag of a simulation, replacing any previous value
+        """
+        entry = (float(drag), int(sim_id))
+
+        with self.lock, utils.file_lock(self.path + '.lock'):
+            self._reload()
+
+            removed = self._remove(entry[1])
+
+            position = bisect.bisect_left(self.entries, entry)
+
+            # a raised drag after all the others may now be behind simulations
+            # which aren't in the list
+            if removed and position >= len(self.entries) and self.source is not None:
+                self._refill()
+                self._save()
+                return
+
+            if position >= self.size:
+                if removed:
+                    self._save()
+                return
+
+            self.entries.insert(position, entry)
+            self.drags[entry[1]] = entry[0]
+
+            if len(self.entries) > self.size:
+                dropped = self.entries.pop()
+                del self.drags[dropped[1]]
+
+            self._save()
+
+    def remove(self, sim_id):
+        """
+        Removes a simulation, e.g. one deleted from the store
+        """
+        with self.lock, utils.file_lock(self.path + '.lock'):
+            self._reload()
+
+            if self._remove(int(sim_id)):
+                self._refill()
+                self._save()
+
+    def _refill(self):
+        # the next lowest drags are only known to the source
+        if self.source is None or len(self.entries) >= self.size:
+            return
+
+        self.entries = sorted((float(drag), int(sim_id))
+                              for drag, sim_id in self.source(self.size))[:self.size]
+        self.drags = {sim_id: drag for drag, sim_id in self.entries}
+
+    def _remove(self, sim_id):
+        if sim_id not in self.drags:
+            return False
+
+        position = bisect.bisect_left(self.entries, (self.drags[sim_id], sim_id))
+
+        del self.entries[position]
+        del self.drags[sim_id]
+
+        return True
+
+    def rebuild(self, drag_ids):
+        """
+        Replaces the leaderboard with the lowest of the (drag, id) pairs in `drag_ids`
+        """
+        with self.lock, utils.file_lock(self.path + '.lock'):
+            entries = sorted((float(drag), int(sim_id)) for drag, sim_id in drag_ids)
+
+            self.entries = entries[:self.size]
+            self.drags = {sim_id: drag for drag, sim_id in self.entries}
+
+            self._save()
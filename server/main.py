@@ -6,22 +6,30 @@ import calendar
 import os
 import json
 import matplotlib.pyplot as plt
-import subprocess
 
 import settings
 import model
 import utils
 
-from flask import Flask, request, render_template, send_from_directory
+from flask import Flask, request, render_template, Response, abort
 from flask_cors import CORS
 
-from werkzeug.serving import run_simple
+from werkzeug.serving import run_simple, is_running_from_reloader
 from werkzeug.datastructures import FileStorage
+from werkzeug.security import safe_join
 
 from flask_webpack import Webpack
 webpack = Webpack()
 
 import transfer_data
+import assets
+import httpcache
+import events
+import numpyjson
+import uploads
+import monitoring
+from telemetry import TelemetryCollector
+from timeseries import TimeSeriesStore
 
 
 def create_app():
@@ -47,11 +55,32 @@ app = create_app()
 # Enable cross-site scripting
 CORS(app)
 
+# Time the requests, see /metrics
+monitoring.init_app(app)
+
 
 # Static routes for simulation data
 @app.route('/simulations/<path:filename>')
 def custom_static(filename):
-    return send_from_directory('simulations', filename)
+    """
+    Serves the files of simulations, with ETags and ranges. Requested with
+    their current version (see assets.asset_urls), they are cached for good.
+    """
+    path = safe_join(model.simulation_store_directory(), filename)
+
+    if path is not None and os.path.isfile(path):
+        return assets.file_response(path)
+
+    # files of archived simulations are served from their bundle
+    sim_id, _, member = filename.partition('/')
+
+    if sim_id.isdigit() and member:
+        response = assets.archived_response(sim_id, member)
+
+        if response is not None:
+            return response
+
+    abort(404)
 
 
 # Root route (dashboard)
@@ -87,66 +116,264 @@ def start_simulation():
 
     sim_id = model.queue_simulation(simulation)
 
-    return {'id': str(sim_id)}
+    if model.submission_worker is not None:
+        state = model.SIM_SUBMITTING
+    else:
+        state = model.SIM_CREATED
+
+    return numpyjson.response({'id': str(sim_id), 'state': state})
+
+
+def upload_filepath(sim_id, filename):
+    # only plain files in the run directory of a simulation can be uploaded
+    if not sim_id.isdigit():
+        return None
+
+    if filename != os.path.basename(filename) or filename.startswith('.'):
+        return None
+
+    return model.sim_filepath(sim_id, filename)
+
+
+def upload_complete(sim_id, filename):
+    if filename == 'all_data.pickle':
+        model.split_detail_pickle(sim_id)
 
 
 @app.route('/upload/<sim_id>/<filename>', methods=['POST'])
 def simulation_handle_upload(sim_id, filename):
-    filepath = model.sim_filepath(sim_id, filename)
+    """
+    Uploads a whole file in the request body. See upload_chunk for uploads
+    which can be resumed.
+    """
+    filepath = upload_filepath(sim_id, filename)
+
+    if filepath is None:
+        return 'invalid simulation ID or filename', 400
+
+    # write to a temporary file, so that a dropped upload leaves no partial file
+    filepath_tmp = filepath + 'tmp'
 
-    FileStorage(request.stream).save(filepath)
+    FileStorage(request.stream).save(filepath_tmp)
+
+    size = os.path.getsize(filepath_tmp)
+
+    if request.content_length is not None and size != request.content_length:
+        os.remove(filepath_tmp)
+        return 'incomplete upload', 400
+
+    os.rename(filepath_tmp, filepath)
+
+    upload_complete(sim_id, filename)
 
     return 'OK', 200
 
 
+def resumable_upload(sim_id, filename):
+    filepath = upload_filepath(sim_id, filename)
+
+    if filepath is None:
+        return None
+
+    return uploads.ResumableUpload(filepath,
+                                   lambda: upload_complete(sim_id, filename))
+
+
+@app.route('/upload/<sim_id>/<filename>/status', methods=['GET'])
+def upload_status(sim_id, filename):
+    """
+    Returns {"offset", "size", "complete"} for an upload of ?size= bytes. A
+    resumed upload continues with the chunk at "offset".
+    """
+    upload = resumable_upload(sim_id, filename)
+
+    if upload is None:
+        return numpyjson.response({'error': 'invalid simulation ID or filename'}, status=400)
+
+    size = request.args.get('size', type=int)
+
+    return numpyjson.response(upload.status(size))
+
+
+@app.route('/upload/<sim_id>/<filename>', methods=['PUT'])
+def upload_chunk(sim_id, filename):
+    """
+    Uploads the chunk of a file at ?offset= of a file of ?size= bytes, with
+    its SHA-256 checksum (hex) in the X-Chunk-SHA256 header. Chunks must be
+    sent in order. Returns the status of the upload (see upload_status), with
+    409 if the offset isn't the one expected and 400 if the chunk is corrupt.
+    """
+    upload = resumable_upload(sim_id, filename)
+
+    offset = request.args.get('offset', type=int)
+    size = request.args.get('size', type=int)
+    checksum = request.headers.get('X-Chunk-SHA256')
+
+    if upload is None or offset is None or size is None or checksum is None:
+        return numpyjson.response(
+            {'error': 'simulation ID, filename, offset, size and checksum are required'},
+            status=400)
+
+    if request.content_length is None or \
+            request.content_length > settings.upload_max_chunk:
+        return numpyjson.response(
+            {
+                'error': 'chunks are limited to {size} bytes'.format(
+                    size=settings.upload_max_chunk)
+            },
+            status=413)
+
+    data = request.get_data(cache=False)
+
+    try:
+        status = upload.write_chunk(offset, size, data, checksum.lower())
+    except uploads.UploadError as e:
+        return numpyjson.response(dict(e.status, error=str(e)), status=e.code)
+
+    return numpyjson.response(status)
+
+
+# Keys of each simulation listed by /simulations, unless given by ?fields=
+summary_keys = [
+    'id', 'name', 'email', 'drag', 'avatar_id', 'images-available', 'progress',
+    'assets'
+]
+
+
 @app.route('/simulations', methods=['GET'])
 def all_simulations():
-    simulations = model.all_simulations()
+    """
+    Lists simulations, highest ID first, a page at a time. Query arguments:
+
+        status  comma-separated statuses to include, e.g. started,finished
+        before  cursor, only simulations with lower IDs are included
+        limit   number of simulations in the page
+        fields  comma-separated keys of each simulation, or * for all
+        arrays  "base64" to encode numpy arrays in binary (see numpyjson)
+
+    The response is {"simulations": [...], "next": cursor} where cursor is the
+    `before` argument for the next page, or null on the last page. It is
+    streamed as the simulations are loaded.
+    """
+    try:
+        limit = int(request.args.get('limit', settings.simulations_page_size))
+        before = request.args.get('before')
+        before = int(before) if before else None
+    except ValueError:
+        return numpyjson.response({'error': 'limit and before must be integers'},
+                                  status=400)
+
+    if limit < 1:
+        return numpyjson.response({'error': 'limit must be positive'}, status=400)
+
+    limit = min(limit, settings.simulations_page_max)
+
+    statuses = request.args.get('status')
+    statuses = statuses.split(',') if statuses else None
+
+    fields = request.args.get('fields')
+
+    if fields == '*':
+        keys = None
+    else:
+        keys = fields.split(',') if fields else summary_keys
+
+    # one more than the page, to know if there is a next page
+    ids = model.simulation_id_page(statuses, before, limit + 1)
+
+    next_cursor = ids[limit - 1] if len(ids) > limit else None
+    ids = ids[:limit]
+
+    # the progress is only read if needed
+    progress = keys is None or 'progress' in keys
 
-    return simulations
+    binary = binary_arrays()
+
+    def generate():
+        yield '{"simulations": ['
+
+        separator = ''
+
+        for sim_id in ids:
+            sim = model.get_simulation(sim_id, progress=progress)
+
+            if sim is None:
+                continue
+
+            item = filter_sim(sim, keys)
+
+            yield separator
+            yield from numpyjson.iterencode(item, binary)
+            separator = ','
+
+        yield '],"next":{cursor}}}'.format(cursor=numpyjson.dumps(next_cursor))
+
+    return Response(numpyjson.chunked(generate()), mimetype='application/json')
+
+
+def binary_arrays():
+    """
+    Returns True if the request asks for numpy arrays in binary (?arrays=base64)
+    """
+    return request.args.get('arrays') == 'base64'
 
 
 @app.route('/simulation/<id>', methods=['GET'])
 def get_simulation(id):
     sim = model.get_simulation(id)
-    return sim
 
+    if sim is None:
+        return numpyjson.response(None, status=404)
 
-def make_item_serialisable(item):
-    if type(item) == np.ndarray:
-        return item.tolist()
-    else:
-        return item
+    return numpyjson.streamed_response(sim, binary=binary_arrays())
 
 
-def jsonify(sims, keys=[]):
+def filter_sim(sim, keys=None):
+    """
+    Returns simulation `sim` with only the entries given by `keys` (all if
+    None). The "assets" entry holds the versioned URLs of its files.
+    """
+    filtered = {k: v for k, v in sim.items() if keys is None or k in keys}
 
-    serialisable = [{
-        k: make_item_serialisable(v)
-        for k, v in sim.items() if k in keys
-    } for sim in sims]
+    if keys is None or 'assets' in keys:
+        filtered['assets'] = assets.asset_urls(sim['id'],
+                                               model.run_directory(sim['id']))
 
-    return json.dumps(serialisable)
+    return filtered
 
 
-@app.route('/simulations/min_drag/<nsims>', methods=['GET'])
-def min_drag_simulations(nsims):
+def filter_sim_keys(sims, keys=[]):
+    return [filter_sim(sim, keys) for sim in sims]
 
-    simulations = model.lowest_drag_simulations_sorted(int(nsims))
 
-    keys = ['name', 'email', 'id', 'drag', 'images-available', 'avatar_id']
+# Keys of the simulations in the leaderboard and recent lists
+list_keys = [
+    'name', 'email', 'id', 'drag', 'images-available', 'avatar_id', 'assets'
+]
 
-    return jsonify(simulations, keys)
 
+def min_drag_list(nsims):
+    simulations = model.lowest_drag_simulations_sorted(nsims)
 
-@app.route('/simulations/recent/<nsims>', methods=['GET'])
-def most_recent_simulations(nsims=10):
+    return filter_sim_keys(simulations, list_keys)
+
+
+def recent_list(nsims):
+    simulations = model.recently_finished_simulations(nsims)
+
+    return filter_sim_keys(simulations, list_keys)
 
-    simulations = model.recently_finished_simulations(int(nsims))
 
-    keys = ['name', 'email', 'id', 'drag', 'images-available', 'avatar_id']
+@app.route('/simulations/min_drag/<nsims>', methods=['GET'])
+@httpcache.cached_json(model.store_version)
+def min_drag_simulations(nsims):
+    return numpyjson.dumps(min_drag_list(int(nsims)))
+
 
-    return jsonify(simulations, keys)
+@app.route('/simulations/recent/<nsims>', methods=['GET'])
+@httpcache.cached_json(model.store_version)
+def most_recent_simulations(nsims=10):
+    return numpyjson.dumps(recent_list(int(nsims)))
 
 
 def sims_filtered_keys(ids, keys):
@@ -158,75 +385,98 @@ def sims_filtered_keys(ids, keys):
 
     sims = [sim for sim in sims if sim is not None]
 
-    filtered = [{key: val
-                 for key, val in sim.items() if key in keys} for sim in sims]
+    return filter_sim_keys(sims, keys)
 
-    return filtered
 
+# Nodes of the cluster, in the order of settings.IPs
+cluster_nodes = [node for row in settings.IPs for node in row]
 
-def string_to_rounded_int(str):
-    return int(round(float(str)))
+# Time series of the cluster metrics, see get_metrics
+metrics = None
 
 
-def read_usage():
+def get_metrics():
+    global metrics
+
+    directory = settings.metrics_dir.format(root_dir=settings.root_dir)
+
+    if metrics is None or metrics.directory != directory:
+        metrics = TimeSeriesStore(directory, cluster_nodes, settings.metrics_retention)
+
+    return metrics
+
+
+def record_metrics(sample_time, usage):
     """
-    Read the usage information from ~/cluster-load/info. Information is expected to
-    be updated through another process.
-    The function creates ~/cluster-load/info if it doesn't exists.
+    Stores a telemetry sample, with the simulation running on each node
     """
+    running = model.running_simulations()
 
-    # Because the file transfer might change files as they're being read, this could fail
-    # Retry until success or num_retries
+    jobs = {}
 
-    num_retries = 10
+    for sim_id in running:
+        sim = model.get_simulation(sim_id, progress=False)
 
-    info_path = os.path.expanduser('~/cluster-load/info/')
-    utils.ensure_exists(info_path)
+        if sim is not None:
+            for node in sim.get('nodes', []):
+                jobs[node] = sim_id
 
-    for retries in range(num_retries):
-        try:
-            cmd = 'cat {path}* 2>/dev/null'.format(path=info_path)
-            output_lines = subprocess.check_output(
-                cmd, shell=True).decode('utf8').split('\n')
+    get_metrics().add(sample_time, usage, jobs, len(running),
+                      len(model.queued_simulations()))
 
-            num_tries = retries + 1
 
-            if num_tries > 1:
-                print('warning: cpu usage reading attempt success at try {x}'.
-                      format(x=num_tries))
-            break
+# Load of the cluster nodes, see settings.usage_info_dir
+telemetry = TelemetryCollector(os.path.expanduser(settings.usage_info_dir),
+                               cluster_nodes,
+                               interval=settings.telemetry_interval,
+                               history_size=settings.telemetry_history_size,
+                               max_temp=settings.pi_max_temp,
+                               on_sample=record_metrics,
+                               stale_after=settings.telemetry_stale_after)
 
-        except subprocess.CalledProcessError as e:
-            if (retries == num_retries - 1):
-                raise (e)
-            else:
-                continue
 
-    line_parts = [
-        line.split() for line in output_lines if line[:7] == '10.0.0.'
-    ]
+@monitoring.timed('read_usage')
+def read_usage():
+    """
+    Returns the current cpu usage and temperature (in percent) of each node.
+    The values are sampled by the telemetry thread, or read from the usage
+    files directly if it isn't running.
+    """
+    if not telemetry.running():
+        telemetry.sample()
 
-    cpu_usage = {
-        line[0]: string_to_rounded_int(line[1])
-        for line in line_parts
-    }
+    return telemetry.current()
 
-    temp = {
-        line[0]: int(float(line[2]) * 100 / settings.pi_max_temp)
-        for line in line_parts
-    }
 
-    return cpu_usage, temp
+def activity_version():
+    store = model.store_version()
 
+    if store is None or not telemetry.running():
+        return None
 
-@app.route('/cluster/activity', methods=['GET'])
-def get_activity():
+    running = model.running_simulations()
+
+    return (store, telemetry.version, model.progress_version(running))
+
+
+def activity_request_version():
+    version = activity_version()
+
+    # the history changes with every sample
+    if version is not None and request.args.get('history'):
+        version += (telemetry.samples, )
 
-    # Added safety layer to ensure that cpuinfo.txt isn't written to whilst being read
-    # Note that this could still fail if activity called again before the request completes
+    return version
+
+
+def activity():
+    """
+    Returns the cluster usage and the pending and running simulations
+    """
 
     filter_keys = [
-        'id', 'name', 'avatar_id', 'nodes', 'images-available', 'progress'
+        'id', 'name', 'avatar_id', 'nodes', 'images-available', 'progress',
+        'assets'
     ]
 
     pending = sims_filtered_keys(model.queued_simulations(), filter_keys)
@@ -234,35 +484,178 @@ def get_activity():
 
     cpu_usage, temp = read_usage()
 
-    response = {
-        'time': time.time(),
+    return {
         'cpu_usage': cpu_usage,
         'temp_percent': temp,
         'pending': pending,
         'running': running
     }
 
+
+@app.route('/cluster/activity', methods=['GET'])
+@httpcache.cached_json(activity_request_version)
+def get_activity():
+    """
+    Returns the activity (see `activity`). With ?history=<n>, the cpu usage
+    and temperature of each node over the last samples are added, as at most
+    n points.
+    """
+    response = activity()
+    response['time'] = time.time()
+
+    points = request.args.get('history', type=int)
+
+    if points:
+        response['history'] = telemetry.history(points)
+
     return response
 
+
+@app.route('/cluster/history', methods=['GET'])
+def get_history():
+    """
+    Returns the metrics of the cluster from ?from= to ?to= (Unix times, the
+    last hour by default), with one point every ?step= seconds: the mean cpu
+    usage (percent) and temperature (degrees) of each node, the simulation
+    running on each node (0 if none), and the mean numbers of running and
+    pending simulations. Unknown values are null.
+    """
+    end = request.args.get('to', time.time(), type=float)
+    start = request.args.get('from', end - 3600, type=float)
+
+    if end <= start:
+        return numpyjson.response({'error': 'from must be before to'}, status=400)
+
+    # the default and smallest steps keep the number of points bounded
+    step = request.args.get('step', (end - start) / 360, type=float)
+    step = max(step, (end - start) / settings.metrics_max_points, 1)
+
+    store = get_metrics()
+    result = store.query(start, end, step)
+
+    def by_node(values):
+        return {node: values[:, i] for i, node in enumerate(store.nodes)}
+
+    return numpyjson.response({
+        'from': start,
+        'to': end,
+        'step': step,
+        'resolution': store.resolution(step),
+        'time': result['time'],
+        'cpu_usage': by_node(np.round(result['cpu'].astype(float), 1)),
+        'temp': by_node(np.round(result['temp'].astype(float), 1)),
+        'jobs': by_node(result['job']),
+        'running': np.round(result['running'].astype(float), 2),
+        'pending': np.round(result['pending'].astype(float), 2),
+    })
+
+
+# Server-sent events, produced once for all subscribed dashboards
+event_stream = events.EventStream(settings.events_interval)
+
+event_stream.add_channel('activity', activity, activity_version)
+event_stream.add_channel('min_drag', lambda: min_drag_list(settings.events_list_size),
+                         model.store_version)
+event_stream.add_channel('recent', lambda: recent_list(settings.events_list_size),
+                         model.store_version)
+
+
+@app.route('/events', methods=['GET'])
+def get_events():
+    """
+    Streams the channels given by ?channels=a,b (all by default). The first
+    event of each channel holds its full state, and the following ones only
+    what changed (the changed keys of "activity", the whole list otherwise).
+    """
+    channels = request.args.get('channels', 'activity,min_drag,recent')
+
+    messages = event_stream.subscribe(channels.split(','))
+
+    return Response(messages,
+                    mimetype='text/event-stream',
+                    headers={
+                        'Cache-Control': 'no-cache',
+                        'X-Accel-Buffering': 'no'
+                    })
+
+
+@app.route('/cache/stats', methods=['GET'])
+def get_cache_stats():
+    return numpyjson.response({
+        'pickle': model.pickle_cache.stats(),
+        'http': httpcache.current_stats()
+    })
+
+
+def cache_metrics():
+    """
+    Returns the counters of the caches for /metrics, with their hit ratios
+    """
+    pickle_stats = model.pickle_cache.stats()
+    http_stats = httpcache.current_stats()
+
+    samples = [
+        ('server_cache_requests_total', {'cache': 'pickle', 'result': 'hit'}, pickle_stats['hits']),
+        ('server_cache_requests_total', {'cache': 'pickle', 'result': 'miss'}, pickle_stats['misses']),
+        ('server_cache_requests_total', {'cache': 'http', 'result': 'hit'},
+         http_stats['hits'] + http_stats['not_modified']),
+        ('server_cache_requests_total', {'cache': 'http', 'result': 'miss'}, http_stats['misses']),
+        ('server_cache_not_modified_total', {'cache': 'http'}, http_stats['not_modified']),
+        ('server_cache_failures_total', {'cache': 'pickle'}, pickle_stats['failures']),
+        ('server_cache_evictions_total', {'cache': 'pickle'}, pickle_stats['evictions']),
+        ('server_cache_bytes', {'cache': 'pickle'}, pickle_stats['bytes']),
+        ('server_cache_entries', {'cache': 'pickle'}, pickle_stats['entries']),
+    ]
+
+    for cache, hits, misses in [
+        ('pickle', pickle_stats['hits'], pickle_stats['misses']),
+        ('http', http_stats['hits'] + http_stats['not_modified'], http_stats['misses']),
+    ]:
+        if hits + misses > 0:
+            samples.append(('server_cache_hit_ratio', {'cache': cache}, hits / (hits + misses)))
+
+    return samples
+
+
+monitoring.describe('server_cache_requests_total', 'counter', 'Cache lookups by result')
+monitoring.describe('server_cache_not_modified_total', 'counter',
+                    'Cached responses answered with 304 Not Modified')
+monitoring.describe('server_cache_failures_total', 'counter', 'Files which failed to load')
+monitoring.describe('server_cache_evictions_total', 'counter', 'Entries evicted for space')
+monitoring.describe('server_cache_bytes', 'gauge', 'Size of the cached files')
+monitoring.describe('server_cache_entries', 'gauge', 'Number of cached files')
+monitoring.describe('server_cache_hit_ratio', 'gauge', 'Hits over lookups since the start')
+monitoring.add_collector(cache_metrics)
+
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics_text():
+    """
+    Returns the request latencies, the time spent in the slow functions of
+    the model and the cache counters, in the Prometheus text format
+    """
+    return Response(monitoring.render(), content_type=monitoring.CONTENT_TYPE)
+
+
 @app.route('/print_queue/', methods=['GET'])
 def get_all_print_job():
     ids = model.find_to_print()
 
-    return {'jobs': ids}
+    return numpyjson.response({'jobs': ids})
 
 
 @app.route('/print_queue/next', methods=['GET'])
 def get_print_job():
     sim_id = model.next_to_print()
 
-    return {'id': sim_id}
+    return numpyjson.response({'id': sim_id})
 
 
 @app.route('/print_queue/done/<sim_id>', methods=['POST'])
 def finished_print_job(sim_id):
     model.mark_as_printed(sim_id)
 
-    return { 'updated' : sim_id }
+    return numpyjson.response({'updated': sim_id})
 
 
 def run_filepath(index, filename):
@@ -272,9 +665,20 @@ def run_filepath(index, filename):
 
 
 if __name__ == '__main__':
+    use_reloader = True
+
+    # With the reloader this block also runs in the process watching the
+    # files, which doesn't serve requests. The background services are only
+    # started in the serving process, so they don't run twice.
+    if not use_reloader or is_running_from_reloader():
+        model.init_store()
+        model.start_registry()
+        model.start_submission_worker()
+        telemetry.start()
+
     run_simple(hostname='0.0.0.0',
                port=settings.port,
                application=app,
-               use_reloader=True,
+               use_reloader=use_reloader,
                use_debugger=True,
                threaded=True)
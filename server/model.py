@@ -6,10 +6,29 @@ import settings
 import os
 import subprocess
 import pickle
+import shutil
+import tempfile
+import json
+import hashlib
 from PIL import Image
 import glob
-import random
-from repoze.lru import lru_cache
+import time
+import threading
+import itertools
+import traceback
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import catalog
+import monitoring
+from progress import ProgressTracker
+from leaderboard import Leaderboard
+from registry import SimulationRegistry
+from submission import SubmissionWorker
+from resultcache import ResultCache
+from filecache import FileCache
+from avatars import AvatarPool
+from printqueue import PrintQueue
 
 from jinja2 import Template
 
@@ -24,6 +43,52 @@ STATUS_STARTED = 'status.started'
 STATUS_FINISHED = 'status.finished'
 STATUS_TOPRINT = 'status.toprint'
 
+# Written by the server while a simulation waits for submission, and when it
+# failed, so that the catalog can be rebuilt from the flag files
+STATUS_SUBMITTING = 'status.submitting'
+STATUS_FAILED = 'status.failed'
+
+# Status values recorded for each simulation in the catalog
+SIM_CREATED = 'created'
+SIM_STARTED = 'started'
+SIM_FINISHED = 'finished'
+
+# Not yet submitted to the queue manager, or failed to be submitted
+SIM_SUBMITTING = 'submitting'
+SIM_FAILED = 'failed'
+
+# Finished simulations without a drag value are rechecked for a drag file for
+# this many seconds (drag is computed after the finished flag is written)
+DRAG_GRACE_PERIOD = 3600
+
+# Output files already parsed for progress, see get_progress
+progress_tracker = ProgressTracker()
+
+# Lowest drag simulations, see get_leaderboard
+leaderboard = None
+
+# In-memory registry of simulations, see start_registry
+registry = None
+
+# Background submission to the queue manager, see start_submission_worker
+submission_worker = None
+
+# Schedulers which run the simulations by name, see get_scheduler
+schedulers = {}
+
+# Avatars assigned to visible simulations, see get_avatar_pool
+avatar_pool = None
+
+# Simulations waiting to be printed, see get_print_queue
+print_queue = None
+
+# Results of previous runs by outline, see get_result_cache
+result_cache = None
+
+# Held whilst allocating simulation IDs (the file lock only excludes other
+# processes)
+sim_id_lock = threading.Lock()
+
 # Read batch template file if exists
 template_file = 'templates/slurm.batch'
 if os.path.isfile(template_file):
@@ -84,10 +149,17 @@ def set_started(sim_id, job_id):
     with open(sim_filepath(sim_id, STATUS_STARTED), 'w') as f:
         f.write(job_id)
 
+    catalog.update(sim_id,
+                   status=SIM_STARTED,
+                   started_at=time.time(),
+                   nodes=get_nodes(sim_id))
+
 
 def set_finished(sim_id):
     touch_file(sim_id, STATUS_FINISHED)
 
+    catalog.update(sim_id, status=SIM_FINISHED, finished_at=time.time())
+
 
 ######################################
 ## Pickle and save/load utils
@@ -110,16 +182,23 @@ def pickle_save(filename, data):
     return data
 
 
-@lru_cache(maxsize=20)
+@monitoring.timed('pickle_read')
+def pickle_read(filename):
+    with open(filename, 'rb') as f:
+        return pickle.load(f)
+
+
+# Cache of loaded pickles, validated against the file mtime and size
+pickle_cache = FileCache(pickle_read, settings.pickle_cache_bytes)
+
+
 def pickle_load(filename):
     """
-    Loads objects from a pickle file with cache. Note, care should be taken not to
-    attempt to cause invalid cache entries. The datastore is treated as immutable.
+    Loads objects from a pickle file with cache. Returns None if the file can't
+    be unpickled (e.g. it is half-written). The returned object is shared, so
+    it must not be modified.
     """
-    with open(filename, 'rb') as f:
-        sim = pickle.load(f)
-
-    return sim
+    return pickle_cache.load(filename)
 
 
 def save_data_as_image(data, filename):
@@ -138,27 +217,65 @@ def save_data_as_image(data, filename):
 ######################################
 
 
-def choose_avatar():
-    return int(random.random() * 25) + 1
+def sim_id_counter_file():
+    return '{sim_store}/next_id'.format(sim_store=simulation_store_directory())
 
 
 def generate_sim_id():
-    current_ids = simulation_id_list()
+    """
+    Allocates a new simulation ID and reserves its run directory. The next ID
+    is kept in a counter file, and the run directory is created exclusively,
+    so that concurrent requests (from several threads or server processes)
+    never receive the same ID.
+    """
+    sim_store = simulation_store_directory()
+    counter_file = sim_id_counter_file()
 
-    if len(current_ids) == 0:
-        next_id = 1
-    else:
-        next_id = int(np.max(current_ids) + 1)
+    with sim_id_lock, utils.file_lock(counter_file + '.lock'):
+        try:
+            with open(counter_file) as f:
+                next_id = int(f.read())
+        except (FileNotFoundError, ValueError):
+            # first allocation: continue from the highest existing ID
+            current_ids = [
+                int(name) for name in os.listdir(sim_store) if name.isdigit()
+            ]
+            next_id = max(current_ids, default=0) + 1
+
+        # skip over any directories created outside the allocator
+        while True:
+            try:
+                os.mkdir('{sim_store}/{index}'.format(sim_store=sim_store,
+                                                      index=next_id))
+                break
+            except FileExistsError:
+                next_id += 1
+
+        utils.atomic_write(counter_file, str(next_id + 1))
 
     return next_id
 
 
 def simulation_id_list():
-    sim_store = simulation_store_directory()
-    return [
-        clean_sim_id(os.path.basename(i))
-        for i in glob.glob('{sim_store}/[0-9]*'.format(sim_store=sim_store))
-    ]
+    if registry is not None:
+        return registry.ids()
+
+    sync_catalog()
+
+    return catalog.ids()
+
+
+def simulation_id_page(statuses=None, before=None, limit=None):
+    """
+    Returns IDs of simulations, highest first, optionally restricted to a list
+    of `statuses`, to IDs below `before` and to `limit` items
+    """
+    if registry is not None:
+        return registry.ids(statuses, limit=limit, before=before)
+
+    sync_catalog()
+
+    return catalog.ids(statuses, limit=limit, before=before)
 
 
 def is_sim_running(sim_id):
@@ -191,14 +308,14 @@ def get_drag(sim_id):
         return None
 
 
+@monitoring.timed('all_drags')
 def all_drags():
-    ids = np.array(simulation_id_list())
-    drags = np.array([get_drag(i) for i in ids])
+    sync_catalog()
 
-    notNone = [i for i in range(len(drags)) if drags[i] is not None]
+    drag_ids = catalog.drags()
 
-    ids = ids[notNone].astype(np.int32)
-    drags = drags[notNone].astype(np.int32)
+    drags = np.array([drag for drag, sim_id in drag_ids], dtype=float)
+    ids = np.array([sim_id for drag, sim_id in drag_ids], dtype=np.int32)
 
     return (drags, ids)
 
@@ -208,6 +325,11 @@ def sims_by_id(ids):
 
 
 def set_drag(sim_id, drag):
+    """
+    Writes the drag of a simulation. This runs in the batch job, on the compute
+    nodes, so the catalog and leaderboard (which must not be written over NFS)
+    are updated by the server when it syncs, see sync_catalog.
+    """
     filename = drag_file(sim_id)
 
     with open(filename, 'w') as file:
@@ -245,10 +367,265 @@ def get_nodes(sim_id):
     return ips
 
 
+######################################
+## Catalog
+######################################
+
+
+def catalog_entry_from_store(sim_id):
+    """
+    Builds a catalog entry for `sim_id` from the flag files in its run
+    directory. Returns None if the simulation has not been created.
+    """
+
+    def flag_time(flag):
+        filepath = sim_filepath(sim_id, flag)
+        return os.path.getmtime(filepath) if os.path.isfile(filepath) else None
+
+    created_at = flag_time(STATUS_CREATED)
+    submitting_at = flag_time(STATUS_SUBMITTING)
+    failed_at = flag_time(STATUS_FAILED)
+
+    if created_at is None and submitting_at is None and failed_at is None:
+        return None
+
+    started_at = flag_time(STATUS_STARTED)
+    finished_at = flag_time(STATUS_FINISHED)
+
+    if finished_at is not None:
+        status = SIM_FINISHED
+    elif failed_at is not None:
+        status = SIM_FAILED
+    elif started_at is not None:
+        status = SIM_STARTED
+    elif created_at is not None:
+        status = SIM_CREATED
+    else:
+        status = SIM_SUBMITTING
+
+    if created_at is None:
+        created_at = submitting_at if submitting_at is not None else failed_at
+
+    job_id = None
+    job_id_file = sim_filepath(sim_id, 'job_id')
+    if os.path.isfile(job_id_file):
+        with open(job_id_file) as f:
+            job_id = f.read().strip()
+
+    # a failed run has no results, so any drag it wrote isn't one
+    drag = get_drag(sim_id) if failed_at is None else None
+
+    return {
+        'id': sim_id,
+        'status': status,
+        'drag': drag,
+        'avatar_id': get_avatar_id(sim_id),
+        'nodes': get_nodes(sim_id),
+        'job_id': job_id,
+        'created_at': created_at,
+        'started_at': started_at,
+        'finished_at': finished_at,
+    }
+
+
+def rebuild_catalog():
+    """
+    Rebuilds the simulation catalog by scanning the simulation store. This is
+    done automatically if the catalog doesn't exist, and can be run by hand if
+    simulation directories have been moved around manually.
+    """
+    sim_store = simulation_store_directory()
+
+    ids = [
+        clean_sim_id(os.path.basename(i))
+        for i in glob.glob('{sim_store}/[0-9]*'.format(sim_store=sim_store))
+        if os.path.isdir(i)
+    ]
+
+    entries = [catalog_entry_from_store(sim_id) for sim_id in sorted(ids)]
+
+    catalog.replace_all([e for e in entries if e is not None])
+
+    # simulations may have been removed from the store
+    refresh_leaderboard()
+
+
+@monitoring.timed('sync_catalog')
+def sync_catalog():
+    """
+    Brings the catalog up to date with flag files written outside of the
+    server (e.g. by the batch script). Only simulations which can still
+    change are checked, so the cost does not grow with the size of the store.
+    """
+    if not catalog.is_built():
+        rebuild_catalog()
+        return
+
+    entries = catalog.unsettled([SIM_SUBMITTING, SIM_CREATED, SIM_STARTED], SIM_FINISHED,
+                                time.time() - DRAG_GRACE_PERIOD)
+
+    drags_changed = False
+
+    for entry in entries:
+        current = catalog_entry_from_store(entry['id'])
+
+        if current is None:
+            continue
+
+        changed = {
+            k: v
+            for k, v in current.items()
+            if v is not None and v != entry[k] and k != 'id'
+        }
+
+        if changed:
+            catalog.update(entry['id'], **changed)
+
+        if changed.get('status') in (SIM_FINISHED, SIM_FAILED):
+            progress_tracker.forget(sim_filepath(entry['id'], 'slurm.output'))
+
+        # the drag is written by the batch job, see set_drag
+        if 'drag' in changed:
+            drags_changed = True
+
+    # The leaderboard is shared with other processes syncing the catalog (e.g.
+    # the archiver), so it is rebuilt from the catalog by whichever process
+    # noticed the new drags.
+    if drags_changed:
+        refresh_leaderboard()
+
+
+def open_leaderboard():
+    """
+    Returns the leaderboard of lowest drag simulations, without building it
+    """
+    global leaderboard
+
+    path = '{sim_store}/leaderboard.json'.format(
+        sim_store=simulation_store_directory())
+
+    if leaderboard is None or leaderboard.path != path:
+        leaderboard = Leaderboard(path, settings.leaderboard_size, catalog.drags)
+
+    return leaderboard
+
+
+def refresh_leaderboard():
+    """
+    Rebuilds the leaderboard from the lowest drags in the catalog, if it has
+    been built (otherwise get_leaderboard builds it when first used)
+    """
+    board = open_leaderboard()
+
+    if board.exists():
+        board.rebuild(catalog.drags(settings.leaderboard_size))
+
+
+def get_leaderboard():
+    """
+    Returns the leaderboard of lowest drag simulations, building it from the
+    catalog if it doesn't exist yet
+    """
+    board = open_leaderboard()
+
+    if not board.exists():
+        sync_catalog()
+        board.rebuild(catalog.drags())
+
+    return board
+
+
+def registry_loader(sim_id):
+    """
+    Loads a simulation for the registry. A simulation is settled once it has
+    failed, or has finished and has a drag and images (or finished more than
+    DRAG_GRACE_PERIOD ago, as the catalog does), after which it is only
+    rechecked during full scans.
+    """
+    entry = catalog_entry_from_store(sim_id)
+
+    if entry is None:
+        return None, None, False
+
+    simulation = load_simulation(sim_id)
+
+    if entry['status'] == SIM_FAILED:
+        settled = True
+    elif entry['status'] == SIM_FINISHED:
+        complete = simulation is not None and simulation['drag'] is not None and \
+            simulation['images-available']
+
+        settled = complete or entry['finished_at'] < time.time() - DRAG_GRACE_PERIOD
+    else:
+        settled = False
+
+    return entry['status'], simulation, settled
+
+
+def registry_changed(sim_ids):
+    """
+    Called by the registry watcher when simulations have changed on disk
+    """
+    sync_catalog()
+
+    # simulations may have dropped off the UI
+    get_avatar_pool().release_hidden()
+
+
+def start_registry():
+    """
+    Starts the in-memory simulation registry and its watcher thread. Once
+    running, simulations and simulation lists are served from memory.
+    """
+    global registry
+
+    registry = SimulationRegistry(
+        simulation_store_directory(),
+        registry_loader,
+        poll_interval=settings.registry_poll_interval,
+        full_scan_interval=settings.registry_full_scan_interval,
+        on_change=registry_changed,
+        use_inotify=settings.registry_use_inotify)
+
+    registry.start()
+
+
+def init_store():
+    """
+    Builds or loads the indexes over the simulation store. This is called once
+    when the server starts, so that the first requests don't pay for it.
+    """
+    sync_catalog()
+    get_leaderboard().lowest()
+    get_avatar_pool()
+    get_print_queue()
+
+
 ######################################
 ## Printing
 ######################################
 
+def get_print_queue():
+    """
+    Returns the queue of simulations to print, building it from the
+    status.toprint flags if it doesn't exist yet
+    """
+    global print_queue
+
+    path = '{sim_store}/print_queue.journal'.format(
+        sim_store=simulation_store_directory())
+
+    if print_queue is None or print_queue.path != path:
+        print_queue = PrintQueue(path)
+
+    if not print_queue.exists():
+        paths = glob.glob("{dir}/*/{flag}".format(dir=simulation_store_directory(),
+                                                   flag=STATUS_TOPRINT))
+        print_queue.rebuild(sorted(int(path.split('/')[-2]) for path in paths))
+
+    return print_queue
+
+
 def set_toprint(sim_id):
     """
     Mark a job as ready for printing
@@ -256,6 +633,8 @@ def set_toprint(sim_id):
 
     touch_file(sim_id, STATUS_TOPRINT)
 
+    get_print_queue().append(sim_id)
+
 
 def mark_as_printed(sim_id):
     """
@@ -267,29 +646,300 @@ def mark_as_printed(sim_id):
     if os.path.isfile(filepath):
         os.remove(filepath)
 
+    get_print_queue().remove(sim_id)
 
-def find_to_print():
-    paths = glob.glob("{dir}/*/status.toprint".format(dir=simulation_store_directory()))
-
-    if len(paths) > 0:
-        print_ids = [int(path.split('/')[-2]) for path in paths]
-    else:
-        print_ids = []
 
-    return sorted(print_ids)
+def find_to_print():
+    """
+    Returns the IDs of jobs waiting to be printed, in the order they were added
+    """
+    return get_print_queue().list()
 
 
 def next_to_print():
     """
     Returns next print job, otherwise returns None
     """
-    to_print = find_to_print()
+    return get_print_queue().peek()
 
-    if len(to_print) > 1:
-        return to_print[0]
-    else:
+
+######################################
+## Result cache
+######################################
+
+# Files reused from a cached result. The GIFs and postcard are rendered again
+# from the cached fields (see resultfields), as left.gif and the postcard show
+# the visitor's photo. The drag is set by the run from the cached value. The
+# VTK files aren't kept, the fields container holds all that is read from them.
+CACHED_RESULT_FILES = ['fields*', 'drag.dat', 'dragforce.png']
+
+# Written to the run directory when a simulation reuses a cached result
+CACHE_HIT_FILE = 'cache.hit'
+
+
+def get_result_cache():
+    global result_cache
+
+    directory = settings.result_cache_dir.format(root_dir=settings.root_dir)
+
+    if result_cache is None or result_cache.directory != directory:
+        result_cache = ResultCache(directory, settings.result_cache_max_entries)
+
+    return result_cache
+
+
+def outline_hash(sim_id):
+    """
+    Returns a hash of the simulation inputs: the normalised outline written by
+    write_outline, the Elmer configuration and the number of timesteps
+    """
+    outline = np.loadtxt(outline_coords_file(sim_id), dtype=np.int64).reshape((-1, 2))
+
+    h = hashlib.sha256()
+    h.update(outline.astype('<i8').tobytes())
+
+    if os.path.isfile(settings.elmer_sif_file):
+        with open(settings.elmer_sif_file, 'rb') as f:
+            h.update(f.read())
+
+    h.update(str(settings.number_timesteps).encode('utf8'))
+
+    return h.hexdigest()
+
+
+def restore_cached_result(sim_id):
+    """
+    Looks up the simulation outline in the result cache. On a hit, the cached
+    results are linked into the run directory and CACHE_HIT_FILE is written.
+    Returns True on a hit.
+    """
+    key = outline_hash(sim_id)
+
+    with open(sim_filepath(sim_id, 'outline.hash'), 'w') as f:
+        f.write(key)
+
+    meta = get_result_cache().restore(key, run_directory(sim_id))
+
+    if meta is None:
+        return False
+
+    with open(sim_filepath(sim_id, CACHE_HIT_FILE), 'w') as f:
+        json.dump(dict(meta, key=key), f)
+
+    print('CACHED RESULT FOR SIMULATION: {sim_id}'.format(sim_id=sim_id))
+
+    return True
+
+
+def cached_result(sim_id):
+    """
+    Returns the meta data of the cached result reused by the simulation (with
+    keys 'drag', 'nprocs' and 'files'), or None if it isn't reusing one
+    """
+    filepath = sim_filepath(sim_id, CACHE_HIT_FILE)
+
+    if not os.path.isfile(filepath):
         return None
 
+    with open(filepath) as f:
+        return json.load(f)
+
+
+def store_cached_result(sim_id, nprocs, drag):
+    """
+    Stores the results of a finished run in the result cache, unless the run
+    failed
+    """
+    filepath = sim_filepath(sim_id, 'outline.hash')
+
+    if not settings.result_cache_enabled or not os.path.isfile(filepath):
+        return
+
+    if sim_check_file(sim_id, STATUS_FAILED):
+        return
+
+    with open(filepath) as f:
+        key = f.read().strip()
+
+    get_result_cache().store(key, run_directory(sim_id), CACHED_RESULT_FILES, {
+        'drag': float(drag),
+        'nprocs': nprocs,
+        'sim_id': int(sim_id)
+    })
+
+
+def wait_for_upload(sim_id, timeout):
+    """
+    Waits up to `timeout` seconds for the client to upload all_data.pickle.
+    Returns True if it has been uploaded.
+    """
+    end = time.time() + timeout
+
+    # the all_data directory is written once the upload has completed
+    while not os.path.isdir(detail_directory(sim_id)):
+        if time.time() > end:
+            return False
+        time.sleep(1)
+
+    return True
+
+
+######################################
+## Schedulers
+######################################
+
+
+class SlurmScheduler:
+    """
+    Runs simulations by submitting templates/slurm.batch with sbatch
+    """
+
+    @monitoring.timed('sbatch')
+    def submit(self, sim_id):
+        """
+        Submits the simulation and returns its job ID
+        """
+        batch_script = write_batch_script(sim_id)
+
+        if settings.devel:
+            # In development, just return a job ID
+            print('WARNING: Not submitting batch script in development')
+            return '123'
+
+        cmd = 'cd ~/ && sbatch {script}'.format(script=batch_script)
+        output = subprocess.check_output(cmd, shell=True).decode('utf8')
+
+        return re.match('^Submitted batch job ([0-9]*)', output).group(1)
+
+    @monitoring.timed('sbatch')
+    def submit_many(self, sim_ids):
+        """
+        Submits the simulations with a single shell command, and returns a dict
+        of their job IDs by simulation ID. Simulations which failed to submit
+        are left out.
+        """
+        batch_scripts = [write_batch_script(sim_id) for sim_id in sim_ids]
+
+        if settings.devel:
+            print('WARNING: Not submitting batch scripts in development')
+            return {sim_id: '123' for sim_id in sim_ids}
+
+        # a failed sbatch prints a line in place of its job ID, so that the
+        # output has one line per simulation
+        cmd = 'cd ~/ && ' + '; '.join(
+            'sbatch {script} || echo failed'.format(script=script)
+            for script in batch_scripts)
+        output = subprocess.check_output(cmd, shell=True).decode('utf8')
+
+        job_ids = {}
+
+        for sim_id, line in zip(sim_ids, output.splitlines()):
+            match = re.match('^Submitted batch job ([0-9]*)', line)
+
+            if match is not None:
+                job_ids[sim_id] = match.group(1)
+
+        return job_ids
+
+
+class LocalScheduler:
+    """
+    Runs simulations on this machine, at most `max_jobs` at a time, each with
+    `ncores` processes. The run writes the same files as the SLURM batch
+    script (status flags, slurm.hosts, slurm.output and slurm.error), so the
+    rest of the server can't tell the difference. Note, jobs don't outlive the
+    server process, see requeue_orphaned_jobs.
+
+    Job IDs include the server process ID, so that they are unique between
+    server restarts.
+    """
+
+    JOB_PREFIX = 'local-'
+
+    def __init__(self, max_jobs, ncores):
+        self.ncores = ncores
+        self.pool = ThreadPoolExecutor(max_workers=max_jobs)
+        self.job_ids = itertools.count(1)
+        self.jobs = set()
+        self.lock = threading.Lock()
+
+    def submit(self, sim_id):
+        """
+        Queues the simulation in the pool and returns its job ID
+        """
+        with self.lock:
+            job_id = '{prefix}{pid}-{n}'.format(
+                prefix=self.JOB_PREFIX, pid=os.getpid(), n=next(self.job_ids))
+            self.jobs.add(job_id)
+
+        self.pool.submit(self.run, sim_id, job_id)
+
+        return job_id
+
+    def submit_many(self, sim_ids):
+        """
+        Queues the simulations and returns a dict of their job IDs by
+        simulation ID
+        """
+        return {sim_id: self.submit(sim_id) for sim_id in sim_ids}
+
+    def owns(self, job_id):
+        """
+        Returns True if the job is queued or running in this process
+        """
+        with self.lock:
+            return job_id in self.jobs
+
+    def run(self, sim_id, job_id):
+        try:
+            self._run(sim_id, job_id)
+        finally:
+            with self.lock:
+                self.jobs.discard(job_id)
+
+    def _run(self, sim_id, job_id):
+        directory = run_directory(sim_id)
+
+        # remove products of any previous run, as the batch script does
+        for filename in [STATUS_FINISHED, 'slurm.output', 'slurm.error', 'slurm.hosts']:
+            if sim_check_file(sim_id, filename):
+                os.remove(sim_filepath(sim_id, filename))
+
+        with open(sim_filepath(sim_id, 'slurm.hosts'), 'w') as f:
+            f.write('127.0.0.1 localhost\n')
+
+        # the job can start before submit_simulation has marked it as created
+        touch_file(sim_id, STATUS_CREATED)
+        set_started(sim_id, job_id)
+
+        cmd = [sys.executable, settings.root_dir + '/cfd/runcfd.py', str(sim_id), str(self.ncores)]
+
+        try:
+            with open(sim_filepath(sim_id, 'slurm.output'), 'w') as output, \
+                    open(sim_filepath(sim_id, 'slurm.error'), 'w') as error:
+                subprocess.call(cmd, cwd=directory, stdout=output, stderr=error)
+        finally:
+            set_finished(sim_id)
+
+
+def get_scheduler(name=None):
+    """
+    Returns the scheduler called `name` ('slurm' or 'local'), by default the
+    one selected by settings.scheduler
+    """
+    if name is None:
+        name = settings.scheduler
+
+    if name not in schedulers:
+        if name == 'local':
+            schedulers[name] = LocalScheduler(settings.local_max_jobs, settings.local_cores_per_job)
+        elif name == 'slurm':
+            schedulers[name] = SlurmScheduler()
+        else:
+            raise ValueError('unknown scheduler: {name}'.format(name=name))
+
+    return schedulers[name]
+
 
 ######################################
 ## Public API
@@ -313,47 +963,55 @@ def queued_simulations():
     The last to be added is returned first.
     """
 
-    ids = [s for s in simulation_id_list() if is_sim_queued(s)]
-    ids.sort(reverse=True)
+    if registry is not None:
+        return registry.ids([SIM_CREATED])
+
+    sync_catalog()
 
-    return ids
+    return catalog.ids([SIM_CREATED])
 
 
 def running_simulations():
     """
     Returns a list of IDs of running simulations, most recently started first
     """
-    ids = [s for s in simulation_id_list() if is_sim_running(s)]
-    ids.sort(reverse=True)
+    if registry is not None:
+        return registry.ids([SIM_STARTED])
+
+    sync_catalog()
 
-    return ids
+    return catalog.ids([SIM_STARTED])
 
 
+@monitoring.timed('get_progress')
 def get_progress(sim_id):
     """
-    Read the completion percentage of the run by using grep and the output file and
-    counting the completed steps and jobsteps. Each jobstep (i.e. "Starting Step"
+    Read the completion percentage of the run from the output file by counting
+    the completed steps and jobsteps. Each jobstep (i.e. "Starting Step"
     string appearing in the output file) is equivalent progress to completing
     a timestep of the simulation. Whilst this is not true in general, it allows a
-    simple measure of total progress.
+    simple measure of total progress. Only the output appended since the last
+    call is read (see progress.ProgressTracker). Finished runs are complete, and
+    their output is no longer tracked.
     """
 
     percentage = 0
 
     outputfile = sim_filepath(sim_id, 'slurm.output')
 
-    if os.path.isfile(outputfile):
-        cmd = 'grep "MAIN:  Time:" {file}'.format(file=outputfile)
+    if check_status(sim_id, STATUS_FINISHED):
+        progress_tracker.forget(outputfile)
+        return 100
 
-        # Count simulation steps
-        try:
-            output = subprocess.check_output(
-                ["grep", "MAIN:  Time", outputfile]).decode('utf-8')
-            completed_steps, total_steps = output.splitlines()[-1].split(
-            )[2].split("/")
+    state = progress_tracker.read(outputfile)
+
+    if state is not None:
+        timestep, completed_jobsteps = state
 
-        except subprocess.CalledProcessError as e:
-            # grep returns an error if nothing found
+        # Count simulation steps
+        if timestep is not None:
+            completed_steps, total_steps = timestep
+        else:
             completed_steps = 0
             total_steps = settings.number_timesteps
 
@@ -369,16 +1027,6 @@ def get_progress(sim_id):
         # Count job steps (could break if anyone changes output file text)
         total_jobsteps = settings.jobstep_count
 
-        try:
-            output = subprocess.check_output(
-                ["grep", "Starting Step [0-9]", outputfile]).decode('utf-8')
-
-            completed_jobsteps = len(output.splitlines())
-
-        except subprocess.CalledProcessError as e:
-            # grep returns an error if nothing found
-            completed_jobsteps = 0
-
         # Compute completion percentage
         done = float(completed_steps + completed_jobsteps)
         todo = float(total_steps + total_jobsteps)
@@ -388,23 +1036,108 @@ def get_progress(sim_id):
     return percentage
 
 
-def get_simulation_detail_key(sim_id, key):
+def progress_version(sim_ids):
+    """
+    Returns a value which changes whenever the progress of any of the
+    simulations `sim_ids` may have changed, i.e. when their output file grows
+    """
+    stamps = []
+
+    for sim_id in sim_ids:
+        try:
+            size = os.stat(sim_filepath(sim_id, 'slurm.output')).st_size
+        except FileNotFoundError:
+            size = None
+
+        stamps.append((sim_id, size))
+
+    return tuple(stamps)
+
+
+def store_version():
+    """
+    Returns a value which changes whenever a simulation in the store changes,
+    or None if the registry isn't running (changes aren't tracked)
+    """
+    if registry is None:
+        return None
+
+    return registry.version
+
+
+def detail_directory(sim_id):
+    return sim_filepath(sim_id, 'all_data')
+
+
+def split_detail_pickle(sim_id):
+    """
+    Splits the all_data.pickle uploaded by the client into one .npy file per
+    array (and a small pickle of any other values) in the all_data directory,
+    so that single arrays can be read without unpickling the whole capture.
+    Returns False if there is no all_data.pickle to split.
+    """
     filepath = sim_filepath(sim_id, 'all_data.pickle')
 
-    if os.path.isfile(filepath):
-        with open(filepath, 'rb') as f:
-            sim = pickle.load(f)
-            val = sim[key]
-        return val
-    else:
+    if not os.path.isfile(filepath):
+        return False
+
+    with open(filepath, 'rb') as f:
+        sim = pickle.load(f)
+
+    # write to a fresh temporary directory next to the target first, so that
+    # readers never see a partly written directory and concurrent splits of
+    # the same simulation do not write into each other's files
+    directory = detail_directory(sim_id)
+    directory_tmp = tempfile.mkdtemp(prefix='all_data.',
+                                     dir=os.path.dirname(directory))
+
+    others = {}
+
+    for key, val in sim.items():
+        if isinstance(val, np.ndarray) and val.dtype != object:
+            np.save('{dir}/{key}.npy'.format(dir=directory_tmp, key=key), val)
+        else:
+            others[key] = val
+
+    pickle_save('{dir}/others.pickle'.format(dir=directory_tmp), others)
+
+    if os.path.isdir(directory):
+        shutil.rmtree(directory, ignore_errors=True)
+
+    try:
+        os.rename(directory_tmp, directory)
+    except OSError:
+        # another split of the same upload finished first
+        shutil.rmtree(directory_tmp, ignore_errors=True)
+
+    return True
+
+
+def get_simulation_detail_key(sim_id, key):
+    """
+    Returns a single value from the data uploaded by the client. Arrays are
+    memory-mapped from the all_data directory. If only an all_data.pickle
+    exists (e.g. uploaded before the split format), it is split on first use.
+    """
+    directory = detail_directory(sim_id)
+
+    if not os.path.isdir(directory) and not split_detail_pickle(sim_id):
         print("key simulation key: file {filepath} not found".format(
-            filepath=filepath))
+            filepath=sim_filepath(sim_id, 'all_data.pickle')))
         return None
 
+    array_file = '{dir}/{key}.npy'.format(dir=directory, key=key)
+
+    if os.path.isfile(array_file):
+        return np.load(array_file, mmap_mode='r')
+
+    with open('{dir}/others.pickle'.format(dir=directory), 'rb') as f:
+        return pickle.load(f)[key]
 
-def get_simulation(sim_id):
+
+def load_simulation(sim_id):
     """
-    Returns simulation data for a simulation if the data file exists and the created flag exists. Otherwise returns None.
+    Reads simulation data for a simulation from disk if the data file exists and the created flag exists. Otherwise returns None. The progress is not included, see get_simulation.
     """
     sim_id = clean_sim_id(sim_id)
 
@@ -414,7 +1147,12 @@ def get_simulation(sim_id):
 
     # Read the info about simulation if it has been created
     if check_status(sim_id, STATUS_CREATED) and os.path.isfile(datafile):
-        simulation = pickle_load(datafile)
+        data = pickle_load(datafile)
+
+        if data is None:
+            return None
+
+        simulation = dict(data)
         simulation['drag'] = get_drag(sim_id)
 
         # set the images available key for simulation
@@ -425,14 +1163,32 @@ def get_simulation(sim_id):
         simulation['nodes'] = get_nodes(sim_id)
         simulation['avatar_id'] = get_avatar_id(sim_id)
 
-        simulation['progress'] = get_progress(sim_id)
-
         # force the simulation ID (in case files have been moved around manually)
         simulation['id'] = sim_id
 
     return simulation
 
 
+@monitoring.timed('get_simulation')
+def get_simulation(sim_id, progress=True):
+    """
+    Returns simulation data for a simulation if the data file exists and the created flag exists. Otherwise returns None.
+    When the registry is running, the simulation is served from memory.
+    The progress of the run is added unless `progress` is False.
+    """
+    sim_id = clean_sim_id(sim_id)
+
+    if registry is not None:
+        simulation = registry.get(sim_id)
+    else:
+        simulation = load_simulation(sim_id)
+
+    if simulation is not None and progress:
+        simulation['progress'] = get_progress(sim_id)
+
+    return simulation
+
+
 def write_outline(sim_id, outline):
     "Takes an outline as an array and saves it to file outline file"
     filename = outline_coords_file(sim_id)
@@ -442,9 +1198,162 @@ def write_outline(sim_id, outline):
     np.savetxt(filename, flipped_outline, fmt='%i %i')
 
 
+def submit_simulation(sim_id):
+    """
+    Submits a simulation, whose files have been written by queue_simulation, to
+    the scheduler. Once the job ID is known it is recorded and the simulation
+    is marked as created (i.e. queued).
+    """
+    job_id = simulation_scheduler(sim_id).submit(sim_id)
+
+    record_submission(sim_id, job_id)
+
+    return job_id
+
+
+def submit_simulations(sim_ids):
+    """
+    Submits a batch of simulations as submit_simulation does, with one call to
+    each scheduler. Returns the IDs of the simulations which failed to submit.
+    """
+    batches = {}
+
+    for sim_id in sim_ids:
+        batches.setdefault(simulation_scheduler(sim_id), []).append(sim_id)
+
+    failed = []
+
+    for scheduler, batch in batches.items():
+        try:
+            job_ids = scheduler.submit_many(batch)
+        except Exception:
+            traceback.print_exc()
+            job_ids = {}
+
+        for sim_id in batch:
+            if sim_id in job_ids:
+                record_submission(sim_id, job_ids[sim_id])
+            else:
+                failed.append(sim_id)
+
+    return failed
+
+
+def simulation_scheduler(sim_id):
+    # a run reusing a cached result only renders images, so it is run locally
+    if cached_result(sim_id) is not None:
+        return get_scheduler('local')
+
+    return get_scheduler()
+
+
+def record_submission(sim_id, job_id):
+    """
+    Records the job ID of a submitted simulation and marks it as created
+    """
+    # Write job id to file
+    with open(sim_filepath(sim_id, 'job_id'), 'w') as f:
+        f.write(job_id)
+
+    print('RUNNING SIMULATION: {sim_id}'.format(sim_id=sim_id))
+
+    touch_file(sim_id, STATUS_CREATED)
+
+    if sim_check_file(sim_id, STATUS_SUBMITTING):
+        os.remove(sim_filepath(sim_id, STATUS_SUBMITTING))
+
+    # the job may already have started (e.g. with the local scheduler)
+    catalog.update(sim_id,
+                   status=catalog_entry_from_store(sim_id)['status'],
+                   job_id=job_id,
+                   created_at=time.time())
+
+    if registry is not None:
+        registry.invalidate(sim_id)
+
+
+def submission_failed(sim_id):
+    print('ERROR: giving up submitting simulation {sim_id}'.format(sim_id=sim_id))
+
+    touch_file(sim_id, STATUS_FAILED)
+
+    catalog.update(sim_id, status=SIM_FAILED)
+    progress_tracker.forget(sim_filepath(sim_id, 'slurm.output'))
+
+
+def requeue_orphaned_jobs():
+    """
+    Jobs of the local scheduler don't outlive the server process, so the
+    simulations queued or running on the local scheduler of a previous server
+    would never finish. These are marked as waiting for submission again, and
+    submitted by start_submission_worker. Returns their IDs.
+    """
+    local = schedulers.get('local')
+    orphans = []
+
+    for sim_id in catalog.ids([SIM_CREATED, SIM_STARTED], reverse=False):
+        job_id = catalog.get(sim_id)['job_id']
+
+        if job_id is None or not job_id.startswith(LocalScheduler.JOB_PREFIX):
+            continue
+
+        if local is not None and local.owns(job_id):
+            continue
+
+        print('REQUEUEING SIMULATION: {sim_id} (job {job_id} was lost)'.format(
+            sim_id=sim_id, job_id=job_id))
+
+        for filename in [STATUS_CREATED, STATUS_STARTED, 'job_id']:
+            if sim_check_file(sim_id, filename):
+                os.remove(sim_filepath(sim_id, filename))
+
+        touch_file(sim_id, STATUS_SUBMITTING)
+
+        catalog.update(sim_id,
+                       status=SIM_SUBMITTING,
+                       job_id=None,
+                       started_at=None,
+                       nodes=None)
+        progress_tracker.forget(sim_filepath(sim_id, 'slurm.output'))
+
+        if registry is not None:
+            registry.invalidate(sim_id)
+
+        orphans.append(sim_id)
+
+    return orphans
+
+
+def start_submission_worker():
+    """
+    Starts the background submission worker. Once started, queue_simulation
+    returns as soon as the simulation files are written. Simulations left
+    waiting for submission by a previous server, or whose local job was lost
+    with it, are submitted again.
+    """
+    global submission_worker
+
+    submission_worker = SubmissionWorker(
+        submit_simulations,
+        retries=settings.submission_retries,
+        retry_delay=settings.submission_retry_delay,
+        on_failed=submission_failed)
+
+    submission_worker.start()
+
+    sync_catalog()
+    requeue_orphaned_jobs()
+
+    for sim_id in catalog.ids([SIM_SUBMITTING], reverse=False):
+        submission_worker.enqueue(sim_id)
+
+
 def queue_simulation(sim):
     """
-    Creates the simulation data files and submits the simulation to the queue manager
+    Creates the simulation data files and submits the simulation to the queue
+    manager. If the submission worker is running the submission is made in the
+    background, and the simulation is in the submitting state until it has a
+    job ID.
     """
 
     # Ensure that simulation has an ID
@@ -454,36 +1363,33 @@ def queue_simulation(sim):
     sim_id = sim['id']
 
     write_outline(sim_id, sim['contour'])
-    batch_script = write_batch_script(sim_id)
+
+    # The simulation is visible (as submitting) before it reserves an avatar,
+    # so that releasing the avatars of hidden simulations in the meantime
+    # can't release its avatar
+    touch_file(sim_id, STATUS_SUBMITTING)
+
+    catalog.upsert(sim_id, status=SIM_SUBMITTING)
 
     # Write avatar to file and add to sim dictionary for writing
-    avatar_id = get_next_avatar()
+    avatar_id = get_avatar_pool().reserve(sim_id)
     write_avatar(sim_id, avatar_id)
     sim['avatar_id'] = avatar_id
 
-    # Submit the job to SLURM
-    if settings.devel:
-        # In development, just return a job ID
-        print('WARNING: Not submitting batch script in development')
-        job_id = '123'
-    else:
-        cmd = 'cd ~/ && sbatch {script}'.format(script=batch_script)
-        output = subprocess.check_output(cmd, shell=True).decode('utf8')
-
-        job_id = re.match('^Submitted batch job ([0-9]*)', output).group(1)
-
-        # Write job id to file
-    with open(sim_filepath(sim_id, 'job_id'), 'w') as f:
-        f.write(job_id)
-
-    print('RUNNING SIMULATION: {sim_id}'.format(sim_id=sim_id))
+    catalog.update(sim_id, avatar_id=avatar_id)
 
     # Save data files for the simulation
     filename = sim_datafile(sim['id'])
 
     pickle_save(filename, sim)
 
-    touch_file(sim_id, STATUS_CREATED)
+    if settings.result_cache_enabled:
+        restore_cached_result(sim_id)
+
+    if submission_worker is not None:
+        submission_worker.enqueue(sim_id)
+    else:
+        submit_simulation(sim_id)
 
     return sim_id
 
@@ -495,10 +1401,10 @@ def outline_coords_file(sim_id):
 def lowest_drag_simulations_sorted(num_sims=10):
     "fetches `num_sims` simulations and order them by value of drag"
 
-    drags, sim_ids = all_drags()
-    idxs = np.argsort(drags)[:num_sims][::-1]
+    # picks up drags written by finished runs
+    sync_catalog()
 
-    result_sim_ids = sim_ids[idxs]
+    result_sim_ids = get_leaderboard().lowest(num_sims)[::-1]
 
     return valid_simulations(result_sim_ids)
 
@@ -506,12 +1412,13 @@ def lowest_drag_simulations_sorted(num_sims=10):
 def recently_finished_simulations(num_sims=10):
     "fetches `num_sims` simulations with the highest ID"
 
-    recent_sim_ids = [
-        sim_id for sim_id in simulation_id_list() if is_sim_finished(sim_id)
-    ]
-    sorted_sim_ids = sorted(recent_sim_ids, reverse=True)[:num_sims]
+    if registry is not None:
+        sim_ids = registry.ids([SIM_FINISHED], limit=num_sims)
+    else:
+        sync_catalog()
+        sim_ids = catalog.ids([SIM_FINISHED], limit=num_sims)
 
-    return valid_simulations(sorted_sim_ids)
+    return valid_simulations(sim_ids)
 
 
 ######################################
@@ -537,33 +1444,34 @@ def get_avatar_id(sim_id):
         return 0
 
 
-def get_available_avatars(num_leaderboard=10):
-    # fetch required info
-    running = running_simulations()
-    queued = queued_simulations()
-
-    # leaderboard returns a dict, we extract the ID key as an int
-    leaderboard_sims = lowest_drag_simulations_sorted(num_sims=num_leaderboard)
-    leaderboard = [int(s['id']) for s in leaderboard_sims]
+def visible_simulation_ids(num_leaderboard=10):
+    """
+    Returns the IDs of simulations visible in the UI: those being submitted,
+    queued or running, and those on the leaderboard
+    """
+    submitting = catalog.ids([SIM_SUBMITTING]) if catalog.is_built() else []
 
-    # IDs still visible in the UI
-    visible_ids = set(running + queued + leaderboard)
+    return submitting + running_simulations() + queued_simulations() + \
+        get_leaderboard().lowest(num_leaderboard)
 
-    used_avatars = set([get_avatar_id(s) for s in visible_ids])
 
-    # work out the available avatars
-    available_avatars = set(range(1, 26)) - used_avatars
-    return available_avatars
+def get_avatar_pool():
+    """
+    Returns the pool of avatars, building it from the avatars of the visible
+    simulations if it doesn't exist yet
+    """
+    global avatar_pool
 
+    path = '{sim_store}/avatars.json'.format(sim_store=simulation_store_directory())
 
-def choose_avatar(available):
-    return random.choice(tuple(available))
+    if avatar_pool is None or avatar_pool.path != path:
+        avatar_pool = AvatarPool(path, range(1, 26), visible_simulation_ids)
 
+    if not avatar_pool.exists():
+        avatar_pool.rebuild(
+            {sim_id: get_avatar_id(sim_id) for sim_id in visible_simulation_ids()})
 
-def get_next_avatar(num_leaderboard=10):
-    # pick a random one
-    available_avatars = get_available_avatars(num_leaderboard)
-    return choose_avatar(available_avatars)
+    return avatar_pool
 
 
 def write_avatar(sim_id, avatar_id):
@@ -0,0 +1,267 @@
+import time
+import bisect
+import threading
+from functools import wraps
+
+from flask import request, g
+
+######################################
+## Package variables
+######################################
+
+# Upper bounds of the latency histogram buckets, in seconds
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# Content type of the Prometheus text format
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+######################################
+## Registry
+######################################
+
+
+class Histogram:
+    """
+    Counts of observed values by bucket (see LATENCY_BUCKETS), with their sum
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    def cumulative(self):
+        """
+        Returns [(upper bound, count of values up to it)], ending with +Inf
+        """
+        bounds = [format_value(b) for b in self.buckets] + ['+Inf']
+        totals = []
+        total = 0
+
+        for count in self.counts:
+            total += count
+            totals.append(total)
+
+        return list(zip(bounds, totals))
+
+
+# Histograms and counters by name, then by labels (sorted tuples of pairs)
+histograms = {}
+counters = {}
+
+# (type, help text) by metric name, see `describe`
+descriptions = {}
+
+# Functions returning [(name, labels, value)] of values read when rendering
+collectors = []
+
+lock = threading.Lock()
+
+
+def describe(name, kind, text):
+    descriptions[name] = (kind, text)
+
+
+def observe(name, value, **labels):
+    key = tuple(sorted(labels.items()))
+
+    with lock:
+        series = histograms.setdefault(name, {})
+
+        if key not in series:
+            series[key] = Histogram()
+
+        series[key].observe(value)
+
+
+def increment(name, amount=1, **labels):
+    key = tuple(sorted(labels.items()))
+
+    with lock:
+        series = counters.setdefault(name, {})
+        series[key] = series.get(key, 0) + amount
+
+
+def add_collector(collector):
+    collectors.append(collector)
+
+
+def reset():
+    with lock:
+        histograms.clear()
+        counters.clear()
+
+
+######################################
+## Timing
+######################################
+
+describe('server_function_duration_seconds', 'histogram',
+         'Time spent in server functions (disk scans, pickle loads, subprocesses)')
+
+
+def timed(function_name):
+    """
+    Decorator recording the duration of each call of the function in the
+    histogram server_function_duration_seconds{function=`function_name`}.
+    Calls which raise are recorded as well.
+    """
+
+    def decorator(function):
+
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+
+            try:
+                return function(*args, **kwargs)
+            finally:
+                observe('server_function_duration_seconds',
+                        time.perf_counter() - start,
+                        function=function_name)
+
+        return wrapper
+
+    return decorator
+
+
+describe('http_request_duration_seconds', 'histogram',
+         'Time to build the response of each route')
+describe('http_requests_total', 'counter', 'Requests by route, method and status')
+
+
+def init_app(app):
+    """
+    Records the duration and status of the requests of `app`, by route (the
+    rule of the URL, e.g. /simulation/<sim_id>, so that the number of series
+    stays bounded). Streamed responses are timed until their first byte.
+    Requests ending in an unhandled exception, for which after_request isn't
+    always run, are recorded with status 500 when torn down.
+    """
+
+    def record(status):
+        start = g.pop('request_start', None)
+
+        if start is None:
+            return
+
+        route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+
+        observe('http_request_duration_seconds',
+                time.perf_counter() - start,
+                route=route,
+                method=request.method)
+        increment('http_requests_total',
+                  route=route,
+                  method=request.method,
+                  status=str(status))
+
+    @app.before_request
+    def start_timer():
+        g.request_start = time.perf_counter()
+
+    @app.after_request
+    def record_request(response):
+        record(response.status_code)
+
+        return response
+
+    @app.teardown_request
+    def record_failed_request(exception):
+        record(500)
+
+
+######################################
+## Text format
+######################################
+
+
+def format_value(value):
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+
+    pairs = ['{key}="{value}"'.format(key=key, value=escape(value)) for key, value in labels]
+
+    return '{' + ','.join(pairs) + '}'
+
+
+def header(name, kind):
+    described_kind, text = descriptions.get(name, (kind, None))
+
+    lines = []
+
+    if text is not None:
+        lines.append('# HELP {name} {text}'.format(name=name, text=text))
+
+    lines.append('# TYPE {name} {kind}'.format(name=name, kind=described_kind))
+
+    return lines
+
+
+def render():
+    """
+    Returns all the metrics in the Prometheus text format
+    """
+    lines = []
+
+    with lock:
+        histogram_series = {
+            name: {key: (h.cumulative(), h.sum) for key, h in series.items()}
+            for name, series in histograms.items()
+        }
+        counter_series = {name: dict(series) for name, series in counters.items()}
+
+    for name in sorted(histogram_series):
+        lines += header(name, 'histogram')
+
+        for key, (buckets, total) in sorted(histogram_series[name].items()):
+            for bound, count in buckets:
+                lines.append('{name}_bucket{labels} {count}'.format(
+                    name=name, labels=format_labels(key + (('le', bound), )), count=count))
+
+            lines.append('{name}_sum{labels} {value}'.format(name=name,
+                                                            labels=format_labels(key),
+                                                            value=format_value(total)))
+            lines.append('{name}_count{labels} {value}'.format(name=name,
+                                                              labels=format_labels(key),
+                                                              value=buckets[-1][1]))
+
+    for name in sorted(counter_series):
+        lines += header(name, 'counter')
+
+        for key, value in sorted(counter_series[name].items()):
+            lines.append('{name}{labels} {value}'.format(name=name,
+                                                         labels=format_labels(key),
+                                                         value=format_value(value)))
+
+    # values read from other modules, e.g. the cache counters
+    collected = {}
+
+    for collector in collectors:
+        for name, labels, value in collector():
+            collected.setdefault(name, []).append((tuple(sorted(labels.items())), value))
+
+    for name in sorted(collected):
+        lines += header(name, 'gauge')
+
+        for key, value in collected[name]:
+            lines.append('{name}{labels} {value}'.format(name=name,
+                                                         labels=format_labels(key),
+                                                         value=format_value(value)))
+
+    return '\n'.join(lines) + '\n'
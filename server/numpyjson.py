@@ -0,0 +1,198 @@
+import json
+import base64
+
+import numpy as np
+from flask import Response
+
+######################################
+## Package variables
+######################################
+
+# Text of each small integer, used to encode image arrays without converting
+# every element to a Python int first
+SMALL_INTS = [str(i) for i in range(-128, 256)]
+
+# Streamed responses are sent in chunks of about this many characters
+CHUNK_SIZE = 64 * 1024
+
+######################################
+## Arrays and scalars
+######################################
+
+
+def numpy_default(obj):
+    """
+    `default` hook of json encoders, for numpy values nested in other values
+    """
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+
+    if isinstance(obj, np.generic):
+        return obj.item()
+
+    raise TypeError('{type} is not JSON serializable'.format(type=type(obj).__name__))
+
+
+encoder = json.JSONEncoder(separators=(',', ':'), default=numpy_default)
+
+
+def encode_small_ints(arr):
+    # text of each element, offset as SMALL_INTS starts at -128
+    flat = (arr.astype(np.int16) + 128).reshape(-1, arr.shape[-1])
+
+    if flat.shape[1] <= 8:
+        # few channels (e.g. RGB), join the text of the columns side by side
+        columns = [[SMALL_INTS[v] for v in column] for column in flat.T.tolist()]
+        texts = ['[' + text + ']' for text in map(','.join, zip(*columns))]
+    else:
+        texts = [
+            '[' + ','.join([SMALL_INTS[v] for v in row]) + ']'
+            for row in flat.tolist()
+        ]
+
+    # then group the rows along the other axes
+    for n in reversed(arr.shape[:-1]):
+        texts = [
+            '[' + ','.join(texts[i:i + n]) + ']'
+            for i in range(0, len(texts), n)
+        ]
+
+    return texts[0]
+
+
+def encode_array(arr, binary=False):
+    """
+    Returns the JSON text of numpy array `arr`: nested lists of numbers, or if
+    `binary` is True an object holding the base64 encoded data, its dtype and
+    shape (see `decode_array`)
+    """
+    if binary:
+        arr = np.ascontiguousarray(arr)
+
+        return encoder.encode({
+            '__ndarray__': base64.b64encode(arr.tobytes()).decode('ascii'),
+            'dtype': arr.dtype.str,
+            'shape': arr.shape
+        })
+
+    if arr.dtype in (np.uint8, np.int8) and arr.ndim > 0 and arr.size > 0:
+        return encode_small_ints(arr)
+
+    # JSON has no NaN, unknown values are null
+    if arr.dtype.kind == 'f' and np.isnan(arr).any():
+        return encoder.encode(np.where(np.isnan(arr), None, arr).tolist())
+
+    return encoder.encode(arr.tolist())
+
+
+def decode_array(obj):
+    """
+    Returns the numpy array of an object made by `encode_array` with `binary`
+    """
+    data = base64.b64decode(obj['__ndarray__'])
+
+    return np.frombuffer(data, dtype=obj['dtype']).reshape(obj['shape'])
+
+
+######################################
+## Encoding
+######################################
+
+
+def encode_key(key):
+    if isinstance(key, np.generic):
+        key = key.item()
+
+    if not isinstance(key, str):
+        # as json does, e.g. 1 -> "1" and True -> "true"
+        key = json.dumps(key)
+
+    return encoder.encode(key)
+
+
+def is_container(value):
+    return isinstance(value, (dict, list, tuple, np.ndarray))
+
+
+def iterencode(obj, binary=False):
+    """
+    Generator of the JSON text of `obj`, which may hold numpy arrays and
+    scalars. Lists and dicts are encoded one item at a time.
+    """
+    if isinstance(obj, np.ndarray):
+        yield encode_array(obj, binary)
+
+    elif isinstance(obj, dict):
+        yield '{'
+
+        separator = ''
+
+        for key, value in obj.items():
+            yield separator + encode_key(key) + ':'
+            yield from iterencode(value, binary)
+            separator = ','
+
+        yield '}'
+
+    elif isinstance(obj, (list, tuple)) and any(is_container(v) for v in obj):
+        yield '['
+
+        separator = ''
+
+        for value in obj:
+            yield separator
+            yield from iterencode(value, binary)
+            separator = ','
+
+        yield ']'
+
+    else:
+        yield encoder.encode(obj)
+
+
+def dumps(obj, binary=False):
+    """
+    Returns the JSON text of `obj`, see `iterencode`
+    """
+    return ''.join(iterencode(obj, binary))
+
+
+def chunked(fragments, chunk_size=CHUNK_SIZE):
+    """
+    Joins the text `fragments` into chunks of about `chunk_size` characters
+    """
+    buffer = []
+    size = 0
+
+    for fragment in fragments:
+        buffer.append(fragment)
+        size += len(fragment)
+
+        if size >= chunk_size:
+            yield ''.join(buffer)
+            buffer = []
+            size = 0
+
+    if buffer:
+        yield ''.join(buffer)
+
+
+######################################
+## Responses
+######################################
+
+
+def response(obj, status=200, binary=False):
+    """
+    Returns a JSON response of `obj`
+    """
+    return Response(dumps(obj, binary), status=status, mimetype='application/json')
+
+
+def streamed_response(obj, status=200, binary=False):
+    """
+    Returns a JSON response of `obj`, sent as it is encoded
+    """
+    return Response(chunked(iterencode(obj, binary)),
+                    status=status,
+                    mimetype='application/json')
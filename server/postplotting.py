@@ -6,99 +6,6 @@ import sys
 import cv2
 
 
-def vtkfile_to_numpy(filename, nprocs):
-    # Open the file with read only permit
-    vtkfile = open(filename, "r")
-
-    # Header
-    line = vtkfile.readline()
-    # Project name
-    line = vtkfile.readline()
-    # ASCII or Binary
-    line = vtkfile.readline()
-    # Grid type
-    line = vtkfile.readline()
-    # Points
-    line = vtkfile.readline()
-    listtemp = " ".join(line.split())
-    listtemp = listtemp.split(" ")
-    numpoints = int(listtemp[1])
-
-    # Point coordinates
-    coords = np.zeros((numpoints, 3), dtype=float)
-    for ii in range(numpoints):
-        line = vtkfile.readline()
-        #print("Line {}: {}".format(ii, line.strip()))
-        listtemp = " ".join(line.split())
-        listtemp = listtemp.split(" ")
-        coords[ii, 0] = float(listtemp[0])
-        coords[ii, 1] = float(listtemp[1])
-        coords[ii, 2] = float(listtemp[2])
-
-    # Elements(Cells)
-    line = vtkfile.readline()
-    listtemp = " ".join(line.split())
-    listtemp = listtemp.split(" ")
-    numcells = int(listtemp[1])
-    # Elements connectivity
-    elems = np.zeros((numcells, 3), dtype=int)
-    for ii in range(numcells):
-        line = vtkfile.readline()
-        #print("Line {}: {}".format(ii, line.strip()))
-        listtemp = " ".join(line.split())
-        listtemp = listtemp.split(" ")
-        elems[ii, 0] = int(listtemp[1])
-        elems[ii, 1] = int(listtemp[2])
-        elems[ii, 2] = int(listtemp[3])
-
-    # CELL_TYPES
-    line = vtkfile.readline()
-    listtemp = " ".join(line.split())
-    listtemp = listtemp.split(" ")
-    iii = int(listtemp[1])
-    for ii in range(iii):
-        line = vtkfile.readline()
-
-    if (nprocs > 1):
-        # CELL DATA - coloring
-        line = vtkfile.readline()
-        line = vtkfile.readline()
-        line = vtkfile.readline()
-        for ii in range(numcells):
-            line = vtkfile.readline()
-
-    # Point data
-    line = vtkfile.readline()
-    line = vtkfile.readline()
-    line = vtkfile.readline()
-
-    # Pressure
-    pressure = np.zeros((numpoints, 1), dtype=float)
-    for ii in range(numpoints):
-        line = vtkfile.readline()
-        #print("Line {}/{}: {}".format(ii, numpoints, line.strip()))
-        listtemp = " ".join(line.split())
-        listtemp = listtemp.split(" ")
-        pressure[ii, 0] = float(listtemp[0])
-
-    # Velocity
-    line = vtkfile.readline()
-
-    velocity = np.zeros((numpoints, 3), dtype=float)
-    for ii in range(numpoints):
-        line = vtkfile.readline()
-        #print("Line {}/{}: {}".format(ii, numpoints, line.strip()))
-        listtemp = " ".join(line.split())
-        listtemp = listtemp.split(" ")
-        velocity[ii, 0] = float(listtemp[0])
-        velocity[ii, 1] = float(listtemp[1])
-        velocity[ii, 2] = float(listtemp[2])
-
-    vtkfile.close()
-
-    return coords, elems, velocity
-
-
 def plot(canvas,
          coords,
          elems,
@@ -189,20 +96,19 @@ def plot(canvas,
     return target_width, target_height
 
 
-def vtk_to_plot(canvas,
-                vtk_filename,
-                nprocs,
-                dotri,
-                dovector,
-                docontour,
-                image,
-                velocity_magn=None):
+def fields_to_plot(canvas,
+                   fields,
+                   dotri,
+                   dovector,
+                   docontour,
+                   image,
+                   velocity_magn=None):
 
     if image is not None:
         image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
 
-    coords, elems, velocity = vtkfile_to_numpy(vtk_filename, nprocs)
-    target_w, target_h = plot(canvas, coords, elems, velocity, dotri, dovector,
-                              docontour, image, velocity_magn)
+    target_w, target_h = plot(canvas, fields.points, fields.cells,
+                              fields.velocity, dotri, dovector, docontour,
+                              image, velocity_magn)
 
     return target_w, target_h
@@ -0,0 +1,163 @@
+import os
+import threading
+from collections import OrderedDict
+
+import utils
+
+
+class PrintQueue:
+    """
+    First in, first out queue of simulations waiting to be printed, persisted
+    as an append-only journal at `path`. Each line of the journal either adds
+    ("+ <id>") or removes ("- <id>") a simulation.
+
+    The journal is shared between processes (postcards are generated on the
+    compute nodes), so each operation first reads any lines appended since the
+    last read. Once the journal holds more than `compact_factor` lines per
+    queued simulation, it is rewritten with only the queued simulations.
+    """
+
+    def __init__(self, path, compact_factor=4, compact_min_lines=100):
+        self.path = path
+        self.compact_factor = compact_factor
+        self.compact_min_lines = compact_min_lines
+        self.queue = OrderedDict()
+        self.inode = None
+        self.offset = 0
+        self.lines = 0
+        self.lock = threading.Lock()
+
+    def exists(self):
+        return os.path.isfile(self.path)
+
+    ######################################
+    ## Journal
+    ######################################
+
+    def _apply(self, line):
+        op, sim_id = line.split()
+        sim_id = int(sim_id)
+
+        if op == '+':
+            self.queue[sim_id] = True
+        else:
+            self.queue.pop(sim_id, None)
+
+        self.lines += 1
+
+    def _refresh(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return
+
+        # compacted by another process, read it again from the start
+        if stat.st_ino != self.inode or stat.st_size < self.offset:
+            self.queue = OrderedDict()
+            self.inode = stat.st_ino
+            self.offset = 0
+            self.lines = 0
+
+        if stat.st_size == self.offset:
+            return
+
+        with open(self.path) as f:
+            f.seek(self.offset)
+            data = f.read()
+
+        # only whole lines are applied
+        end = data.rfind('\n') + 1
+        self.offset += len(data[:end].encode('utf8'))
+
+        for line in data[:end].splitlines():
+            if line.strip():
+                self._apply(line)
+
+    def _append(self, op, sim_id):
+        line = '{op} {sim_id}\n'.format(op=op, sim_id=int(sim_id))
+
+        with open(self.path, 'a') as f:
+            f.write(line)
+
+        # the lines are applied on the next refresh
+        self._refresh()
+
+    def _compact(self):
+        if self.lines < max(self.compact_min_lines,
+                            self.compact_factor * len(self.queue)):
+            return
+
+        utils.atomic_write(
+            self.path, ''.join('+ {sim_id}\n'.format(sim_id=sim_id)
+                               for sim_id in self.queue))
+
+        self._refresh()
+
+    def _locked(self):
+        return utils.file_lock(self.path + '.lock')
+
+    ######################################
+    ## Queue operations
+    ######################################
+
+    def rebuild(self, sim_ids):
+        """
+        Replaces the journal with a queue of `sim_ids`, in order
+        """
+        with self.lock, self._locked():
+            utils.atomic_write(
+                self.path, ''.join('+ {sim_id}\n'.format(sim_id=int(sim_id))
+                                   for sim_id in sim_ids))
+            self._refresh()
+
+    def append(self, sim_id):
+        """
+        Adds a simulation to the end of the queue, unless it is already queued
+        """
+        with self.lock, self._locked():
+            self._refresh()
+
+            if int(sim_id) not in self.queue:
+                self._append('+', sim_id)
+
+    def remove(self, sim_id):
+        """
+        Removes a simulation from the queue, if queued
+        """
+        with self.lock, self._locked():
+            self._refresh()
+
+            if int(sim_id) in self.queue:
+                self._append('-', sim_id)
+                self._compact()
+
+    def peek(self):
+        """
+        Returns the simulation at the front of the queue, or None if empty
+        """
+        with self.lock:
+            self._refresh()
+            return next(iter(self.queue), None)
+
+    def pop(self):
+        """
+        Removes and returns the simulation at the front of the queue, or None
+        """
+        with self.lock, self._locked():
+            self._refresh()
+
+            sim_id = next(iter(self.queue), None)
+
+            if sim_id is not None:
+                self._append('-', sim_id)
+                self._compact()
+
+            return sim_id
+
+    def list(self):
+        """
+        Returns the queued simulations, in order
+        """
+        with self.lock:
+            self._refresh()
+            return list(self.queue.keys())
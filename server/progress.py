@@ -0,0 +1,116 @@
+import os
+import re
+import threading
+
+######################################
+## Package variables
+######################################
+
+# Lines written by Elmer for each simulation timestep, e.g. "MAIN:  Time: 3/10 ..."
+TIMESTEP_PATTERN = re.compile(rb'MAIN:  Time')
+
+# Lines written by runcfd.py at the start of each jobstep
+JOBSTEP_PATTERN = re.compile(rb'Starting Step [0-9]')
+
+# Number of bytes before the read offset compared on each read, to notice a
+# file rewritten in place
+TAIL_BYTES = 64
+
+######################################
+## Tracker
+######################################
+
+
+class OutputState:
+    """
+    Parsed state of a single output file, along with the position up to which
+    the file has been read.
+    """
+
+    def __init__(self, inode):
+        self.inode = inode
+        self.offset = 0
+        self.tail = b''
+        self.partial = b''
+        self.timestep = None
+        self.jobsteps = 0
+
+    def parse_line(self, line):
+        if TIMESTEP_PATTERN.search(line):
+            self.timestep = line.split()[2].decode('utf8').split('/')
+        elif JOBSTEP_PATTERN.search(line):
+            self.jobsteps += 1
+
+
+class ProgressTracker:
+    """
+    Keeps track of the progress written to simulation output files. Each call to
+    `read` only reads the bytes appended to the file since the last call. If a
+    file is replaced or truncated (e.g. when a job is resubmitted) it is read
+    again from the start. A file truncated and rewritten past the previous
+    offset is noticed as the bytes before that offset have changed.
+    """
+
+    def __init__(self):
+        self.states = {}
+        self.lock = threading.Lock()
+
+    def read(self, filepath):
+        """
+        Returns a tuple (timestep, jobsteps) for the output file at `filepath`,
+        where timestep is the last (completed, total) timestep strings found or
+        None, and jobsteps the number of jobsteps started so far. Returns None
+        if the file doesn't exist.
+        """
+        try:
+            stat = os.stat(filepath)
+        except FileNotFoundError:
+            with self.lock:
+                self.states.pop(filepath, None)
+            return None
+
+        with self.lock:
+            state = self.states.get(filepath)
+
+            if state is None or state.inode != stat.st_ino or stat.st_size < state.offset:
+                state = self.states[filepath] = OutputState(stat.st_ino)
+
+            if stat.st_size > state.offset:
+                if not self._read_new(filepath, state):
+                    state = self.states[filepath] = OutputState(stat.st_ino)
+                    self._read_new(filepath, state)
+
+            return state.timestep, state.jobsteps
+
+    def _read_new(self, filepath, state):
+        """
+        Parses the bytes appended since the last read. Returns False, without
+        reading, if the bytes read last time have changed.
+        """
+        with open(filepath, 'rb') as f:
+            f.seek(state.offset - len(state.tail))
+
+            if f.read(len(state.tail)) != state.tail:
+                return False
+
+            data = f.read()
+
+        state.offset += len(data)
+        state.tail = (state.tail + data)[-TAIL_BYTES:]
+
+        lines = (state.partial + data).split(b'\n')
+
+        # keep the last (possibly incomplete) line for the next read
+        state.partial = lines.pop()
+
+        for line in lines:
+            state.parse_line(line)
+
+        return True
+
+    def forget(self, filepath):
+        """
+        Drop the state kept for `filepath`, e.g. once the simulation has finished
+        """
+        with self.lock:
+            self.states.pop(filepath, None)
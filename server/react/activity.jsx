@@ -17,6 +17,7 @@ import css from '../assets/styles/activity.sass';
 
 //const data_url = "http://10.0.0.254:3524/cluster/activity";
 const data_url = "/cluster/activity";
+const event_url = "/events?channels=activity";
 
 class Layout extends React.Component {
   constructor(props) {
@@ -55,7 +56,7 @@ class Layout extends React.Component {
   }
 
   componentDidMount() {
-    window.addEventListener('load', this.scheduleNextUpdate.bind(this));
+    window.addEventListener('load', this.loadHistory.bind(this));
   }
 
   buildJobMap(jobs) {
@@ -79,67 +80,153 @@ class Layout extends React.Component {
       .then(res => res.json())
       .then(
         (result) => {
-
+          this.updateActivity(result);
+          this.scheduleNextUpdate();
+        },
+        (error) => {
           this.setState({
-            last_fetch: this.formatUnixEpoch(result.time),
-            last_fetch_error: false,
+            last_fetch_error: true
           });
+          this.scheduleNextUpdate();;
+        }
+      );
+  }
 
+  // fill the cpu history of each node with the samples kept by the server,
+  // then follow the activity
+  loadHistory() {
+    fetch(this.state.dataUrl + "?history=" + this.state.cpuHistoryMax, {
+        mode: 'cors'
+      })
+      .then(res => res.json())
+      .then(
+        (result) => {
           const running = result.running.map((job) => colourJob(job));
-          const pending = result.pending.map((job) => colourJob(job));
           const job_map = this.buildJobMap(running);
 
-          // map the cpu activity to each core
-          const mappedInfo = this.state.clusterLayout.map((rows,
-            row_idx) => {
-            return rows.map((node_id, col_idx) => {
-              var info = this.state.nodeInfo[row_idx][col_idx];
-              info.node_id = node_id;
+          const nodeInfo = this.state.nodeInfo.map((rows, row_idx) => {
+            return rows.map((info, col_idx) => {
+              const node_id = this.state.clusterLayout[row_idx][col_idx];
+              const colour = colourJob(job_map[node_id]).colour;
 
-              const job = colourJob(job_map[node_id]);
+              // samples from before the node reported are null
+              const history = (result.history.cpu_usage[node_id] || [])
+                .filter((cpu) => cpu !== null);
 
-              const temp = result.temp_percent[node_id];
-
-              info.temp = temp;
-
-              info.job = job;
-              info.cpuHistory.push(result.cpu_usage[node_id]);
-              info.cpuColourHistory.push(job.colour);
-
-              // limit length to this.state.cpuHistoryMax
-              const start = info.cpuHistory.length - this.state
-                .cpuHistoryMax;
-              const end = info.cpuHistory.length;
-
-              if (start >= 0) {
-                info.cpuHistory = info.cpuHistory.slice(start, end);
-                info.cpuColourHistory = info.cpuColourHistory.slice(
-                  start,
-                  end);
-              }
-
-              return info;
+              return {
+                ...info,
+                cpuHistory: history,
+                cpuColourHistory: history.map(() => colour)
+              };
             });
           });
 
           this.setState({
-            nodeInfo: mappedInfo,
-            pending: pending,
-            running: running,
-
+            nodeInfo: nodeInfo
           });
 
-          this.scheduleNextUpdate();
+          this.subscribeActivity();
         },
         (error) => {
-          this.setState({
-            last_fetch_error: true
-          });
-          this.scheduleNextUpdate();;
+          this.subscribeActivity();
         }
       );
   }
 
+  // subscribe to the activity pushed by the server. Changes to the activity
+  // are merged into the last state, which is shown at every tick. Falls back
+  // to polling if the browser or the server doesn't support events
+  subscribeActivity() {
+    if (typeof EventSource == 'undefined') {
+      this.scheduleNextUpdate();
+      return;
+    }
+
+    var activity = null;
+    var received = false;
+
+    const source = new EventSource(event_url);
+
+    source.addEventListener('activity', (event) => {
+      received = true;
+      activity = Object.assign({}, activity, JSON.parse(event.data));
+    });
+
+    source.addEventListener('tick', (event) => {
+      received = true;
+
+      if (activity !== null) {
+        const tick = JSON.parse(event.data);
+        this.updateActivity(Object.assign({}, activity, {
+          time: tick.time
+        }));
+      }
+    });
+
+    source.onerror = (error) => {
+      this.setState({
+        last_fetch_error: true
+      });
+
+      // the browser reconnects by itself, unless events never worked
+      if (!received) {
+        source.close();
+        this.scheduleNextUpdate();
+      }
+    };
+  }
+
+  updateActivity(result) {
+    this.setState({
+      last_fetch: this.formatUnixEpoch(result.time),
+      last_fetch_error: false,
+    });
+
+    const running = result.running.map((job) => colourJob(job));
+    const pending = result.pending.map((job) => colourJob(job));
+    const job_map = this.buildJobMap(running);
+
+    // map the cpu activity to each core
+    const mappedInfo = this.state.clusterLayout.map((rows,
+      row_idx) => {
+      return rows.map((node_id, col_idx) => {
+        var info = this.state.nodeInfo[row_idx][col_idx];
+        info.node_id = node_id;
+
+        const job = colourJob(job_map[node_id]);
+
+        const temp = result.temp_percent[node_id];
+
+        info.temp = temp;
+
+        info.job = job;
+        info.cpuHistory.push(result.cpu_usage[node_id]);
+        info.cpuColourHistory.push(job.colour);
+
+        // limit length to this.state.cpuHistoryMax
+        const start = info.cpuHistory.length - this.state
+          .cpuHistoryMax;
+        const end = info.cpuHistory.length;
+
+        if (start >= 0) {
+          info.cpuHistory = info.cpuHistory.slice(start, end);
+          info.cpuColourHistory = info.cpuColourHistory.slice(
+            start,
+            end);
+        }
+
+        return info;
+      });
+    });
+
+    this.setState({
+      nodeInfo: mappedInfo,
+      pending: pending,
+      running: running,
+
+    });
+  }
+
   formatUnixEpoch(epoch) {
     const date = new Date(epoch * 1000);
     return date.getHours() + ":" + date.getMinutes() + ":" + date
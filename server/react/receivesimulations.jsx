@@ -45,6 +45,16 @@ function colourJob(job) {
     }
 }
 
+// URL of a file of the simulation, versioned by the server if it can
+// be cached for good
+function assetUrl(job, filename) {
+    if (job.assets && job.assets[filename]) {
+        return job.assets[filename];
+    }
+
+    return "simulations/" + job.id + "/" + filename;
+}
+
 // set the default job attributes
 //colour: defaultAvatarColour
 
@@ -52,4 +62,4 @@ function colourJob(job) {
 // set the (avatar) colour for this job
 
 
-export { colourJob }
+export { colourJob, assetUrl }
@@ -2,7 +2,8 @@ import React from 'react';
 import ReactDOM from 'react-dom';
 
 import {
-  colourJob
+  colourJob,
+  assetUrl
 } from './receivesimulations.jsx'
 
 import {
@@ -30,11 +31,10 @@ function SimulationViewer(props) {
   } else {
     const sim = props.currentSimulation
 
-    const dir = "simulations/" + sim.id + "/"
-    const img_rgb = dir + "rgb_with_contour.png"
-    const img_depth = dir + "depth.png"
-    const img_res1 = dir + "left.gif"
-    const img_res2 = dir + "right.gif"
+    const img_rgb = assetUrl(sim, "rgb_with_contour.png")
+    const img_depth = assetUrl(sim, "depth.png")
+    const img_res1 = assetUrl(sim, "left.gif")
+    const img_res2 = assetUrl(sim, "right.gif")
 
     const colour = sim.colour
 
@@ -104,8 +104,44 @@ class Layout extends React.Component {
   fetchRecentSimulations() {
     this.simulationFetcher("/simulations/recent/10", 'recentSimulations');
   }
-  componentDidMount() {
+  // subscribe to the lists pushed by the server whenever they change. Falls
+  // back to polling if the browser or the server doesn't support events
+  subscribeSimulations() {
+    if (typeof EventSource == 'undefined') {
       this.scheduleNextUpdate();
+      return;
+    }
+
+    var received = false;
+
+    const source = new EventSource("/events?channels=min_drag,recent");
+
+    const listener = (target) => (event) => {
+      received = true;
+
+      var state = {};
+      state[target] = JSON.parse(event.data).map((job) => colourJob(job));
+
+      this.setState(state);
+    };
+
+    source.addEventListener('min_drag', listener('bestSimulations'));
+    source.addEventListener('recent', listener('recentSimulations'));
+    source.addEventListener('tick', (event) => {
+      received = true;
+    });
+
+    source.onerror = (error) => {
+      // the browser reconnects by itself, unless events never worked
+      if (!received) {
+        source.close();
+        this.scheduleNextUpdate();
+      }
+    };
+  }
+
+  componentDidMount() {
+      this.subscribeSimulations();
   }
 
   simulationChoiceHandler(sim) {
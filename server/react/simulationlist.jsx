@@ -5,6 +5,10 @@ import {
   Avatar
 } from './avatar.jsx'
 
+import {
+  assetUrl
+} from './receivesimulations.jsx'
+
 import css from '../assets/styles/simulation-list.sass'
 
 function SimulationList(props) {
@@ -44,17 +48,13 @@ function SimulationView(props) {
   if (simulation == undefined) {
     return null;
   } else {
-    const sim_id = simulation['id'];
-
     var rgb_url = "static/sim-image-loading.gif";
     var depth_url = "static/sim-image-loading.gif";
     var image_class = ""
 
     if (simulation['images-available']) {
-      rgb_url = "simulations/" + sim_id +
-        "/rgb_with_contour.png";
-      depth_url = "simulations/" + sim_id +
-        "/depth.png";
+      rgb_url = assetUrl(simulation, "rgb_with_contour.png");
+      depth_url = assetUrl(simulation, "depth.png");
     } else {
       image_class = " loading";
     }
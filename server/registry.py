@@ -0,0 +1,303 @@
+import os
+import bisect
+import heapq
+import threading
+import time
+from itertools import islice
+
+# inotify is used to notice changes made on the server machine as soon as they
+# happen. It doesn't see writes made by other NFS clients (i.e. the compute
+# nodes), so the mtime poller always runs as well.
+try:
+    import inotify_simple
+except ImportError:
+    inotify_simple = None
+
+
+class RegistryEntry:
+    def __init__(self, stamp, status, sim, settled):
+        self.stamp = stamp
+        self.status = status
+        self.sim = sim
+        self.settled = settled
+
+
+class SimulationRegistry:
+    """
+    In-memory registry of every simulation in the store, kept up to date by a
+    background thread.
+
+    `loader(sim_id)` reads a simulation from disk and returns a tuple
+    (status, simulation dict, settled), where status is None if the simulation
+    has not been created yet, and settled is True if the simulation is not
+    expected to change again. Unsettled simulations are checked for changes
+    every `poll_interval` seconds, and all simulations every
+    `full_scan_interval` seconds.
+
+    `on_change(sim_ids)` is called from the watcher thread with the IDs of
+    simulations that have changed. `version` is incremented on every change.
+
+    The IDs of each status are kept sorted, so that pages of IDs (see `ids`)
+    don't scan the whole registry.
+    """
+
+    def __init__(self,
+                 store_dir,
+                 loader,
+                 poll_interval=2,
+                 full_scan_interval=60,
+                 on_change=None,
+                 use_inotify=True):
+        self.store_dir = store_dir
+        self.loader = loader
+        self.poll_interval = poll_interval
+        self.full_scan_interval = full_scan_interval
+        self.on_change = on_change
+        self.use_inotify = use_inotify and inotify_simple is not None
+
+        self.entries = {}
+        self.ids_by_status = {}
+        self.dirty = set()
+        self.store_stamp = None
+        self.version = 0
+        self.lock = threading.RLock()
+        self.wakeup = threading.Event()
+        self.stopped = False
+
+    ######################################
+    ## Disk state
+    ######################################
+
+    def _stamp(self, sim_id):
+        """
+        Returns a value which changes when files in the run directory are
+        created, removed or renamed, or when the drag file is rewritten
+        """
+        directory = os.path.join(self.store_dir, str(sim_id))
+
+        try:
+            dir_mtime = os.stat(directory).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+        try:
+            drag_mtime = os.stat(os.path.join(directory, 'drag.txt')).st_mtime_ns
+        except FileNotFoundError:
+            drag_mtime = None
+
+        return (dir_mtime, drag_mtime)
+
+    @staticmethod
+    def _newer(stamp, entry):
+        # loads racing between the watcher and request threads: an older load
+        # must not replace a newer one
+        if entry is None:
+            return True
+
+        def key(s):
+            return (s[0], s[1] if s[1] is not None else -1)
+
+        return key(stamp) >= key(entry.stamp)
+
+    def _index(self, sim_id, old, new):
+        if old is not None and old.status is not None:
+            ids = self.ids_by_status[old.status]
+            del ids[bisect.bisect_left(ids, sim_id)]
+
+        if new is not None and new.status is not None:
+            bisect.insort(self.ids_by_status.setdefault(new.status, []), sim_id)
+
+    def _list_ids(self):
+        return [
+            int(name) for name in os.listdir(self.store_dir) if name.isdigit()
+        ]
+
+    def _load(self, sim_id, stamp=None):
+        if stamp is None:
+            stamp = self._stamp(sim_id)
+
+        if stamp is None:
+            entry = None
+        else:
+            status, sim, settled = self.loader(sim_id)
+            entry = RegistryEntry(stamp, status, sim, settled)
+
+        with self.lock:
+            current = self.entries.get(sim_id)
+
+            if entry is not None:
+                if not self._newer(stamp, current):
+                    return current
+
+                self.entries[sim_id] = entry
+                self._index(sim_id, current, entry)
+                self.version += 1
+            elif current is not None:
+                del self.entries[sim_id]
+                self._index(sim_id, current, None)
+                self.version += 1
+
+        return entry
+
+    ######################################
+    ## Watching
+    ######################################
+
+    def scan(self, full=False):
+        """
+        Checks the store for new, changed and removed simulations and reloads
+        them. Only unsettled and dirty simulations are checked unless `full`.
+        Returns the list of IDs that changed.
+        """
+        changed = []
+
+        with self.lock:
+            dirty = self.dirty
+            self.dirty = set()
+            known = dict(self.entries)
+
+        ids = set(known.keys()) | dirty
+
+        store_stamp = os.stat(self.store_dir).st_mtime_ns
+        if full or store_stamp != self.store_stamp:
+            ids |= set(self._list_ids())
+            self.store_stamp = store_stamp
+
+        for sim_id in ids:
+            entry = known.get(sim_id)
+
+            if entry is not None and entry.settled and not full and sim_id not in dirty:
+                continue
+
+            stamp = self._stamp(sim_id)
+
+            if entry is not None and stamp == entry.stamp and sim_id not in dirty:
+                continue
+
+            if entry is None and stamp is None:
+                continue
+
+            self._load(sim_id, stamp)
+            changed.append(sim_id)
+
+        if changed and self.on_change is not None:
+            self.on_change(changed)
+
+        return changed
+
+    def _poll(self):
+        last_full = time.time()
+
+        while not self.stopped:
+            self.wakeup.wait(self.poll_interval)
+            self.wakeup.clear()
+
+            full = time.time() - last_full > self.full_scan_interval
+            if full:
+                last_full = time.time()
+
+            try:
+                self.scan(full)
+            except Exception:
+                import traceback
+                traceback.print_exc()
+
+    def _watch_inotify(self):
+        flags = inotify_simple.flags
+        sim_mask = flags.CREATE | flags.DELETE | flags.MOVED_TO | flags.CLOSE_WRITE | flags.ATTRIB
+
+        inotify = inotify_simple.INotify()
+        watches = {inotify.add_watch(self.store_dir, flags.CREATE | flags.MOVED_TO): None}
+
+        def watch_sim(sim_id):
+            path = os.path.join(self.store_dir, str(sim_id))
+            try:
+                watches[inotify.add_watch(path, sim_mask)] = sim_id
+            except OSError:
+                pass
+
+        for sim_id in self._list_ids():
+            watch_sim(sim_id)
+
+        while not self.stopped:
+            for event in inotify.read(timeout=1000):
+                sim_id = watches.get(event.wd)
+
+                if sim_id is None:
+                    if not event.name.isdigit():
+                        continue
+                    sim_id = int(event.name)
+                    watch_sim(sim_id)
+
+                with self.lock:
+                    self.dirty.add(sim_id)
+
+                self.wakeup.set()
+
+    def start(self):
+        """
+        Loads every simulation in the store and starts watching for changes
+        """
+        self.scan(full=True)
+
+        threads = [threading.Thread(target=self._poll, daemon=True)]
+
+        if self.use_inotify:
+            threads.append(threading.Thread(target=self._watch_inotify, daemon=True))
+
+        for thread in threads:
+            thread.start()
+
+    def stop(self):
+        self.stopped = True
+        self.wakeup.set()
+
+    ######################################
+    ## Queries
+    ######################################
+
+    def invalidate(self, sim_id):
+        """
+        Reload a simulation, e.g. after it has been changed by the server itself
+        """
+        self._load(int(sim_id))
+
+    def get(self, sim_id):
+        """
+        Returns a copy of the simulation dict, or None if the simulation doesn't
+        exist or hasn't been created
+        """
+        with self.lock:
+            entry = self.entries.get(sim_id)
+
+        if entry is None:
+            # may have been created since the last scan
+            entry = self._load(sim_id)
+
+        if entry is None or entry.sim is None:
+            return None
+
+        return dict(entry.sim)
+
+    def ids(self, statuses=None, limit=None, before=None):
+        """
+        Returns IDs of created simulations, highest first, optionally restricted
+        to a list of `statuses`, to IDs below `before` and to `limit` items
+        """
+        with self.lock:
+            if statuses is None:
+                statuses = list(self.ids_by_status)
+
+            # the IDs below `before` of each status, highest first
+            lists = []
+
+            def descending(ids):
+                end = bisect.bisect_left(ids, before) if before is not None else len(ids)
+                return (ids[i] for i in range(end - 1, -1, -1))
+
+            for status in set(statuses):
+                lists.append(descending(self.ids_by_status.get(status, [])))
+
+            merged = heapq.merge(*lists, reverse=True)
+
+            return list(islice(merged, limit))
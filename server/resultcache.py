@@ -0,0 +1,155 @@
+import os
+import json
+import glob
+import shutil
+import threading
+from contextlib import contextmanager
+
+import utils
+
+
+class ResultCache:
+    """
+    Content-addressed store of simulation results. Each entry is a directory
+    named by a key (the hash of the simulation inputs), holding the result
+    files and a meta.json. At most `max_entries` are kept, evicting the least
+    recently used. Entries are restored by the server and stored and evicted
+    by the runs, so restoring and evicting hold a lock file in the cache
+    directory.
+    """
+
+    META_FILENAME = 'meta.json'
+    LOCK_FILENAME = '.lock'
+
+    def __init__(self, directory, max_entries):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+
+        utils.ensure_exists(directory)
+
+    def entry_directory(self, key):
+        return os.path.join(self.directory, key)
+
+    @contextmanager
+    def locked(self):
+        """
+        Holds the lock of the cache directory, both between threads and
+        between processes, for the duration of a with block
+        """
+        with self.lock:
+            with utils.file_lock(
+                    os.path.join(self.directory, self.LOCK_FILENAME)):
+                yield
+
+    def lookup(self, key):
+        """
+        Returns the meta data stored with `key`, or None if not cached
+        """
+        meta_file = os.path.join(self.entry_directory(key), self.META_FILENAME)
+
+        try:
+            with open(meta_file) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def restore(self, key, destination):
+        """
+        Links (or copies, if linking isn't possible) the files stored with `key`
+        into `destination` and marks the entry as recently used. Returns the
+        meta data, or None if not cached.
+        """
+        with self.locked():
+            meta = self.lookup(key)
+
+            if meta is None:
+                return None
+
+            entry_dir = self.entry_directory(key)
+            restored = []
+
+            try:
+                for filename in meta['files']:
+                    self._restore_file(entry_dir, destination, filename)
+                    restored.append(filename)
+
+                # the entry directory mtime records when it was last used
+                os.utime(entry_dir)
+            except FileNotFoundError:
+                # removed outside of the cache, so treat it as a miss
+                print('result cache entry {key} is incomplete'.format(key=key))
+
+                for filename in restored:
+                    os.remove(os.path.join(destination, filename))
+
+                return None
+
+        return meta
+
+    def _restore_file(self, entry_dir, destination, filename):
+        source = os.path.join(entry_dir, filename)
+        target = os.path.join(destination, filename)
+
+        if os.path.exists(target):
+            os.remove(target)
+
+        try:
+            os.link(source, target)
+        except FileNotFoundError:
+            raise
+        except OSError:
+            shutil.copy(source, target)
+
+    def store(self, key, source, patterns, meta):
+        """
+        Stores the files in `source` matching the glob `patterns` under `key`,
+        along with the dict `meta`. Existing entries are left as they are.
+        """
+        entry_dir = self.entry_directory(key)
+
+        if os.path.isdir(entry_dir):
+            return
+
+        filenames = sorted(
+            set(
+                os.path.basename(path) for pattern in patterns
+                for path in glob.glob(os.path.join(source, pattern))))
+
+        entry_tmp = entry_dir + '.tmp{pid}'.format(pid=os.getpid())
+        utils.ensure_exists(entry_tmp)
+
+        for filename in filenames:
+            shutil.copy(os.path.join(source, filename), entry_tmp)
+
+        meta = dict(meta, files=filenames)
+
+        with open(os.path.join(entry_tmp, self.META_FILENAME), 'w') as f:
+            json.dump(meta, f)
+
+        try:
+            os.rename(entry_tmp, entry_dir)
+        except OSError:
+            # stored by another run in the meantime
+            shutil.rmtree(entry_tmp)
+
+        self.evict()
+
+    def evict(self):
+        """
+        Removes the least recently used entries beyond `max_entries`
+        """
+        with self.locked():
+            entries = [
+                os.path.join(self.directory, name)
+                for name in os.listdir(self.directory)
+                if '.tmp' not in name and name != self.LOCK_FILENAME
+            ]
+
+            if len(entries) <= self.max_entries:
+                return
+
+            entries.sort(key=os.path.getmtime)
+
+            for entry_dir in entries[:len(entries) - self.max_entries]:
+                shutil.rmtree(entry_dir, ignore_errors=True)
@@ -0,0 +1,257 @@
+import os
+import json
+import threading
+
+import numpy as np
+
+import utils
+import vtkreader
+
+######################################
+## Package variables
+######################################
+
+# The container is a set of .npy files next to the VTK files of a run, which
+# can be memory-mapped. The files are flat in the run directory, so that the
+# result cache can store them like the other result files.
+ARRAY_FILES = {
+    'points': 'fields-points.npy',
+    'cells': 'fields-cells.npy',
+    'procid': 'fields-procid.npy',
+    'pressure': 'fields-pressure.npy',
+    'velocity': 'fields-velocity.npy',
+}
+
+# Written last: the container is complete once it exists
+META_FILE = 'fields.json'
+
+FORMAT_VERSION = 1
+
+######################################
+## Container
+######################################
+
+
+class ResultFields:
+    """
+    The fields of a run, read from the container in `directory`.
+
+    The mesh is stored once: `points` (npoints, 3) float64, `cells` (ncells, 3)
+    int32 and, for parallel runs, the partition of each cell `procid`. The
+    pressure (npoints, ) and velocity (npoints, 2) of each timestep are
+    float32, and are only read from disk when used.
+    """
+
+    def __init__(self, directory):
+        with open(os.path.join(directory, META_FILE)) as f:
+            meta = json.load(f)
+
+        if meta['version'] != FORMAT_VERSION:
+            raise ValueError('{directory}: unsupported fields version {version}'.format(
+                directory=directory, version=meta['version']))
+
+        self.directory = directory
+        self.timesteps = meta['timesteps']
+        self.nprocs = meta['nprocs']
+
+        def load(name):
+            return np.load(os.path.join(directory, ARRAY_FILES[name]), mmap_mode='r')
+
+        self.points = load('points')
+        self.cells = load('cells')
+        self.procid = load('procid') if meta['nprocs'] > 1 else None
+        self._pressure = load('pressure')
+        self._velocity = load('velocity')
+
+        self._rows = {timestep: row for row, timestep in enumerate(self.timesteps)}
+
+    def __contains__(self, timestep):
+        return timestep in self._rows
+
+    def pressure(self, timestep):
+        return self._pressure[self._rows[timestep]]
+
+    def velocity(self, timestep):
+        return self._velocity[self._rows[timestep]]
+
+
+def write_fields(directory, timesteps, points, cells, pressure, velocity, procid=None):
+    """
+    Writes a container with the mesh `points` and `cells`, and the `pressure`
+    (ntimesteps, npoints) and `velocity` (ntimesteps, npoints, 2) of the
+    `timesteps`
+    """
+    meta_file = os.path.join(directory, META_FILE)
+
+    if os.path.exists(meta_file):
+        os.remove(meta_file)
+
+    arrays = {
+        'points': np.asarray(points, dtype=np.float64),
+        'cells': np.asarray(cells, dtype=np.int32),
+        'pressure': np.asarray(pressure, dtype=np.float32),
+        'velocity': np.asarray(velocity, dtype=np.float32),
+    }
+
+    if procid is not None:
+        arrays['procid'] = np.asarray(procid, dtype=np.int32)
+    elif os.path.exists(os.path.join(directory, ARRAY_FILES['procid'])):
+        os.remove(os.path.join(directory, ARRAY_FILES['procid']))
+
+    for name, array in arrays.items():
+        np.save(os.path.join(directory, ARRAY_FILES[name]), array)
+
+    nprocs = len(np.unique(procid)) if procid is not None else 1
+
+    utils.atomic_write(
+        meta_file,
+        json.dumps({
+            'version': FORMAT_VERSION,
+            'timesteps': [int(t) for t in timesteps],
+            'nprocs': int(nprocs),
+        }))
+
+
+######################################
+## Conversion from VTK
+######################################
+
+
+def vtk_filename(directory, timestep):
+    return os.path.join(directory, 'elmeroutput{timestep:04}.vtk'.format(timestep=timestep))
+
+
+def convert_vtk(directory, timesteps):
+    """
+    Converts the VTK files of the `timesteps` found in `directory` to a
+    container, and returns it. The mesh is read from the first file, and must
+    be the same in the others.
+    """
+    timesteps = [t for t in timesteps if os.path.isfile(vtk_filename(directory, t))]
+
+    # the container of a previous run in the directory is out of date
+    if os.path.exists(os.path.join(directory, META_FILE)):
+        os.remove(os.path.join(directory, META_FILE))
+
+    if not timesteps:
+        raise FileNotFoundError('{directory}: no VTK files'.format(directory=directory))
+
+    mesh = None
+
+    for row, timestep in enumerate(timesteps):
+        grid = vtkreader.read_vtk(vtk_filename(directory, timestep))
+
+        if mesh is None:
+            mesh = grid
+            pressure = np.zeros((len(timesteps), len(grid.points)), dtype=np.float32)
+            velocity = np.zeros((len(timesteps), len(grid.points), 2), dtype=np.float32)
+
+        elif not (np.array_equal(grid.points, mesh.points)
+                  and np.array_equal(grid.cells, mesh.cells)):
+            raise ValueError('{filename}: the mesh differs from the first timestep'.format(
+                filename=vtk_filename(directory, timestep)))
+
+        pressure[row] = grid.point_data['pressure']
+        velocity[row] = grid.point_data['velocity'][:, :2]
+
+    write_fields(directory, timesteps, mesh.points, mesh.cells, pressure, velocity,
+                 mesh.cell_data.get('procid'))
+
+    return ResultFields(directory)
+
+
+def load_fields(directory, timesteps):
+    """
+    Returns the container of the run in `directory`, converted from its VTK
+    files if there is none yet (e.g. results cached before it existed), or
+    None if the run has no results or its VTK files can't be read
+    """
+    if os.path.isfile(os.path.join(directory, META_FILE)):
+        return ResultFields(directory)
+
+    try:
+        return convert_vtk(directory, timesteps)
+    except FileNotFoundError:
+        return None
+    except (ValueError, KeyError) as e:
+        print('{directory}: failed to read the VTK files: {error}'.format(
+            directory=directory, error=repr(e)))
+        return None
+
+
+######################################
+## In-process store
+######################################
+
+
+class TimestepFields:
+    """
+    The mesh and the fields of one timestep, in memory
+    """
+
+    def __init__(self, points, cells, pressure, velocity):
+        self.points = points
+        self.cells = cells
+        self.pressure = pressure
+        self.velocity = velocity
+
+
+class FieldStore:
+    """
+    Fields of runs kept in memory by (sim_id, timestep), so that the stages of
+    a run (the GIFs, the drag) share them. The container of a run (converted
+    from its VTK files if needed, see `load_fields`) is opened on first use,
+    its mesh is read once, and each timestep once. `release(sim_id)` frees
+    them when the run is done.
+    """
+
+    def __init__(self, run_directory, timesteps):
+        self.run_directory = run_directory
+        self.timesteps = list(timesteps)
+
+        # the container (None without results) and the mesh of each run, and
+        # the TimestepFields by (sim_id, timestep)
+        self.containers = {}
+        self.meshes = {}
+        self.entries = {}
+        self.lock = threading.Lock()
+
+    def _container(self, sim_id):
+        if sim_id not in self.containers:
+            fields = load_fields(self.run_directory(sim_id), self.timesteps)
+            self.containers[sim_id] = fields
+
+            if fields is not None:
+                self.meshes[sim_id] = (np.array(fields.points), np.array(fields.cells))
+
+        return self.containers[sim_id]
+
+    def get(self, sim_id, timestep):
+        """
+        Returns the TimestepFields of the timestep of the run, or None if the
+        run has no results for it
+        """
+        with self.lock:
+            key = (sim_id, timestep)
+
+            if key not in self.entries:
+                fields = self._container(sim_id)
+
+                if fields is None or timestep not in fields:
+                    return None
+
+                points, cells = self.meshes[sim_id]
+
+                self.entries[key] = TimestepFields(points, cells,
+                                                   np.array(fields.pressure(timestep)),
+                                                   np.array(fields.velocity(timestep)))
+
+            return self.entries[key]
+
+    def release(self, sim_id):
+        with self.lock:
+            self.containers.pop(sim_id, None)
+            self.meshes.pop(sim_id, None)
+
+            for key in [key for key in self.entries if key[0] == sim_id]:
+                del self.entries[key]
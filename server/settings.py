@@ -41,6 +41,87 @@ cores_per_node = 4
 
 nodes_per_job = 1
 
+# The load of each node is read from the files in `usage_info_dir` (lines of
+# "<ip> <cpu> <temperature>", written by another process) every
+# `telemetry_interval` seconds. The last `telemetry_history_size` samples
+# are kept in memory. A node not updated for `telemetry_stale_after` seconds
+# (e.g. it's down) has no values until it's updated again.
+usage_info_dir = '~/cluster-load/info'
+telemetry_interval = 1
+telemetry_history_size = 600
+telemetry_stale_after = 5
+
+# The samples are also stored in `metrics_dir` at resolutions of 1s, 10s and
+# 1min, each kept for the given number of days. /cluster/history returns at
+# most `metrics_max_points` points.
+metrics_dir = '{root_dir}/metrics'
+metrics_retention = {1: 2, 10: 14, 60: 365}
+metrics_max_points = 2000
+
+# Where simulations are run: 'slurm' submits templates/slurm.batch with
+# sbatch, 'local' runs cfd/runcfd.py on this machine, at most
+# `local_max_jobs` at a time with `local_cores_per_job` processes each
+scheduler = 'slurm'
+local_max_jobs = 2
+local_cores_per_job = 1
+
+# Results are cached by outline, and a simulation with the same outline as a
+# cached one reuses its results instead of being run on the cluster (only its
+# images are rendered, with the local scheduler). At most
+# `result_cache_max_entries` results are kept, the least recently used are
+# evicted first.
+result_cache_enabled = True
+result_cache_dir = '{root_dir}/result-cache'
+result_cache_max_entries = 500
+
+# How long a run reusing a cached result waits for the client to upload its
+# photos before rendering without them
+result_cache_upload_wait = 60
+
+# Simulations are submitted by a background worker. A failed submission is
+# retried `submission_retries` times, waiting `submission_retry_delay` seconds
+# times the attempt number in between.
+submission_retries = 3
+submission_retry_delay = 5
+
+######################################################################
+# Simulation store settings                                          #
+######################################################################
+
+# Number of lowest drag simulations kept in the leaderboard index. This
+# bounds the number of simulations /simulations/min_drag/<n> can return.
+leaderboard_size = 100
+
+# Finished simulations older than `archive_after_days` are packed into
+# bundles in `archive_dir` by archive.py, keeping only the files the
+# dashboard needs in the simulation store
+archive_dir = '{root_dir}/archive'
+archive_after_days = 14
+
+# Memory budget (in bytes of pickle files) for the cache of loaded
+# simulation data files
+pickle_cache_bytes = 64 * 1024 * 1024
+
+# The registry keeps every simulation in memory. Simulations that may still
+# change are checked every `registry_poll_interval` seconds, and the whole
+# store every `registry_full_scan_interval` seconds. inotify is used as well
+# if the inotify_simple module is installed.
+registry_poll_interval = 2
+registry_full_scan_interval = 60
+registry_use_inotify = True
+
+# Dashboards subscribed to /events are sent changes every `events_interval`
+# seconds, with the `events_list_size` best and most recent simulations
+events_interval = 1
+events_list_size = 10
+
+# Number of simulations in each page of /simulations, by default and at most
+simulations_page_size = 50
+simulations_page_max = 500
+
+# Largest chunk accepted by resumable uploads, in bytes
+upload_max_chunk = 4 * 1024 * 1024
+
 root_dir = os.path.dirname(os.path.abspath(__file__)).replace('/nfs/nodeimg','')
 
 cfdcommand = "python3 " + root_dir + "/cfd/runcfd.py {id} {ncores} {hostfile} 2>{output}.err >> {output}"
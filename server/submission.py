@@ -0,0 +1,108 @@
+import queue
+import threading
+import time
+import traceback
+
+
+class SubmissionWorker:
+    """
+    Submits simulations to the queue manager from a background thread, so
+    that requests don't wait for the submission round trip.
+
+    `submit(sim_ids)` submits a batch of simulations in one go and returns the
+    IDs whose submission failed (an exception fails the whole batch). Failed
+    submissions are retried up to `retries` times, `retry_delay` seconds
+    (multiplied by the attempt number) later. Retries are scheduled by
+    deadline, so the worker keeps submitting new simulations in the meantime.
+    `on_failed(sim_id)` is called if a submission fails every attempt.
+    """
+
+    def __init__(self, submit, retries=3, retry_delay=5, on_failed=None):
+        self.submit = submit
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.on_failed = on_failed
+        self.queue = queue.Queue()
+        self.thread = None
+
+        # failed submissions by sim_id: (attempts, time of the next attempt)
+        self.retrying = {}
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def enqueue(self, sim_id):
+        self.queue.put(sim_id)
+
+    def pending(self):
+        return self.queue.qsize() + len(self.retrying)
+
+    def _next_batch(self, timeout):
+        """
+        Waits up to `timeout` seconds (forever if None) for a submission, then
+        takes any others queued in the meantime. Returns an empty list if none
+        arrived in time.
+        """
+        try:
+            batch = [self.queue.get(timeout=timeout)]
+        except queue.Empty:
+            return []
+
+        while True:
+            try:
+                batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                return batch
+
+    def _timeout(self):
+        """
+        Returns the seconds until the next retry is due, or None if there are
+        no retries
+        """
+        if not self.retrying:
+            return None
+
+        deadline = min(deadline for _, deadline in self.retrying.values())
+
+        return max(0, deadline - time.time())
+
+    def _submit(self, batch):
+        try:
+            return set(self.submit(batch))
+        except Exception:
+            traceback.print_exc()
+            return set(batch)
+
+    def _run(self):
+        while True:
+            batch = self._next_batch(self._timeout())
+
+            now = time.time()
+
+            for sim_id, (_, deadline) in self.retrying.items():
+                if deadline <= now and sim_id not in batch:
+                    batch.append(sim_id)
+
+            if not batch:
+                continue
+
+            failed = self._submit(batch)
+
+            for sim_id in batch:
+                attempts, _ = self.retrying.pop(sim_id, (0, None))
+
+                if sim_id not in failed:
+                    continue
+
+                attempts += 1
+
+                print('submission of simulation {sim_id} failed (attempt {n})'.
+                      format(sim_id=sim_id, n=attempts))
+
+                if attempts > self.retries:
+                    if self.on_failed is not None:
+                        self.on_failed(sim_id)
+                else:
+                    self.retrying[sim_id] = (attempts, time.time() +
+                                             self.retry_delay * attempts)
@@ -0,0 +1,230 @@
+import os
+import time
+import threading
+from collections import deque
+
+import numpy as np
+
+
+def parse_usage(text, prefix='10.0.0.'):
+    """
+    Returns {node: (cpu, temperature)} from lines of "<node> <cpu> <temp>".
+    Malformed lines, e.g. the end of a file being rewritten, are skipped.
+    """
+    usage = {}
+
+    for line in text.splitlines():
+        parts = line.split()
+
+        if len(parts) < 3 or not parts[0].startswith(prefix):
+            continue
+
+        try:
+            usage[parts[0]] = (float(parts[1]), float(parts[2]))
+        except ValueError:
+            continue
+
+    return usage
+
+
+class TelemetryCollector:
+    """
+    Reads the load of the cluster nodes from the files in `info_dir` (written
+    by another process, one line per node) every `interval` seconds, and keeps
+    the last `history_size` samples of each node in ring buffers.
+
+    The nodes are those of `nodes`, plus any other node found in the files.
+    A node missing from a sample (e.g. its file is being rewritten) keeps its
+    last values for up to `stale_after` seconds (by default 5 intervals), after
+    which it has no values until it's read again. Files not modified for
+    `stale_after` seconds are ignored, as the process writing them has
+    stopped. `version` is incremented whenever the current values change.
+
+    The thread calls `on_sample(time, {node: (cpu, temperature)})` after each
+    sample.
+    """
+
+    def __init__(self, info_dir, nodes, interval, history_size, max_temp,
+                 on_sample=None, stale_after=None):
+        self.info_dir = info_dir
+        self.on_sample = on_sample
+        self.interval = interval
+        self.stale_after = 5 * interval if stale_after is None else stale_after
+        self.history_size = history_size
+        self.max_temp = max_temp
+
+        self.times = deque(maxlen=history_size)
+        self.cpu = {}
+        self.temp = {}
+        self.latest = {}
+
+        # time each node was last read from a file
+        self.seen = {}
+
+        for node in nodes:
+            self._add_node(node)
+
+        self.version = 0
+        self.samples = 0
+        self.latest_time = None
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def _add_node(self, node):
+        # aligned with self.times, padded for the samples before it was seen
+        padding = [None] * len(self.times)
+
+        self.cpu[node] = deque(padding, maxlen=self.history_size)
+        self.temp[node] = deque(padding, maxlen=self.history_size)
+
+    ######################################
+    ## Sampling
+    ######################################
+
+    def read(self):
+        """
+        Returns {node: (cpu, temperature)} from the files in `info_dir` which
+        have been modified in the last `stale_after` seconds
+        """
+        usage = {}
+        cutoff = time.time() - self.stale_after
+
+        try:
+            entries = sorted(os.listdir(self.info_dir))
+        except FileNotFoundError:
+            return usage
+
+        for entry in entries:
+            try:
+                with open(os.path.join(self.info_dir, entry)) as f:
+                    if os.fstat(f.fileno()).st_mtime < cutoff:
+                        continue
+
+                    usage.update(parse_usage(f.read()))
+            except (OSError, UnicodeDecodeError):
+                continue
+
+        return usage
+
+    def sample(self):
+        """
+        Reads the files and appends a sample to the history
+        """
+        usage = self.read()
+        now = time.time()
+
+        with self.lock:
+            for node in usage:
+                self.seen[node] = now
+
+            latest = {
+                node: values
+                for node, values in self.latest.items()
+                if now - self.seen[node] <= self.stale_after
+            }
+            latest.update(usage)
+
+            if latest != self.latest:
+                self.version += 1
+
+            self.latest = latest
+
+            for node in usage:
+                if node not in self.cpu:
+                    self._add_node(node)
+
+            self.times.append(now)
+            self.latest_time = self.times[-1]
+
+            for node in self.cpu:
+                cpu, temp = latest.get(node, (None, None))
+                self.cpu[node].append(cpu)
+                self.temp[node].append(temp)
+
+            self.samples += 1
+
+    def _run(self):
+        while True:
+            try:
+                self.sample()
+
+                if self.on_sample is not None:
+                    with self.lock:
+                        sample_time, latest = self.latest_time, dict(self.latest)
+
+                    self.on_sample(sample_time, latest)
+            except Exception as e:
+                print('telemetry sample failed: {error}'.format(error=repr(e)))
+
+            time.sleep(self.interval)
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._run, daemon=True)
+            self.thread.start()
+
+    def running(self):
+        return self.thread is not None
+
+    ######################################
+    ## Values
+    ######################################
+
+    def temp_percent(self, temp):
+        return int(temp * 100 / self.max_temp)
+
+    def current(self):
+        """
+        Returns the current cpu usage and temperature (in percent of the
+        maximum) of each node, as two dicts
+        """
+        with self.lock:
+            latest = dict(self.latest)
+
+        cpu_usage = {node: int(round(cpu)) for node, (cpu, temp) in latest.items()}
+        temp = {node: self.temp_percent(temp) for node, (cpu, temp) in latest.items()}
+
+        return cpu_usage, temp
+
+    def history(self, points):
+        """
+        Returns the history downsampled to at most `points` samples, as
+        {'time': [...], 'cpu_usage': {node: [...]}, 'temp_percent': {node: [...]}}.
+        Each point is the mean of the samples it covers, None if there were none.
+        """
+        with self.lock:
+            times = np.array(self.times, dtype=float)
+            cpu = {node: list(values) for node, values in self.cpu.items()}
+            temp = {node: list(values) for node, values in self.temp.items()}
+
+        buckets = min(points, len(times))
+
+        if buckets == 0:
+            return {
+                'time': [],
+                'cpu_usage': {node: [] for node in cpu},
+                'temp_percent': {node: [] for node in temp},
+            }
+
+        def downsample(values, scale=None):
+            values = np.array([np.nan if v is None else v for v in values], dtype=float)
+
+            result = []
+
+            for bucket in np.array_split(values, buckets):
+                if np.isnan(bucket).all():
+                    result.append(None)
+                else:
+                    mean = np.nanmean(bucket)
+                    result.append(int(round(mean)) if scale is None else scale(mean))
+
+            return result
+
+        return {
+            'time': [float(b.mean()) for b in np.array_split(times, buckets)],
+            'cpu_usage': {node: downsample(v) for node, v in cpu.items()},
+            'temp_percent': {
+                node: downsample(v, self.temp_percent)
+                for node, v in temp.items()
+            },
+        }
@@ -0,0 +1,53 @@
+import pytest
+import os, sys, time
+import gzip
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+import settings
+import model
+import catalog
+import archive
+
+
+@pytest.fixture
+def store(tmpdir, monkeypatch):
+    monkeypatch.setattr(settings, 'root_dir', str(tmpdir))
+    monkeypatch.setattr(settings, 'devel', True)
+
+    return model.simulation_store_directory()
+
+
+###############
+#### tests ####
+###############
+
+
+def test_archive_old_finished_simulations(store):
+    old_id = model.queue_simulation({'name': 'old', 'contour': np.arange(8)})
+    new_id = model.queue_simulation({'name': 'new', 'contour': np.arange(8) + 1})
+
+    for sim_id in [old_id, new_id]:
+        for filename in ['left.gif', 'elmeroutput0001.vtk']:
+            with open(model.sim_filepath(sim_id, filename), 'w') as f:
+                f.write(filename)
+
+        model.set_finished(sim_id)
+
+    catalog.update(old_id, finished_at=time.time() - 30 * 24 * 3600)
+
+    assert archive.archive_finished(days=14) == [old_id]
+
+    assert model.sim_check_file(old_id, 'left.gif')
+    assert not model.sim_check_file(old_id, 'elmeroutput0001.vtk')
+    assert model.sim_check_file(new_id, 'elmeroutput0001.vtk')
+
+    assert archive.read_archived(old_id, 'elmeroutput0001.vtk') == b'elmeroutput0001.vtk'
+    assert archive.read_archived(old_id, 'missing.vtk') is None
+
+    data = archive.read_archived_gzip(old_id, 'elmeroutput0001.vtk')
+    assert gzip.decompress(data) == b'elmeroutput0001.vtk'
+
+    # already archived simulations are skipped
+    assert archive.archive_finished(days=14) == []
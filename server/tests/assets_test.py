@@ -0,0 +1,90 @@
+import pytest
+import os, sys
+import gzip
+import zipfile
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+import settings
+import model
+import archive
+import main
+
+
+@pytest.fixture
+def client(tmpdir, monkeypatch):
+    monkeypatch.setattr(settings, 'root_dir', str(tmpdir))
+
+    return main.app.test_client()
+
+
+###############
+#### tests ####
+###############
+
+
+def test_versioned_assets_are_immutable(client):
+    with open(model.sim_filepath(1, 'left.gif'), 'wb') as f:
+        f.write(b'GIF89a' + bytes(range(200)))
+
+    url = '/' + main.assets.asset_urls(1, model.run_directory(1))['left.gif']
+
+    response = client.get(url)
+    assert response.status_code == 200
+    assert 'immutable' in response.headers['Cache-Control']
+    assert response.mimetype == 'image/gif'
+
+    etag = response.headers['ETag']
+
+    # without the version, the browser checks with the server
+    response = client.get('/simulations/1/left.gif', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.headers['Cache-Control'] == 'no-cache'
+
+    response = client.get(url, headers={'Range': 'bytes=0-5'})
+    assert response.status_code == 206
+    assert response.data == b'GIF89a'
+
+    assert client.get('/simulations/1/missing.gif').status_code == 404
+    assert client.get('/simulations/../settings.py').status_code == 404
+
+
+def test_archived_files_are_sent_compressed(client):
+    vtk = b'POINTS 3 float\n' * 100
+
+    with zipfile.ZipFile(archive.bundle_file(2), 'w', compression=zipfile.ZIP_DEFLATED) as z:
+        z.writestr('elmeroutput0001.vtk', vtk)
+
+    response = client.get('/simulations/2/elmeroutput0001.vtk',
+                          headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(response.data) == vtk
+
+    response = client.get('/simulations/2/elmeroutput0001.vtk')
+    assert 'Content-Encoding' not in response.headers
+    assert response.data == vtk
+
+
+def test_version_matches_the_file_served(client, monkeypatch):
+    path = model.sim_filepath(1, 'left.gif')
+
+    with open(path, 'wb') as f:
+        f.write(b'old')
+
+    old_version = main.assets.file_version(path)
+
+    def replace_then_open(filename, mode):
+        # the run writes a new image while the response is being built
+        with open(filename + 'tmp', 'wb') as new:
+            new.write(b'new image')
+        os.rename(filename + 'tmp', filename)
+
+        return open(filename, mode)
+
+    monkeypatch.setattr(main.assets, 'open', replace_then_open, raising=False)
+
+    response = client.get('/simulations/1/left.gif')
+
+    assert response.data == b'new image'
+    assert response.headers['ETag'] == '"{v}"'.format(v=main.assets.file_version(path))
+    assert response.headers['ETag'] != '"{v}"'.format(v=old_version)
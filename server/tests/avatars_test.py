@@ -0,0 +1,109 @@
+import pytest
+import os, sys
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+import settings
+import model
+from avatars import AvatarPool
+
+
+@pytest.fixture
+def store(tmpdir, monkeypatch):
+    monkeypatch.setattr(settings, 'root_dir', str(tmpdir))
+    monkeypatch.setattr(settings, 'devel', True)
+    monkeypatch.setattr(settings, 'result_cache_enabled', False)
+    monkeypatch.setattr(model, 'submission_worker', None)
+
+    return model.simulation_store_directory()
+
+###############
+#### tests ####
+###############
+
+
+def test_concurrent_reservations_are_unique(tmpdir):
+    pool = AvatarPool(str(tmpdir.join('avatars.json')), range(1, 26), lambda: [])
+    pool.rebuild({})
+
+    with ThreadPoolExecutor(8) as executor:
+        avatars = list(executor.map(pool.reserve, range(25)))
+
+    assert sorted(avatars) == list(range(1, 26))
+
+
+def test_hidden_simulations_release_avatars(tmpdir):
+    visible = [1, 2, 3]
+    pool = AvatarPool(str(tmpdir.join('avatars.json')), range(1, 4), lambda: visible)
+    pool.rebuild({})
+
+    assert sorted(pool.reserve(i) for i in visible) == [1, 2, 3]
+
+    # simulation 2 drops off the leaderboard
+    visible.remove(2)
+    avatar = pool.reserve(4)
+
+    assert pool.assigned[avatar] == [4]
+    assert sorted(sum(pool.assigned.values(), [])) == [1, 3, 4]
+
+
+def test_exhausted_pool_shares_without_stealing(tmpdir):
+    visible = [1, 2, 3, 4, 5]
+    pool = AvatarPool(str(tmpdir.join('avatars.json')), range(1, 3), lambda: visible)
+    pool.rebuild({})
+
+    avatars = [pool.reserve(i) for i in visible]
+
+    # every simulation keeps its avatar, and they are shared evenly
+    for sim_id, avatar in zip(visible, avatars):
+        assert sim_id in pool.assigned[avatar]
+
+    assert sorted(len(sim_ids) for sim_ids in pool.assigned.values()) == [2, 3]
+
+    # an avatar is only free once all of its simulations are hidden
+    shared = avatars[0]
+    for sim_id in pool.assigned[shared][1:]:
+        visible.remove(sim_id)
+
+    pool.release_hidden()
+    assert pool.assigned[shared] == [1]
+
+    visible.remove(1)
+    pool.release_hidden()
+    assert shared not in pool.assigned
+    assert pool.free == [shared]
+
+
+def test_rebuild_and_reload(tmpdir):
+    path = str(tmpdir.join('avatars.json'))
+    pool = AvatarPool(path, range(1, 4), lambda: [])
+    pool.rebuild({10: 1, 11: 1, 12: 2, 13: 7})
+
+    # another process reads the same assignments
+    other = AvatarPool(path, range(1, 4), lambda: [])
+    other._load()
+
+    assert other.assigned == {1: [10, 11], 2: [12]}
+    assert other.free == [3]
+
+
+
+def test_queued_simulation_keeps_its_avatar(store, monkeypatch):
+    pool = model.get_avatar_pool()
+    reserve = pool.reserve
+
+    # the registry watcher releases hidden avatars right after the reservation
+    def reserve_then_release(sim_id):
+        avatar = reserve(sim_id)
+        pool.release_hidden()
+        return avatar
+
+    monkeypatch.setattr(pool, 'reserve', reserve_then_release)
+
+    sim_id = model.queue_simulation({'name': 'new', 'contour': np.arange(8)})
+    avatar = model.catalog.get(sim_id)['avatar_id']
+
+    assert pool.assigned[avatar] == [sim_id]
+    assert avatar not in pool.free
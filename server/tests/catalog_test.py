@@ -0,0 +1,149 @@
+import pytest
+import os, sys
+import json
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+import settings
+import model
+import catalog
+
+
+@pytest.fixture
+def store(tmpdir, monkeypatch):
+    monkeypatch.setattr(settings, 'root_dir', str(tmpdir))
+
+    return model.simulation_store_directory()
+
+
+def make_sim(sim_id, flags, drag=None):
+    for flag in flags:
+        model.touch_file(sim_id, flag)
+
+    if drag is not None:
+        with open(model.drag_file(sim_id), 'w') as f:
+            f.write(str(drag))
+
+
+###############
+#### tests ####
+###############
+
+
+def test_rebuild_from_store(store):
+    make_sim(1, [model.STATUS_CREATED])
+    make_sim(2, [model.STATUS_CREATED, model.STATUS_STARTED])
+    make_sim(3, [model.STATUS_CREATED, model.STATUS_STARTED,
+                 model.STATUS_FINISHED], drag=12.5)
+    make_sim(4, [])
+
+    assert model.simulation_id_list() == [3, 2, 1]
+    assert model.queued_simulations() == [1]
+    assert model.running_simulations() == [2]
+    assert catalog.get(3)['drag'] == 12.5
+
+
+def test_sync_flags_written_outside_server(store):
+    make_sim(1, [model.STATUS_CREATED])
+    assert model.queued_simulations() == [1]
+
+    # the batch script touches the flags directly
+    make_sim(1, [model.STATUS_STARTED])
+    assert model.queued_simulations() == []
+    assert model.running_simulations() == [1]
+
+    make_sim(1, [model.STATUS_FINISHED])
+    assert model.running_simulations() == []
+
+    model.set_drag(1, 3.25)
+
+    drags, ids = model.all_drags()
+    assert list(drags) == [3.25]
+    assert list(ids) == [1]
+
+
+def test_id_pages(store):
+    for sim_id in range(1, 6):
+        make_sim(sim_id, [model.STATUS_CREATED, model.STATUS_STARTED])
+
+    make_sim(6, [model.STATUS_CREATED])
+
+    assert model.simulation_id_page(limit=2) == [6, 5]
+    assert model.simulation_id_page(before=5, limit=2) == [4, 3]
+    assert model.simulation_id_page([model.SIM_STARTED], before=2) == [1]
+    assert model.simulation_id_page([model.SIM_CREATED]) == [6]
+
+
+def test_submitting_and_failed_survive_rebuild(store):
+    make_sim(1, [model.STATUS_SUBMITTING])
+    make_sim(2, [model.STATUS_SUBMITTING, model.STATUS_FAILED])
+    make_sim(3, [model.STATUS_CREATED])
+
+    model.rebuild_catalog()
+
+    assert catalog.get(1)['status'] == model.SIM_SUBMITTING
+    assert catalog.get(2)['status'] == model.SIM_FAILED
+    assert catalog.get(3)['status'] == model.SIM_CREATED
+
+
+def test_upsert(store):
+    model.rebuild_catalog()
+
+    catalog.upsert(7, status=model.SIM_SUBMITTING, avatar_id=3)
+    catalog.upsert(7, status=model.SIM_CREATED)
+
+    assert catalog.get(7)['status'] == model.SIM_CREATED
+    assert catalog.get(7)['avatar_id'] == 3
+
+
+def test_drag_from_batch_job_reaches_leaderboard(store):
+    make_sim(1, [model.STATUS_CREATED, model.STATUS_STARTED, model.STATUS_FINISHED])
+    assert model.get_leaderboard().lowest() == []
+
+    # written by runcfd on a compute node, without touching the catalog
+    model.set_drag(1, 2.5)
+    assert catalog.get(1)['drag'] is None
+
+    model.sync_catalog()
+    assert catalog.get(1)['drag'] == 2.5
+    assert model.get_leaderboard().lowest() == [1]
+
+
+def test_drag_synced_by_another_process_reaches_leaderboard(store, monkeypatch):
+    make_sim(1, [model.STATUS_CREATED, model.STATUS_STARTED, model.STATUS_FINISHED])
+    make_sim(2, [model.STATUS_CREATED, model.STATUS_STARTED, model.STATUS_FINISHED])
+    server_board = model.get_leaderboard()
+    assert server_board.lowest() == []
+
+    model.set_drag(1, 2.5)
+    model.set_drag(2, 1.5)
+
+    # the archiver syncs first, without having loaded the leaderboard
+    monkeypatch.setattr(model, 'leaderboard', None)
+    model.sync_catalog()
+
+    # the server then sees no change in the catalog
+    monkeypatch.setattr(model, 'leaderboard', server_board)
+    model.sync_catalog()
+
+    assert model.get_leaderboard().lowest() == [2, 1]
+
+
+def test_failed_run_never_reaches_leaderboard(store):
+    make_sim(1, [model.STATUS_CREATED, model.STATUS_STARTED, model.STATUS_FINISHED], drag=2.5)
+    assert model.get_leaderboard().lowest() == [1]
+
+    # the VTK files of run 2 were malformed, it finished without results
+    make_sim(2, [model.STATUS_CREATED, model.STATUS_STARTED, model.STATUS_FAILED,
+                 model.STATUS_FINISHED])
+    make_sim(3, [model.STATUS_CREATED, model.STATUS_STARTED, model.STATUS_FAILED,
+                 model.STATUS_FINISHED], drag=0.0)
+
+    model.sync_catalog()
+    model.rebuild_catalog()
+
+    assert catalog.get(3)['drag'] is None
+    assert model.get_leaderboard().lowest() == [1]
+
+    with open(model.get_leaderboard().path) as f:
+        assert json.load(f) == [[2.5, 1]]
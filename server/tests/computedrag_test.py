@@ -0,0 +1,34 @@
+import pytest
+import os, sys
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+import settings
+import model
+import computedrag
+
+
+class NoFields:
+    def get(self, sim_id, timestep):
+        return None
+
+
+@pytest.fixture
+def store(tmpdir, monkeypatch):
+    monkeypatch.setattr(settings, 'root_dir', str(tmpdir))
+
+    return model.simulation_store_directory()
+
+
+###############
+#### tests ####
+###############
+
+
+def test_no_drag_without_results(store):
+    # an outline without points
+    with open(model.sim_filepath(1, 'simulation.poly'), 'w') as f:
+        f.write('4 2 0 0\n' + '\n' * 6)
+
+    assert computedrag.compute_drag(1, 1, 10, NoFields()) is None
+    assert not os.path.isfile(model.drag_file(1))
@@ -0,0 +1,83 @@
+import pytest
+import os, sys
+import pickle
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+import settings
+import model
+import utils
+
+
+@pytest.fixture
+def store(tmpdir, monkeypatch):
+    monkeypatch.setattr(settings, 'root_dir', str(tmpdir))
+
+    return model.simulation_store_directory()
+
+
+def upload_detail(sim_id, data):
+    utils.ensure_exists(model.run_directory(sim_id))
+
+    with open(model.sim_filepath(sim_id, 'all_data.pickle'), 'wb') as f:
+        pickle.dump(data, f)
+
+
+###############
+#### tests ####
+###############
+
+
+def test_split_detail_pickle(store):
+    upload_detail(1, {'depth': np.arange(6.0).reshape(2, 3),
+                      'name': 'bird',
+                      'objects': np.array([None, 1], dtype=object)})
+
+    assert model.split_detail_pickle(1)
+
+    directory = model.detail_directory(1)
+    assert sorted(os.listdir(directory)) == ['depth.npy', 'others.pickle']
+
+    # no temporary directories are left next to the result
+    assert sorted(os.listdir(model.run_directory(1))) == ['all_data',
+                                                          'all_data.pickle']
+
+
+def test_split_detail_pickle_without_upload(store):
+    utils.ensure_exists(model.run_directory(1))
+
+    assert not model.split_detail_pickle(1)
+    assert not os.path.isdir(model.detail_directory(1))
+
+
+def test_split_replaces_previous_split(store):
+    upload_detail(1, {'depth': np.zeros(3), 'old': np.ones(2)})
+    model.split_detail_pickle(1)
+
+    upload_detail(1, {'depth': np.ones(3)})
+    model.split_detail_pickle(1)
+
+    assert os.listdir(model.detail_directory(1)).count('old.npy') == 0
+    assert list(model.get_simulation_detail_key(1, 'depth')) == [1, 1, 1]
+
+
+def test_get_simulation_detail_key(store):
+    depth = np.arange(6.0).reshape(2, 3)
+    upload_detail(1, {'depth': depth, 'name': 'bird'})
+
+    # the first access splits the pickle
+    value = model.get_simulation_detail_key(1, 'depth')
+    assert isinstance(value, np.memmap)
+    assert np.array_equal(value, depth)
+
+    assert model.get_simulation_detail_key(1, 'name') == 'bird'
+
+    with pytest.raises(KeyError):
+        model.get_simulation_detail_key(1, 'missing')
+
+
+def test_get_simulation_detail_key_without_upload(store):
+    utils.ensure_exists(model.run_directory(1))
+
+    assert model.get_simulation_detail_key(1, 'depth') is None
@@ -0,0 +1,86 @@
+import pytest
+import os, sys
+import json
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from events import EventStream
+
+
+def parse(message):
+    fields = dict(line.split(': ', 1) for line in message.strip().split('\n'))
+    return fields['event'], json.loads(fields['data'])
+
+
+def next_event(messages):
+    message = next(messages)
+
+    # skip the retry interval and keepalives
+    while not message.startswith('id:'):
+        message = next(messages)
+
+    return parse(message)
+
+
+###############
+#### tests ####
+###############
+
+
+def test_subscribers_receive_full_state_then_changes():
+    state = {'activity': {'cpu': 1, 'running': []}, 'calls': 0, 'version': 1}
+
+    def activity():
+        state['calls'] += 1
+        return dict(state['activity'])
+
+    stream = EventStream(interval=0.01)
+    stream.add_channel('activity', activity, lambda: state['version'])
+
+    # keep the producer thread from starting, and step it by hand
+    stream.thread = 'not started'
+
+    first = stream.subscribe(['activity'])
+    stream.step()
+
+    assert next_event(first) == ('activity', {'cpu': 1, 'running': []})
+    assert next_event(first)[0] == 'tick'
+
+    # unchanged version, not produced again
+    stream.step()
+    assert state['calls'] == 1
+    assert next_event(first)[0] == 'tick'
+
+    state['activity']['cpu'] = 2
+    state['version'] = 2
+    stream.step()
+    assert next_event(first) == ('activity', {'cpu': 2})
+
+    # a new subscriber starts from the latest full state
+    second = stream.subscribe(['activity'])
+    assert next_event(second) == ('activity', {'cpu': 2, 'running': []})
+
+    # one producer call per step, whatever the number of subscribers
+    state['version'] = 3
+    stream.step()
+    assert state['calls'] == 3
+
+
+def test_unsubscribed_channels_are_not_produced():
+    calls = []
+
+    stream = EventStream(interval=0.01)
+    stream.add_channel('activity', lambda: calls.append('activity') or {})
+    stream.add_channel('recent', lambda: calls.append('recent') or [])
+
+    # keep the producer thread from starting, and step it by hand
+    stream.thread = 'not started'
+
+    messages = stream.subscribe(['recent'])
+    stream.step()
+
+    assert calls == ['recent']
+    assert next_event(messages) == ('recent', [])
+
+    messages.close()
+    assert stream.subscriber_count() == 0
@@ -0,0 +1,65 @@
+import pytest
+import os, sys
+import pickle
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from filecache import FileCache
+
+
+def pickle_read(filename):
+    with open(filename, 'rb') as f:
+        return pickle.load(f)
+
+
+def write(filepath, data, mtime):
+    with open(filepath, 'wb') as f:
+        f.write(data)
+
+    os.utime(filepath, (mtime, mtime))
+
+
+###############
+#### tests ####
+###############
+
+
+def test_rewritten_file_is_reloaded(tmpdir):
+    filepath = str(tmpdir.join('data.pickle'))
+    cache = FileCache(pickle_read, max_bytes=1024)
+
+    write(filepath, pickle.dumps({'name': 'a'}), 100)
+    assert cache.load(filepath) == {'name': 'a'}
+    assert cache.load(filepath) == {'name': 'a'}
+
+    write(filepath, pickle.dumps({'name': 'b'}), 200)
+    assert cache.load(filepath) == {'name': 'b'}
+
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses'], stats['entries']) == (1, 2, 1)
+
+
+def test_half_written_file_is_negatively_cached(tmpdir):
+    filepath = str(tmpdir.join('data.pickle'))
+    cache = FileCache(pickle_read, max_bytes=1024)
+
+    write(filepath, pickle.dumps({'name': 'a'})[:5], 100)
+    assert cache.load(filepath) is None
+    assert cache.load(filepath) is None
+    assert cache.stats()['failures'] == 1
+
+    write(filepath, pickle.dumps({'name': 'a'}), 200)
+    assert cache.load(filepath) == {'name': 'a'}
+
+
+def test_memory_budget(tmpdir):
+    cache = FileCache(pickle_read, max_bytes=100)
+
+    for i in range(5):
+        filepath = str(tmpdir.join('{}.pickle'.format(i)))
+        write(filepath, pickle.dumps('x' * 30), 100)
+        cache.load(filepath)
+
+    stats = cache.stats()
+    assert stats['bytes'] <= 100
+    assert stats['evictions'] > 0
@@ -0,0 +1,96 @@
+import pytest
+import os, sys
+import gzip
+import json
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from flask import Flask
+
+import httpcache
+
+
+def make_app(state):
+    app = Flask(__name__)
+
+    @app.route('/sims/<n>')
+    @httpcache.cached_json(lambda: state['version'])
+    def sims(n):
+        state['calls'] += 1
+        return json.dumps([{'id': i, 'name': 'x' * 100} for i in range(int(n))])
+
+    return app
+
+
+###############
+#### tests ####
+###############
+
+
+def test_unchanged_version_is_not_recomputed():
+    state = {'version': 1, 'calls': 0}
+    client = make_app(state).test_client()
+
+    first = client.get('/sims/2')
+    assert first.status_code == 200
+    assert len(first.get_json()) == 2
+
+    etag = first.headers['ETag']
+
+    second = client.get('/sims/2', headers={'If-None-Match': etag})
+    assert second.status_code == 304
+    assert state['calls'] == 1
+
+    # a client without the response gets the stored one
+    assert client.get('/sims/2').get_json() == first.get_json()
+    assert state['calls'] == 1
+
+    state['version'] = 2
+
+    third = client.get('/sims/2', headers={'If-None-Match': etag})
+    assert third.status_code == 200
+    assert third.headers['ETag'] != etag
+    assert state['calls'] == 2
+
+
+def test_large_responses_are_gzipped():
+    state = {'version': 1, 'calls': 0}
+    client = make_app(state).test_client()
+
+    small = client.get('/sims/1', headers={'Accept-Encoding': 'gzip'})
+    assert 'Content-Encoding' not in small.headers
+
+    large = client.get('/sims/50', headers={'Accept-Encoding': 'gzip'})
+    assert large.headers['Content-Encoding'] == 'gzip'
+    assert len(json.loads(gzip.decompress(large.data))) == 50
+
+
+def test_untracked_version_always_recomputes():
+    state = {'version': None, 'calls': 0}
+    client = make_app(state).test_client()
+
+    client.get('/sims/1')
+    client.get('/sims/1')
+
+    assert state['calls'] == 2
+
+
+def test_least_recently_used_responses_are_dropped(monkeypatch):
+    monkeypatch.setattr(httpcache, 'MAX_RESPONSES', 2)
+    httpcache.responses.clear()
+
+    state = {'version': 1, 'calls': 0}
+    client = make_app(state).test_client()
+
+    client.get('/sims/1')
+    client.get('/sims/2')
+
+    # using /sims/1 again keeps it over /sims/2
+    client.get('/sims/1')
+    client.get('/sims/3')
+
+    assert list(httpcache.responses.keys()) == ['/sims/1?', '/sims/3?']
+    assert state['calls'] == 3
+
+    client.get('/sims/2')
+    assert state['calls'] == 4
@@ -0,0 +1,61 @@
+import pytest
+import os, sys
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from leaderboard import Leaderboard
+
+###############
+#### tests ####
+###############
+
+
+def test_insert_keeps_lowest_sorted(tmpdir):
+    board = Leaderboard(str(tmpdir.join('leaderboard.json')), size=3)
+
+    board.insert(1, 10.5)
+    board.insert(2, 10.25)
+    board.insert(3, 30.0)
+    board.insert(4, 10.5)
+    board.insert(5, 50.0)
+
+    # ties are ordered by ID, and drags are not truncated
+    assert board.lowest(10) == [2, 1, 4]
+    assert board.lowest(2) == [2, 1]
+
+    # updating a drag moves the simulation
+    board.insert(2, 40.0)
+    assert board.lowest(10) == [1, 4, 2]
+
+
+def test_reloads_changes_from_other_processes(tmpdir):
+    path = str(tmpdir.join('leaderboard.json'))
+
+    reader = Leaderboard(path, size=10)
+    writer = Leaderboard(path, size=10)
+
+    writer.rebuild([(5.0, 1), (2.0, 2)])
+    assert reader.lowest() == [2, 1]
+
+    writer.insert(3, 1.0)
+    assert reader.lowest() == [3, 2, 1]
+
+
+def test_refill_when_an_entry_leaves(tmpdir):
+    drags = {1: 1.0, 2: 2.0, 3: 3.0, 4: 4.0}
+
+    def source(limit):
+        return sorted((drag, sim_id) for sim_id, drag in drags.items())[:limit]
+
+    board = Leaderboard(str(tmpdir.join('leaderboard.json')), size=3, source=source)
+    board.rebuild(source(None))
+    assert board.lowest() == [1, 2, 3]
+
+    # the drag of 1 is raised above the top 3, 4 is promoted back
+    drags[1] = 10.0
+    board.insert(1, 10.0)
+    assert board.lowest() == [2, 3, 4]
+
+    del drags[3]
+    board.remove(3)
+    assert board.lowest() == [2, 4, 1]
@@ -0,0 +1,122 @@
+import pytest
+import os, sys
+import time
+import threading
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+import settings
+import model
+import catalog
+
+
+@pytest.fixture
+def store(tmpdir, monkeypatch):
+    monkeypatch.setattr(settings, 'root_dir', str(tmpdir))
+    monkeypatch.setattr(model, 'submission_worker', None)
+    monkeypatch.setattr(model, 'schedulers', {})
+
+    return model.simulation_store_directory()
+
+
+def make_job(sim_id, job_id, flags):
+    for flag in flags:
+        model.touch_file(sim_id, flag)
+
+    with open(model.sim_filepath(sim_id, 'job_id'), 'w') as f:
+        f.write(job_id)
+
+
+def wait_for(condition, timeout=5):
+    end = time.time() + timeout
+
+    while not condition():
+        assert time.time() < end, 'timed out'
+        time.sleep(0.01)
+
+
+###############
+#### tests ####
+###############
+
+
+def test_job_ids_are_unique(store, monkeypatch):
+    scheduler = model.LocalScheduler(1, 1)
+    monkeypatch.setattr(scheduler, 'run', lambda sim_id, job_id: None)
+
+    job_ids = [scheduler.submit(sim_id) for sim_id in [1, 2]]
+
+    assert len(set(job_ids)) == 2
+    assert all(j.startswith('local-{pid}-'.format(pid=os.getpid())) for j in job_ids)
+
+    # another server process numbers its jobs from 1 again
+    monkeypatch.setattr(os, 'getpid', lambda: 1)
+    other = model.LocalScheduler(1, 1)
+    monkeypatch.setattr(other, 'run', lambda sim_id, job_id: None)
+
+    assert other.submit(1) not in job_ids
+
+
+def test_owns_jobs_until_finished(store, monkeypatch):
+    release = threading.Event()
+    scheduler = model.LocalScheduler(1, 1)
+    monkeypatch.setattr(scheduler, '_run', lambda sim_id, job_id: release.wait())
+
+    job_id = scheduler.submit(1)
+    assert scheduler.owns(job_id)
+
+    release.set()
+    wait_for(lambda: not scheduler.owns(job_id))
+
+
+def test_requeue_orphaned_jobs(store):
+    make_job(1, 'local-3', [model.STATUS_CREATED])
+    make_job(2, 'local-99-1', [model.STATUS_CREATED, model.STATUS_STARTED])
+    make_job(3, 'local-99-2', [model.STATUS_CREATED, model.STATUS_STARTED,
+                               model.STATUS_FINISHED])
+    make_job(4, '1234', [model.STATUS_CREATED, model.STATUS_STARTED])
+    model.rebuild_catalog()
+
+    assert model.requeue_orphaned_jobs() == [1, 2]
+
+    for sim_id in [1, 2]:
+        assert model.sim_check_file(sim_id, model.STATUS_SUBMITTING)
+        assert not model.sim_check_file(sim_id, model.STATUS_CREATED)
+        assert not model.sim_check_file(sim_id, model.STATUS_STARTED)
+        assert catalog.get(sim_id)['status'] == model.SIM_SUBMITTING
+        assert catalog.get(sim_id)['job_id'] is None
+
+    assert catalog.get(3)['status'] == model.SIM_FINISHED
+    assert catalog.get(4)['status'] == model.SIM_STARTED
+
+    # the catalog agrees with the flags when synced
+    model.sync_catalog()
+    assert catalog.get(2)['status'] == model.SIM_SUBMITTING
+
+
+def test_requeue_keeps_jobs_of_this_server(store, monkeypatch):
+    release = threading.Event()
+    scheduler = model.get_scheduler('local')
+    monkeypatch.setattr(scheduler, '_run', lambda sim_id, job_id: release.wait())
+
+    make_job(1, scheduler.submit(1), [model.STATUS_CREATED])
+    model.rebuild_catalog()
+
+    try:
+        assert model.requeue_orphaned_jobs() == []
+    finally:
+        release.set()
+
+
+def test_restart_resubmits_orphaned_jobs(store, monkeypatch):
+    submitted = []
+    monkeypatch.setattr(model, 'submit_simulations',
+                        lambda sim_ids: submitted.extend(sim_ids) or [])
+
+    make_job(1, 'local-99-1', [model.STATUS_CREATED, model.STATUS_STARTED])
+    model.touch_file(2, model.STATUS_SUBMITTING)
+    model.rebuild_catalog()
+
+    model.start_submission_worker()
+
+    wait_for(lambda: sorted(submitted) == [1, 2])
@@ -0,0 +1,103 @@
+import pytest
+import os, sys
+
+from flask import Flask
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+import monitoring
+
+
+@pytest.fixture(autouse=True)
+def clean_registry():
+    monitoring.reset()
+    yield
+    monitoring.reset()
+
+
+###############
+#### tests ####
+###############
+
+
+def test_timed_functions():
+
+    @monitoring.timed('work')
+    def work(fail):
+        if fail:
+            raise ValueError()
+
+        return 'done'
+
+    assert work(False) == 'done'
+
+    with pytest.raises(ValueError):
+        work(True)
+
+    text = monitoring.render()
+
+    assert '# TYPE server_function_duration_seconds histogram' in text
+    assert 'server_function_duration_seconds_bucket{function="work",le="+Inf"} 2' in text
+    assert 'server_function_duration_seconds_count{function="work"} 2' in text
+
+
+def test_request_timing_by_route():
+    app = Flask(__name__)
+    monitoring.init_app(app)
+
+    @app.route('/simulation/<sim_id>')
+    def simulation(sim_id):
+        return sim_id
+
+    client = app.test_client()
+
+    for sim_id in ['1', '2', '3']:
+        client.get('/simulation/' + sim_id)
+
+    client.get('/missing')
+
+    text = monitoring.render()
+
+    assert 'http_request_duration_seconds_count{method="GET",route="/simulation/<sim_id>"} 3' in text
+    assert 'http_requests_total{method="GET",route="/simulation/<sim_id>",status="200"} 3' in text
+    assert 'http_requests_total{method="GET",route="unmatched",status="404"} 1' in text
+
+
+@pytest.mark.parametrize('propagate', [False, True])
+def test_failed_requests_are_recorded(propagate):
+    app = Flask(__name__)
+    app.config['PROPAGATE_EXCEPTIONS'] = propagate
+    monitoring.init_app(app)
+
+    @app.route('/fail')
+    def fail():
+        raise RuntimeError('failed')
+
+    client = app.test_client()
+
+    # with propagation (e.g. in debug mode) after_request isn't run
+    if propagate:
+        with pytest.raises(RuntimeError):
+            client.get('/fail')
+    else:
+        assert client.get('/fail').status_code == 500
+
+    text = monitoring.render()
+
+    assert 'http_request_duration_seconds_count{method="GET",route="/fail"} 1' in text
+    assert 'http_requests_total{method="GET",route="/fail",status="500"} 1' in text
+
+
+def test_histogram_buckets():
+    monitoring.observe('latency', 0.003, route='/a')
+    monitoring.observe('latency', 0.2, route='/a')
+    monitoring.observe('latency', 20, route='/a')
+
+    lines = monitoring.render().splitlines()
+
+    assert 'latency_bucket{route="/a",le="0.001"} 0' in lines
+    assert 'latency_bucket{route="/a",le="0.005"} 1' in lines
+    assert 'latency_bucket{route="/a",le="0.25"} 2' in lines
+    assert 'latency_bucket{route="/a",le="10"} 2' in lines
+    assert 'latency_bucket{route="/a",le="+Inf"} 3' in lines
+    assert 'latency_sum{route="/a"} 20.203' in lines
@@ -0,0 +1,68 @@
+import pytest
+import os, sys
+import json
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+import numpyjson
+
+###############
+#### tests ####
+###############
+
+
+def test_matches_json_of_lists():
+    sim = {
+        'id': np.int64(3),
+        'drag': np.float32(0.5),
+        'depth': np.arange(-5, 7, dtype=np.int8).reshape(3, 4),
+        'rgb': np.arange(24, dtype=np.uint8).reshape(2, 3, 4),
+        'contour': np.linspace(0, 1, 10).reshape(5, 2),
+        'nodes': ['10.0.0.1', '10.0.0.2'],
+        'sims': [{'id': 1, 'flags': np.array([True, False])}],
+        5: None,
+    }
+
+    expected = {
+        'id': 3,
+        'drag': 0.5,
+        'depth': sim['depth'].tolist(),
+        'rgb': sim['rgb'].tolist(),
+        'contour': sim['contour'].tolist(),
+        'nodes': ['10.0.0.1', '10.0.0.2'],
+        'sims': [{'id': 1, 'flags': [True, False]}],
+        '5': None,
+    }
+
+    assert json.loads(numpyjson.dumps(sim)) == expected
+
+
+def test_binary_arrays_round_trip():
+    rgb = np.arange(24, dtype=np.uint8).reshape(2, 3, 4)[:, ::-1]
+
+    encoded = json.loads(numpyjson.dumps({'rgb': rgb}, binary=True))
+
+    decoded = numpyjson.decode_array(encoded['rgb'])
+    assert decoded.dtype == np.uint8
+    assert (decoded == rgb).all()
+
+
+def test_chunks_join_to_the_whole_text():
+    sims = [{'id': i, 'contour': np.zeros((10, 2))} for i in range(100)]
+
+    chunks = list(numpyjson.chunked(numpyjson.iterencode(sims), chunk_size=1000))
+
+    assert len(chunks) > 1
+    assert ''.join(chunks) == numpyjson.dumps(sims)
+
+
+def test_small_int_shapes():
+    for shape in [(0,), (1,), (7,), (2, 3), (4, 5, 3), (2, 3, 20), (0, 3)]:
+        arr = np.arange(np.prod(shape), dtype=np.uint8).reshape(shape)
+
+        assert json.loads(numpyjson.dumps(arr)) == arr.tolist()
+
+    assert numpyjson.dumps(np.uint8(7)) == '7'
+    assert numpyjson.dumps(np.array(7, dtype=np.uint8)) == '7'
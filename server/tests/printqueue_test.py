@@ -0,0 +1,46 @@
+import pytest
+import os, sys
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from printqueue import PrintQueue
+
+###############
+#### tests ####
+###############
+
+
+def test_fifo_order(tmpdir):
+    queue = PrintQueue(str(tmpdir.join('print_queue.journal')))
+
+    for sim_id in [5, 2, 9, 2]:
+        queue.append(sim_id)
+
+    assert queue.list() == [5, 2, 9]
+    assert queue.peek() == 5
+
+    queue.remove(2)
+    assert queue.pop() == 5
+    assert queue.list() == [9]
+
+    # a single waiting job is returned
+    assert queue.peek() == 9
+
+
+def test_shared_journal_and_compaction(tmpdir):
+    path = str(tmpdir.join('print_queue.journal'))
+
+    printer = PrintQueue(path, compact_min_lines=10)
+    node = PrintQueue(path, compact_min_lines=10)
+
+    for sim_id in range(20):
+        node.append(sim_id)
+        printer.remove(sim_id)
+
+    node.append(100)
+
+    assert printer.list() == [100]
+    assert node.list() == [100]
+
+    with open(path) as f:
+        assert len(f.readlines()) < 10
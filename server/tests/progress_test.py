@@ -0,0 +1,82 @@
+import pytest
+import os, sys
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from progress import ProgressTracker
+
+###############
+#### tests ####
+###############
+
+
+def test_reads_appended_output(tmpdir):
+    filepath = str(tmpdir.join('slurm.output'))
+    tracker = ProgressTracker()
+
+    assert tracker.read(filepath) is None
+
+    with open(filepath, 'w') as f:
+        f.write('Starting Step 1 (Model Outline  -->  CFD Mesh)\n')
+        f.write('Starting Step 2 (CFD Mesh  -->  CFD Results)\n')
+        f.write('MAIN:  Time: 1/10   0.1\n')
+
+    assert tracker.read(filepath) == (['1', '10'], 2)
+
+    with open(filepath, 'a') as f:
+        f.write('MAIN:  Time: 2/10   0.2\nMAIN:  Time: 3/1')
+
+    # the incomplete line is not parsed until it has been finished
+    assert tracker.read(filepath) == (['2', '10'], 2)
+
+    with open(filepath, 'a') as f:
+        f.write('0   0.3\n')
+
+    assert tracker.read(filepath) == (['3', '10'], 2)
+
+
+def test_replaced_output_is_reread(tmpdir):
+    filepath = str(tmpdir.join('slurm.output'))
+    tracker = ProgressTracker()
+
+    with open(filepath, 'w') as f:
+        f.write('Starting Step 1\nStarting Step 2\n')
+
+    assert tracker.read(filepath) == (None, 2)
+
+    # resubmitting a job removes the output file
+    os.remove(filepath)
+
+    with open(filepath, 'w') as f:
+        f.write('Starting Step 1\n')
+
+    assert tracker.read(filepath) == (None, 1)
+
+
+def test_output_rewritten_in_place_is_reread(tmpdir):
+    filepath = str(tmpdir.join('slurm.output'))
+    tracker = ProgressTracker()
+
+    with open(filepath, 'w') as f:
+        f.write('Starting Step 1\nMAIN:  Time: 4/10   0.4\n')
+
+    assert tracker.read(filepath) == (['4', '10'], 1)
+
+    # a rerun truncates the same file and writes past the previous offset
+    with open(filepath, 'w') as f:
+        f.write('Starting Step 1\nStarting Step 2\nMAIN:  Time: 1/10   0.1\n')
+
+    assert tracker.read(filepath) == (['1', '10'], 2)
+
+
+def test_forget(tmpdir):
+    filepath = str(tmpdir.join('slurm.output'))
+    tracker = ProgressTracker()
+
+    with open(filepath, 'w') as f:
+        f.write('Starting Step 1\n')
+
+    tracker.read(filepath)
+    tracker.forget(filepath)
+
+    assert tracker.states == {}
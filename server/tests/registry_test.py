@@ -0,0 +1,112 @@
+import pytest
+import os, sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+import settings
+import model
+
+
+@pytest.fixture
+def store(tmpdir, monkeypatch):
+    monkeypatch.setattr(settings, 'root_dir', str(tmpdir))
+    monkeypatch.setattr(settings, 'registry_use_inotify', False)
+
+    yield model.simulation_store_directory()
+
+    if model.registry is not None:
+        model.registry.stop()
+        model.registry = None
+
+
+def make_sim(sim_id, flags):
+    model.pickle_save(model.sim_datafile(sim_id), {'name': 'sim {}'.format(sim_id)})
+
+    for flag in flags:
+        model.touch_file(sim_id, flag)
+
+
+###############
+#### tests ####
+###############
+
+
+def test_registry_follows_store(store):
+    make_sim(1, [model.STATUS_CREATED, model.STATUS_STARTED])
+    make_sim(2, [model.STATUS_CREATED])
+
+    model.start_registry()
+
+    assert model.running_simulations() == [1]
+    assert model.queued_simulations() == [2]
+    assert model.get_simulation(2)['name'] == 'sim 2'
+
+    # written by the compute nodes
+    make_sim(3, [model.STATUS_CREATED])
+    model.touch_file(1, model.STATUS_FINISHED)
+    with open(model.drag_file(1), 'w') as f:
+        f.write('1.5')
+
+    model.registry.scan()
+
+    assert model.running_simulations() == []
+    assert model.queued_simulations() == [3, 2]
+    assert model.get_simulation(1)['drag'] == 1.5
+
+
+def test_pages_by_status(store):
+    make_sim(1, [model.STATUS_CREATED, model.STATUS_STARTED])
+    make_sim(2, [model.STATUS_CREATED])
+    make_sim(3, [model.STATUS_CREATED, model.STATUS_STARTED])
+    make_sim(4, [model.STATUS_SUBMITTING])
+    make_sim(5, [model.STATUS_SUBMITTING, model.STATUS_FAILED])
+
+    model.start_registry()
+
+    # the same answers as the catalog
+    for statuses in [None, [model.SIM_SUBMITTING], [model.SIM_FAILED],
+                     [model.SIM_STARTED, model.SIM_CREATED]]:
+        assert model.registry.ids(statuses) == model.catalog.ids(statuses)
+
+    assert model.registry.ids(limit=2) == [5, 4]
+    assert model.registry.ids([model.SIM_STARTED, model.SIM_CREATED], before=3) == [2, 1]
+
+    model.touch_file(2, model.STATUS_STARTED)
+    model.registry.invalidate(2)
+
+    assert model.registry.ids([model.SIM_STARTED]) == [3, 2, 1]
+    assert model.registry.ids([model.SIM_CREATED]) == []
+
+
+def test_older_load_does_not_replace_newer(store):
+    make_sim(1, [model.STATUS_CREATED])
+
+    model.start_registry()
+    registry = model.registry
+
+    stale = registry._stamp(1)
+    model.touch_file(1, model.STATUS_STARTED)
+    os.utime(model.run_directory(1), ns=(stale[0] + 10**9, stale[0] + 10**9))
+    registry.invalidate(1)
+
+    # a request thread finishing a load started before the change
+    registry._load(1, stale)
+
+    assert registry.ids([model.SIM_STARTED]) == [1]
+
+
+def test_failed_and_abandoned_simulations_settle(store):
+    make_sim(1, [model.STATUS_SUBMITTING, model.STATUS_FAILED])
+    make_sim(2, [model.STATUS_CREATED, model.STATUS_STARTED, model.STATUS_FINISHED])
+    make_sim(3, [model.STATUS_CREATED, model.STATUS_STARTED, model.STATUS_FINISHED])
+    make_sim(4, [model.STATUS_CREATED, model.STATUS_STARTED])
+
+    # simulation 3 finished long ago, but never got a drag
+    old = time.time() - model.DRAG_GRACE_PERIOD - 10
+    os.utime(model.sim_filepath(3, model.STATUS_FINISHED), (old, old))
+
+    assert model.registry_loader(1)[2]
+    assert not model.registry_loader(2)[2]
+    assert model.registry_loader(3)[2]
+    assert not model.registry_loader(4)[2]
@@ -0,0 +1,175 @@
+import pytest
+import os, sys
+import time
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+import settings
+import model
+import utils
+from resultcache import ResultCache
+
+
+@pytest.fixture
+def cache(tmpdir):
+    return ResultCache(str(tmpdir.join('cache')), 2)
+
+
+@pytest.fixture
+def store(tmpdir, monkeypatch):
+    monkeypatch.setattr(settings, 'root_dir', str(tmpdir))
+    monkeypatch.setattr(settings, 'result_cache_enabled', True)
+
+    return model.simulation_store_directory()
+
+
+def make_run(directory, files):
+    utils.ensure_exists(directory)
+
+    for filename, content in files.items():
+        with open(os.path.join(directory, filename), 'w') as f:
+            f.write(content)
+
+    return directory
+
+
+def write_outline(sim_id, outline):
+    np.savetxt(model.outline_coords_file(sim_id), outline, fmt='%i %i')
+
+
+def set_age(cache, key, age):
+    mtime = time.time() - age
+    os.utime(cache.entry_directory(key), (mtime, mtime))
+
+
+###############
+#### tests ####
+###############
+
+
+def test_store_and_restore(cache, tmpdir):
+    run = make_run(str(tmpdir.join('run')), {'drag.dat': '1 2',
+                                             'fields.json': '{}',
+                                             'other.txt': 'x'})
+
+    cache.store('abc', run, ['fields*', 'drag.dat'], {'drag': 1.5})
+
+    assert cache.lookup('abc') == {'drag': 1.5,
+                                   'files': ['drag.dat', 'fields.json']}
+
+    destination = make_run(str(tmpdir.join('new')), {'drag.dat': 'stale'})
+    meta = cache.restore('abc', destination)
+
+    assert meta['drag'] == 1.5
+    assert sorted(os.listdir(destination)) == ['drag.dat', 'fields.json']
+
+    with open(os.path.join(destination, 'drag.dat')) as f:
+        assert f.read() == '1 2'
+
+
+def test_restore_miss(cache, tmpdir):
+    assert cache.lookup('abc') is None
+    assert cache.restore('abc', str(tmpdir)) is None
+
+
+def test_restore_removed_files_is_a_miss(cache, tmpdir):
+    run = make_run(str(tmpdir.join('run')), {'drag.dat': '1',
+                                             'fields.json': '{}'})
+    cache.store('abc', run, ['*'], {})
+
+    os.remove(os.path.join(cache.entry_directory('abc'), 'fields.json'))
+
+    destination = make_run(str(tmpdir.join('new')), {})
+    assert cache.restore('abc', destination) is None
+
+    # nothing is left behind from the partial restore
+    assert os.listdir(destination) == []
+
+
+def test_store_keeps_existing_entry(cache, tmpdir):
+    first = make_run(str(tmpdir.join('first')), {'drag.dat': '1'})
+    second = make_run(str(tmpdir.join('second')), {'drag.dat': '2'})
+
+    cache.store('abc', first, ['*'], {'drag': 1})
+    cache.store('abc', second, ['*'], {'drag': 2})
+
+    assert cache.lookup('abc')['drag'] == 1
+
+
+def test_evict_least_recently_used(cache, tmpdir):
+    run = make_run(str(tmpdir.join('run')), {'drag.dat': '1'})
+
+    cache.store('a', run, ['*'], {})
+    cache.store('b', run, ['*'], {})
+    set_age(cache, 'a', 20)
+    set_age(cache, 'b', 10)
+
+    # restoring marks the entry as used
+    cache.restore('a', make_run(str(tmpdir.join('new')), {}))
+
+    cache.store('c', run, ['*'], {})
+
+    assert cache.lookup('a') is not None
+    assert cache.lookup('b') is None
+    assert cache.lookup('c') is not None
+
+
+def test_outline_hash(store):
+    outline = np.array([[0, 0], [10, 0], [10, 5]])
+    write_outline(1, outline)
+    write_outline(2, outline)
+    write_outline(3, outline[::-1])
+
+    assert model.outline_hash(1) == model.outline_hash(2)
+    assert model.outline_hash(1) != model.outline_hash(3)
+
+
+def test_outline_hash_depends_on_timesteps(store, monkeypatch):
+    write_outline(1, np.array([[0, 0], [10, 0], [10, 5]]))
+    key = model.outline_hash(1)
+
+    monkeypatch.setattr(settings, 'number_timesteps',
+                        settings.number_timesteps + 1)
+
+    assert model.outline_hash(1) != key
+
+
+def test_cache_hit(store):
+    outline = np.array([[0, 0], [10, 0], [10, 5]])
+
+    # a first run of the outline misses and stores its results
+    write_outline(1, outline)
+    assert not model.restore_cached_result(1)
+    assert model.cached_result(1) is None
+
+    make_run(model.run_directory(1), {'drag.dat': '1 2',
+                                      'fields.json': '{}',
+                                      'elmeroutput0001.vtk': 'x',
+                                      'left.gif': 'x'})
+    model.store_cached_result(1, 4, 3.5)
+
+    # a second run of the same outline reuses them
+    write_outline(2, outline)
+    assert model.restore_cached_result(2)
+
+    cached = model.cached_result(2)
+    assert cached['drag'] == 3.5
+    assert cached['nprocs'] == 4
+    assert cached['sim_id'] == 1
+    assert cached['key'] == model.outline_hash(1)
+
+    assert os.path.isfile(model.sim_filepath(2, 'fields.json'))
+    assert not os.path.isfile(model.sim_filepath(2, 'elmeroutput0001.vtk'))
+    assert not os.path.isfile(model.sim_filepath(2, 'left.gif'))
+
+
+def test_failed_runs_are_not_cached(store):
+    write_outline(1, np.array([[0, 0], [10, 0], [10, 5]]))
+    model.restore_cached_result(1)
+
+    make_run(model.run_directory(1), {'drag.dat': '1 2'})
+    model.touch_file(1, model.STATUS_FAILED)
+    model.store_cached_result(1, 4, 0.0)
+
+    assert model.get_result_cache().lookup(model.outline_hash(1)) is None
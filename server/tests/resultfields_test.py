@@ -0,0 +1,99 @@
+import pytest
+import os, sys
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+import resultfields
+
+
+def write_vtk(directory, timestep, points, pressure):
+    lines = [
+        '# vtk DataFile Version 4.0', 'Elmer simulation', 'ASCII', 'DATASET UNSTRUCTURED_GRID',
+        'POINTS \t{n} float'.format(n=len(points))
+    ]
+    lines += ['{x} {y} 0'.format(x=x, y=y) for x, y in points]
+    lines += ['CELLS \t1\t4', '3 0 1 2', 'CELL_TYPES\t1', '5']
+    lines += ['POINT_DATA\t{n}'.format(n=len(points)), 'SCALARS pressure float 1',
+              'LOOKUP_TABLE default']
+    lines += [str(p) for p in pressure]
+    lines += ['VECTORS velocity float']
+    lines += ['{p} {q} 0'.format(p=p, q=-p) for p in pressure]
+
+    with open(resultfields.vtk_filename(directory, timestep), 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+
+
+###############
+#### tests ####
+###############
+
+
+def test_convert_vtk(tmpdir):
+    directory = str(tmpdir)
+    points = [(0, 0), (1, 0), (0, 1)]
+
+    write_vtk(directory, 1, points, [1, 2, 3])
+    write_vtk(directory, 3, points, [0.5, 0.25, 0.125])
+
+    fields = resultfields.convert_vtk(directory, range(1, 4))
+
+    assert fields.timesteps == [1, 3]
+    assert 2 not in fields
+    assert fields.nprocs == 1
+    assert fields.points.shape == (3, 3)
+    assert fields.cells.tolist() == [[0, 1, 2]]
+
+    assert fields.pressure(3).dtype == np.float32
+    assert fields.pressure(3).tolist() == [0.5, 0.25, 0.125]
+    assert fields.velocity(1).tolist() == [[1, -1], [2, -2], [3, -3]]
+
+    # the converted container is reused
+    os.remove(resultfields.vtk_filename(directory, 1))
+    assert resultfields.load_fields(directory, range(1, 4)).timesteps == [1, 3]
+
+
+def test_mesh_must_match(tmpdir):
+    directory = str(tmpdir)
+
+    write_vtk(directory, 1, [(0, 0), (1, 0), (0, 1)], [1, 2, 3])
+    write_vtk(directory, 2, [(0, 0), (2, 0), (0, 1)], [1, 2, 3])
+
+    with pytest.raises(ValueError):
+        resultfields.convert_vtk(directory, range(1, 3))
+
+    # the run is shown without results
+    assert resultfields.load_fields(directory, range(1, 3)) is None
+
+    store = resultfields.FieldStore(lambda sim_id: directory, range(1, 3))
+    assert store.get(1, 1) is None
+
+
+def test_no_results(tmpdir):
+    assert resultfields.load_fields(str(tmpdir), range(1, 11)) is None
+
+
+def test_field_store_loads_once(tmpdir):
+    directory = str(tmpdir)
+    points = [(0, 0), (1, 0), (0, 1)]
+
+    write_vtk(directory, 1, points, [1, 2, 3])
+    write_vtk(directory, 2, points, [4, 5, 6])
+
+    store = resultfields.FieldStore(lambda sim_id: directory, range(1, 3))
+
+    first = store.get(7, 2)
+    assert first.pressure.tolist() == [4, 5, 6]
+    assert first.velocity.shape == (3, 2)
+
+    # the same arrays for the next stage, with the mesh shared across timesteps
+    assert store.get(7, 2) is first
+    assert store.get(7, 1).points is first.points
+    assert store.get(7, 3) is None
+
+    store.release(7)
+    assert store.entries == {} and store.containers == {}
+
+    assert resultfields.FieldStore(lambda sim_id: str(tmpdir.join('none')),
+                                   range(1, 3)).get(8, 1) is None
@@ -0,0 +1,39 @@
+import pytest
+import os, sys
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+import settings
+import model
+
+
+@pytest.fixture
+def store(tmpdir, monkeypatch):
+    monkeypatch.setattr(settings, 'root_dir', str(tmpdir))
+
+    return model.simulation_store_directory()
+
+
+###############
+#### tests ####
+###############
+
+
+def test_continues_from_existing_ids(store):
+    model.run_directory(7)
+
+    assert model.generate_sim_id() == 8
+    assert model.generate_sim_id() == 9
+
+
+def test_concurrent_allocation_is_unique(store):
+    assert model.generate_sim_id() == 1
+
+    # a directory created outside the allocator is skipped over
+    model.run_directory(3)
+
+    with ThreadPoolExecutor(8) as pool:
+        ids = list(pool.map(lambda i: model.generate_sim_id(), range(40)))
+
+    assert sorted(ids) == [2] + list(range(4, 43))
@@ -0,0 +1,161 @@
+import pytest
+import os, sys
+import time
+import threading
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+import settings
+import model
+from submission import SubmissionWorker
+
+
+class FakeSubmit:
+    """
+    Records the batches submitted, failing each simulation in `failures` the
+    given number of times
+    """
+
+    def __init__(self, failures=None):
+        self.failures = dict(failures or {})
+        self.batches = []
+        self.lock = threading.Lock()
+
+    def __call__(self, sim_ids):
+        with self.lock:
+            self.batches.append(list(sim_ids))
+
+            failed = [sim_id for sim_id in sim_ids if self.failures.get(sim_id, 0) > 0]
+
+            for sim_id in failed:
+                self.failures[sim_id] -= 1
+
+            return failed
+
+    def submitted(self, sim_id):
+        with self.lock:
+            return sum(batch.count(sim_id) for batch in self.batches)
+
+
+def wait_for(condition, timeout=5):
+    end = time.time() + timeout
+
+    while not condition():
+        assert time.time() < end, 'timed out'
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def store(tmpdir, monkeypatch):
+    monkeypatch.setattr(settings, 'root_dir', str(tmpdir))
+    monkeypatch.setattr(model, 'submission_worker', None)
+
+    return model.simulation_store_directory()
+
+
+###############
+#### tests ####
+###############
+
+
+def test_batches_queued_submissions():
+    submit = FakeSubmit()
+    worker = SubmissionWorker(submit)
+
+    for sim_id in [1, 2, 3]:
+        worker.enqueue(sim_id)
+
+    worker.start()
+
+    wait_for(lambda: submit.submitted(3) == 1)
+    assert submit.batches == [[1, 2, 3]]
+
+
+def test_retry():
+    submit = FakeSubmit({1: 2})
+    failed = []
+    worker = SubmissionWorker(submit, retries=3, retry_delay=0.01,
+                              on_failed=failed.append)
+    worker.start()
+
+    worker.enqueue(1)
+
+    wait_for(lambda: submit.submitted(1) == 3)
+    wait_for(lambda: worker.pending() == 0)
+    assert failed == []
+
+
+def test_give_up():
+    submit = FakeSubmit({1: 10})
+    failed = []
+    worker = SubmissionWorker(submit, retries=2, retry_delay=0.01,
+                              on_failed=failed.append)
+    worker.start()
+
+    worker.enqueue(1)
+
+    wait_for(lambda: failed == [1])
+    assert submit.submitted(1) == 3
+    assert worker.pending() == 0
+
+
+def test_retry_does_not_block_new_submissions():
+    submit = FakeSubmit({1: 1})
+    worker = SubmissionWorker(submit, retries=3, retry_delay=60)
+    worker.start()
+
+    worker.enqueue(1)
+    wait_for(lambda: submit.submitted(1) == 1)
+
+    worker.enqueue(2)
+    wait_for(lambda: submit.submitted(2) == 1)
+
+    # simulation 1 waits for its retry
+    assert submit.submitted(1) == 1
+    assert worker.pending() == 1
+
+
+def test_exception_fails_the_batch():
+    calls = []
+
+    def submit(sim_ids):
+        calls.append(list(sim_ids))
+
+        if len(calls) == 1:
+            raise RuntimeError('sbatch failed')
+
+        return []
+
+    worker = SubmissionWorker(submit, retries=1, retry_delay=0.01)
+    worker.enqueue(1)
+    worker.enqueue(2)
+    worker.start()
+
+    wait_for(lambda: len(calls) == 2)
+    assert calls == [[1, 2], [1, 2]]
+
+
+def test_give_up_marks_simulation_failed(store, monkeypatch):
+    monkeypatch.setattr(settings, 'submission_retries', 0)
+    monkeypatch.setattr(model, 'submit_simulations', lambda sim_ids: list(sim_ids))
+
+    model.touch_file(1, model.STATUS_SUBMITTING)
+    model.start_submission_worker()
+
+    wait_for(lambda: model.sim_check_file(1, model.STATUS_FAILED))
+    wait_for(lambda: model.catalog.get(1)['status'] == model.SIM_FAILED)
+
+
+def test_restart_resubmits_waiting_simulations(store, monkeypatch):
+    submit = FakeSubmit()
+    monkeypatch.setattr(model, 'submit_simulations', submit)
+
+    # left waiting for submission by a previous server
+    model.touch_file(1, model.STATUS_SUBMITTING)
+    model.touch_file(2, model.STATUS_SUBMITTING)
+    model.touch_file(3, model.STATUS_CREATED)
+
+    model.start_submission_worker()
+
+    wait_for(lambda: submit.submitted(2) == 1)
+    assert submit.batches == [[1, 2]]
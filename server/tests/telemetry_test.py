@@ -0,0 +1,93 @@
+import pytest
+import os, sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from telemetry import TelemetryCollector, parse_usage
+
+
+def write_info(info_dir, node, cpu, temp):
+    with open(os.path.join(info_dir, node), 'w') as f:
+        f.write('{node} {cpu} {temp}\n'.format(node=node, cpu=cpu, temp=temp))
+
+
+###############
+#### tests ####
+###############
+
+
+def test_half_written_lines_are_skipped():
+    usage = parse_usage('10.0.0.1 50.4 42.5\n10.0.0.2 7\n10.0.0.3 1.0 4x\nnoise\n')
+
+    assert usage == {'10.0.0.1': (50.4, 42.5)}
+
+
+def test_ring_buffer_history(tmpdir):
+    info_dir = str(tmpdir)
+
+    collector = TelemetryCollector(info_dir, ['10.0.0.1', '10.0.0.2'],
+                                   interval=1,
+                                   history_size=4,
+                                   max_temp=80)
+
+    write_info(info_dir, '10.0.0.1', 10, 40)
+    collector.sample()
+    version = collector.version
+
+    # unchanged values, same version
+    collector.sample()
+    assert collector.version == version
+
+    write_info(info_dir, '10.0.0.1', 30, 60)
+    write_info(info_dir, '10.0.0.2', 100, 80)
+    for i in range(3):
+        collector.sample()
+
+    assert collector.version == version + 1
+    assert collector.current() == ({'10.0.0.1': 30, '10.0.0.2': 100},
+                                   {'10.0.0.1': 75, '10.0.0.2': 100})
+
+    # only the last 4 samples are kept
+    history = collector.history(2)
+    assert len(history['time']) == 2
+    assert history['cpu_usage'] == {'10.0.0.1': [20, 30], '10.0.0.2': [100, 100]}
+
+    history = collector.history(10)
+    assert history['cpu_usage']['10.0.0.2'] == [None, 100, 100, 100]
+    assert history['temp_percent']['10.0.0.1'] == [50, 75, 75, 75]
+
+
+def test_stale_nodes_lose_their_values(tmpdir):
+    info_dir = str(tmpdir)
+
+    collector = TelemetryCollector(info_dir, ['10.0.0.1', '10.0.0.2'],
+                                   interval=1,
+                                   history_size=4,
+                                   max_temp=80,
+                                   stale_after=5)
+
+    write_info(info_dir, '10.0.0.1', 10, 40)
+    write_info(info_dir, '10.0.0.2', 20, 40)
+    collector.sample()
+
+    # the process writing the file of 10.0.0.2 stops
+    old = time.time() - 10
+    os.utime(os.path.join(info_dir, '10.0.0.2'), (old, old))
+
+    # a node missing from a sample keeps its values for a while
+    collector.sample()
+    assert collector.current()[0] == {'10.0.0.1': 10, '10.0.0.2': 20}
+
+    collector.seen['10.0.0.2'] = old
+    version = collector.version
+    collector.sample()
+
+    assert collector.version == version + 1
+    assert collector.current()[0] == {'10.0.0.1': 10}
+    assert collector.history(10)['cpu_usage']['10.0.0.2'] == [20, 20, None]
+
+    # it's back once its file is written again
+    write_info(info_dir, '10.0.0.2', 30, 40)
+    collector.sample()
+    assert collector.current()[0] == {'10.0.0.1': 10, '10.0.0.2': 30}
@@ -0,0 +1,113 @@
+import pytest
+import os, sys
+import multiprocessing
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+import utils
+from timeseries import TimeSeriesStore
+
+NODES = ['10.0.0.1', '10.0.0.2']
+
+
+def make_store(directory):
+    return TimeSeriesStore(directory, NODES, {1: 2, 10: 14, 60: 365})
+
+
+###############
+#### tests ####
+###############
+
+
+def test_rollups(tmpdir):
+    store = make_store(str(tmpdir.join('metrics')))
+
+    start = 86400 * 1000
+
+    # node 2 only reports for the first half, running simulation 7
+    for t in range(0, 125):
+        usage = {'10.0.0.1': (t % 10, 50.0)}
+        jobs = {}
+
+        if t < 60:
+            usage['10.0.0.2'] = (100.0, 70.0)
+            jobs['10.0.0.2'] = 7
+
+        store.add(start + t, usage, jobs, running=len(jobs), pending=2)
+
+    # 1s records until the last one started, 10s and 1min until the last period
+    assert len(store.read(1, start, start + 200)) == 124
+    assert len(store.read(10, start, start + 200)) == 12
+    assert len(store.read(60, start, start + 200)) == 2
+
+    minutes = store.query(start, start + 120, 60)
+    assert list(minutes['time']) == [start, start + 60]
+    assert list(minutes['cpu'][:, 0]) == [4.5, 4.5]
+    assert minutes['cpu'][0, 1] == 100
+    assert np.isnan(minutes['cpu'][1, 1])
+    assert list(minutes['job'][:, 1]) == [7, 0]
+    assert list(minutes['running']) == [1, 0]
+
+    # 30s steps use the 10s records
+    assert store.resolution(30) == 10
+
+    halves = store.query(start, start + 120, 30)
+    assert list(halves['cpu'][:, 1][:2]) == [100, 100]
+    assert list(halves['temp'][:, 0]) == [50, 50, 50, 50]
+
+
+def test_reopened_store_reads_records(tmpdir):
+    directory = str(tmpdir.join('metrics'))
+    store = make_store(directory)
+
+    for t in range(0, 25):
+        store.add(86400 * 1000 + t, {'10.0.0.1': (1.0, 2.0)}, {}, 0, 0)
+
+    store = make_store(directory)
+    assert len(store.read(10, 0, 86400 * 2000)) == 2
+
+    # another set of nodes starts a new store
+    store = TimeSeriesStore(directory, ['10.0.0.1'], {1: 2})
+    assert len(store.read(1, 0, 86400 * 2000)) == 0
+
+
+def test_layout_change_waits_for_other_processes(tmpdir):
+    directory = str(tmpdir.join('metrics'))
+    store = make_store(directory)
+
+    # another server process with a different set of nodes
+    def other_server():
+        TimeSeriesStore(directory, NODES + ['10.0.0.3'], {1: 2})
+
+    process = multiprocessing.get_context('fork').Process(target=other_server)
+
+    with utils.file_lock(store.lock_file):
+        process.start()
+        process.join(0.5)
+
+        # the directory isn't moved while this process holds the lock
+        assert process.is_alive()
+        assert sorted(os.listdir(str(tmpdir))) == ['metrics', 'metrics.lock']
+
+    process.join(5)
+    assert process.exitcode == 0
+    assert len(os.listdir(str(tmpdir))) == 3
+
+
+def test_periods_are_recorded_once(tmpdir):
+    directory = str(tmpdir.join('metrics'))
+
+    # two server processes sampling the same cluster
+    stores = [make_store(directory), make_store(directory)]
+
+    start = 86400 * 1000
+
+    for t in range(0, 25):
+        for store in stores:
+            store.add(start + t, {'10.0.0.1': (t, 50.0)}, {}, running=0, pending=0)
+
+    records = stores[0].read(1, start, start + 100)
+    assert list(records['time']) == [start + t for t in range(24)]
+    assert len(stores[1].read(10, start, start + 100)) == 2
@@ -0,0 +1,146 @@
+import pytest
+import os, sys
+import hashlib
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+import settings
+import main
+from uploads import ResumableUpload, UploadError
+
+
+def checksum(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+@pytest.fixture
+def client(tmpdir, monkeypatch):
+    monkeypatch.setattr(settings, 'root_dir', str(tmpdir))
+
+    return main.app.test_client()
+
+
+###############
+#### tests ####
+###############
+
+
+def test_resumed_upload(tmpdir):
+    filepath = str(tmpdir.join('all_data.pickle'))
+    data = os.urandom(1000)
+    completed = []
+
+    upload = ResumableUpload(filepath, lambda: completed.append(True))
+
+    assert upload.status(len(data))['offset'] == 0
+
+    upload.write_chunk(0, len(data), data[:400], checksum(data[:400]))
+
+    # the connection drops, a new upload object asks where to continue
+    upload = ResumableUpload(filepath, lambda: completed.append(True))
+    assert upload.status(len(data)) == {'offset': 400, 'size': 1000, 'complete': False}
+    assert not os.path.exists(filepath)
+
+    with pytest.raises(UploadError) as e:
+        upload.write_chunk(0, len(data), data[400:], checksum(data[400:]))
+    assert e.value.code == 409
+
+    status = upload.write_chunk(400, len(data), data[400:], checksum(data[400:]))
+    assert status['complete']
+    assert completed == [True]
+
+    with open(filepath, 'rb') as f:
+        assert f.read() == data
+
+    assert sorted(os.listdir(str(tmpdir))) == [
+        '.upload-all_data.pickle.done', '.upload-all_data.pickle.lock', 'all_data.pickle'
+    ]
+
+    # the last chunk again, as its response was lost
+    status = upload.write_chunk(400, len(data), data[400:], checksum(data[400:]))
+    assert status['complete']
+    assert completed == [True]
+
+
+def test_corrupt_chunk_is_refused(tmpdir):
+    filepath = str(tmpdir.join('depth.png'))
+    data = b'0123456789'
+
+    upload = ResumableUpload(filepath)
+
+    with pytest.raises(UploadError) as e:
+        upload.write_chunk(0, len(data), b'01234x', checksum(data[:6]))
+    assert e.value.code == 400
+
+    assert upload.status(len(data))['offset'] == 0
+
+    upload.write_chunk(0, len(data), data, checksum(data))
+    assert upload.status(len(data))['complete']
+
+    # a different file replaces it once complete
+    upload.write_chunk(0, 3, b'abc', checksum(b'abc'))
+
+    with open(filepath, 'rb') as f:
+        assert f.read() == b'abc'
+
+
+def test_same_size_file_is_not_complete(tmpdir):
+    filepath = str(tmpdir.join('depth.png'))
+    data = b'0123456789'
+
+    # written by a whole-file upload, or left by an earlier run
+    with open(filepath, 'wb') as f:
+        f.write(b'x' * len(data))
+
+    upload = ResumableUpload(filepath)
+    assert upload.status(len(data)) == {'offset': 0, 'size': 10, 'complete': False}
+
+    upload.write_chunk(0, len(data), data, checksum(data))
+
+    with open(filepath, 'rb') as f:
+        assert f.read() == data
+
+
+def test_new_upload_of_same_size_is_written(tmpdir):
+    filepath = str(tmpdir.join('depth.png'))
+    completed = []
+    upload = ResumableUpload(filepath, lambda: completed.append(True))
+
+    upload.write_chunk(0, 3, b'abc', checksum(b'abc'))
+    assert upload.status(3)['complete']
+
+    # a single chunk of a different file of the same size
+    status = upload.write_chunk(0, 3, b'xyz', checksum(b'xyz'))
+    assert status['complete']
+    assert completed == [True, True]
+
+    with open(filepath, 'rb') as f:
+        assert f.read() == b'xyz'
+
+
+def test_replaced_file_is_not_complete(tmpdir):
+    filepath = str(tmpdir.join('depth.png'))
+    upload = ResumableUpload(filepath)
+
+    upload.write_chunk(0, 3, b'abc', checksum(b'abc'))
+
+    # replaced by a whole-file upload
+    with open(filepath + 'tmp', 'wb') as f:
+        f.write(b'xyz')
+    os.rename(filepath + 'tmp', filepath)
+
+    assert not upload.status(3)['complete']
+
+
+def test_upload_requires_simulation_id(client, tmpdir):
+    for sim_id in ['..', 'abc', '1a']:
+        url = '/upload/{sim_id}/secret.txt'.format(sim_id=sim_id)
+
+        assert client.post(url, data=b'abc').status_code == 400
+        assert client.get(url + '/status?size=3').status_code == 400
+        assert client.put(url + '?offset=0&size=3',
+                          data=b'abc',
+                          headers={'X-Chunk-SHA256': checksum(b'abc')}).status_code == 400
+
+    assert not os.path.exists(str(tmpdir.join('simulations', 'secret.txt')))
+    assert client.post('/upload/1/depth.png', data=b'abc').status_code == 200
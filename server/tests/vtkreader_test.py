@@ -0,0 +1,88 @@
+import pytest
+import os, sys
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from vtkreader import read_vtk
+
+HEADER = '''# vtk DataFile Version 4.0
+Elmer simulation
+ASCII
+DATASET UNSTRUCTURED_GRID
+POINTS \t4 float
+0          0         0
+1          0         0
+1          1         0
+0          1         0
+CELLS \t2\t8
+3          0          1          2
+3          0          2          3
+CELL_TYPES\t2
+5
+5
+'''
+
+PARTITIONS = '''CELL_DATA\t2
+SCALARS procid int 1
+LOOKUP_TABLE default
+1
+2
+'''
+
+FIELDS = '''POINT_DATA\t4
+SCALARS pressure float 1
+LOOKUP_TABLE default
+0.5
+-9.07415e-07
+1.97082e-06
+0
+VECTORS velocity float
+1               0               0
+0.999833               0               0
+0.999813     -0.00018389               0
+0               0               0
+'''
+
+
+def write_vtk(tmpdir, text):
+    filename = str(tmpdir.join('elmeroutput0001.vtk'))
+
+    with open(filename, 'w') as f:
+        f.write(text)
+
+    return filename
+
+
+###############
+#### tests ####
+###############
+
+
+def test_serial_layout(tmpdir):
+    grid = read_vtk(write_vtk(tmpdir, HEADER + FIELDS))
+
+    assert grid.points.shape == (4, 3)
+    assert grid.cells.tolist() == [[0, 1, 2], [0, 2, 3]]
+    assert grid.cell_types.tolist() == [5, 5]
+    assert grid.cell_data == {}
+    assert grid.nprocs == 1
+
+    assert grid.point_data['pressure'].tolist() == [0.5, -9.07415e-07, 1.97082e-06, 0]
+    assert grid.point_data['velocity'][2].tolist() == [0.999813, -0.00018389, 0]
+
+
+def test_parallel_layout(tmpdir):
+    grid = read_vtk(write_vtk(tmpdir, HEADER + PARTITIONS + FIELDS))
+
+    assert grid.cell_data['procid'].tolist() == [1, 2]
+    assert grid.nprocs == 2
+    assert grid.point_data['velocity'].shape == (4, 3)
+
+
+def test_truncated_file(tmpdir):
+    filename = write_vtk(tmpdir, HEADER + FIELDS[:-30])
+
+    with pytest.raises(ValueError):
+        read_vtk(filename)
@@ -0,0 +1,267 @@
+import os
+import json
+import time
+import shutil
+import threading
+
+import numpy as np
+
+import utils
+
+
+def record_dtype(nnodes):
+    """
+    Numpy dtype of a record: the time at the start of the period, the mean cpu
+    usage and temperature of each node (NaN if unknown), the simulation
+    running on each node (0 if none, the last one seen in the period) and
+    the mean numbers of running and pending simulations
+    """
+    return np.dtype([
+        ('time', '<f8'),
+        ('cpu', '<f4', (nnodes, )),
+        ('temp', '<f4', (nnodes, )),
+        ('job', '<i4', (nnodes, )),
+        ('running', '<f4'),
+        ('pending', '<f4'),
+    ])
+
+
+class Rollup:
+    """
+    Accumulates samples into one record per `step` seconds
+    """
+
+    def __init__(self, step, nnodes):
+        self.step = step
+        self.nnodes = nnodes
+        self.start = None
+        self._reset()
+
+    def _reset(self):
+        self.sums = np.zeros((2, self.nnodes))
+        self.counts = np.zeros((2, self.nnodes))
+        self.job = np.zeros(self.nnodes, dtype=np.int32)
+        self.queue_sums = np.zeros(2)
+        self.samples = 0
+
+    def add(self, sample_time, cpu, temp, job, running, pending):
+        """
+        Adds a sample. Returns the record of the previous period if the sample
+        starts a new one, otherwise None.
+        """
+        start = sample_time - sample_time % self.step
+
+        record = None
+
+        if self.start is not None and start != self.start:
+            record = self.record()
+            self._reset()
+
+        self.start = start
+
+        values = np.array([cpu, temp])
+        known = ~np.isnan(values)
+
+        self.sums += np.where(known, values, 0)
+        self.counts += known
+        self.job = job
+        self.queue_sums += (running, pending)
+        self.samples += 1
+
+        return record
+
+    def record(self):
+        with np.errstate(invalid='ignore', divide='ignore'):
+            means = self.sums / self.counts
+
+        queue = self.queue_sums / self.samples
+
+        return (self.start, means[0], means[1], self.job, queue[0], queue[1])
+
+
+class TimeSeriesStore:
+    """
+    On-disk store of cluster metrics for the nodes `nodes`, at the resolutions
+    (in seconds) given by the keys of `retention`. Each resolution has a
+    directory with one file of fixed-size records (see `record_dtype`) per day,
+    and the files older than its retention (in days) are removed.
+
+    `add` is called with each sample; every resolution accumulates the samples
+    of its period in memory, and appends a record once the period is over.
+    Files are changed while holding a lock file next to `directory`, as other
+    server processes may use the same store. Each process rolls up its own
+    samples, so a period already recorded by another process is skipped.
+    """
+
+    def __init__(self, directory, nodes, retention):
+        self.directory = directory
+        self.nodes = list(nodes)
+        self.retention = dict(retention)
+        self.dtype = record_dtype(len(self.nodes))
+        self.rollups = {step: Rollup(step, len(self.nodes)) for step in self.retention}
+        self.lock = threading.Lock()
+
+        # outside of the directory, as it is moved if its layout differs
+        self.lock_file = self.directory.rstrip('/') + '.lock'
+        utils.ensure_exists(os.path.dirname(os.path.abspath(self.lock_file)))
+
+        with utils.file_lock(self.lock_file):
+            self._check_layout()
+
+    def _check_layout(self):
+        # records of a different set of nodes can't be read, keep them aside
+        meta_file = os.path.join(self.directory, 'meta.json')
+        meta = {'nodes': self.nodes, 'dtype': self.dtype.descr}
+        meta = json.loads(json.dumps(meta))
+
+        if os.path.isfile(meta_file):
+            with open(meta_file) as f:
+                if json.load(f) == meta:
+                    return
+
+            shutil.move(self.directory, '{dir}.{time}'.format(dir=self.directory,
+                                                              time=int(time.time())))
+
+        utils.ensure_exists(self.directory)
+        utils.atomic_write(meta_file, json.dumps(meta))
+
+    ######################################
+    ## Files
+    ######################################
+
+    def _step_directory(self, step):
+        return os.path.join(self.directory, '{step}s'.format(step=step))
+
+    def _day_file(self, step, day):
+        return os.path.join(self._step_directory(step), '{day}.bin'.format(day=day))
+
+    @staticmethod
+    def _day(timestamp):
+        return int(timestamp // 86400)
+
+    def _append(self, step, record):
+        day = self._day(record[0])
+        filename = self._day_file(step, day)
+
+        if not os.path.isfile(filename):
+            utils.ensure_exists(self._step_directory(step))
+            self._prune(step, day)
+
+        with open(filename, 'ab+') as f:
+            # records are appended in time order, so only the last one can be
+            # of the same period (ignoring a partly written last record)
+            count = f.seek(0, os.SEEK_END) // self.dtype.itemsize
+
+            if count > 0:
+                f.seek((count - 1) * self.dtype.itemsize)
+                last = np.frombuffer(f.read(self.dtype.itemsize), dtype=self.dtype)[0]
+
+                if last['time'] >= record[0]:
+                    return
+
+            f.write(np.array([record], dtype=self.dtype).tobytes())
+
+    def _prune(self, step, today):
+        for name in os.listdir(self._step_directory(step)):
+            day = int(name.split('.')[0])
+
+            if day <= today - self.retention[step]:
+                os.remove(os.path.join(self._step_directory(step), name))
+
+    ######################################
+    ## Writing
+    ######################################
+
+    def add(self, sample_time, usage, jobs, running, pending):
+        """
+        Adds a sample: `usage` is {node: (cpu, temperature)}, `jobs` is
+        {node: simulation ID} for the busy nodes, `running` and `pending` are
+        the numbers of simulations
+        """
+        cpu = np.array([usage.get(node, (np.nan, np.nan))[0] for node in self.nodes])
+        temp = np.array([usage.get(node, (np.nan, np.nan))[1] for node in self.nodes])
+        job = np.array([jobs.get(node, 0) for node in self.nodes], dtype=np.int32)
+
+        with self.lock:
+            records = []
+
+            for step, rollup in self.rollups.items():
+                record = rollup.add(sample_time, cpu, temp, job, running, pending)
+
+                if record is not None:
+                    records.append((step, record))
+
+            if records:
+                with utils.file_lock(self.lock_file):
+                    for step, record in records:
+                        self._append(step, record)
+
+    ######################################
+    ## Reading
+    ######################################
+
+    def read(self, step, start, end):
+        """
+        Returns the records at resolution `step` from `start` to `end`
+        """
+        days = range(self._day(start), self._day(end) + 1)
+
+        parts = []
+
+        for day in days:
+            filename = self._day_file(step, day)
+
+            if os.path.isfile(filename):
+                # ignore a partly written last record
+                count = os.path.getsize(filename) // self.dtype.itemsize
+                parts.append(np.fromfile(filename, dtype=self.dtype, count=count))
+
+        if not parts:
+            return np.zeros(0, dtype=self.dtype)
+
+        records = np.concatenate(parts)
+
+        return records[(records['time'] >= start) & (records['time'] < end)]
+
+    def resolution(self, step):
+        """
+        Returns the coarsest resolution at most `step` (or the finest one)
+        """
+        steps = sorted(self.retention)
+        fitting = [s for s in steps if s <= step]
+
+        return fitting[-1] if fitting else steps[0]
+
+    def query(self, start, end, step):
+        """
+        Returns the metrics from `start` to `end`, with one point per `step`
+        seconds (the means of the records in each step, and the last job of
+        each node), as numpy arrays by name
+        """
+        records = self.read(self.resolution(step), start, end)
+
+        if len(records) == 0:
+            return {name: records[name] for name in self.dtype.names}
+
+        buckets = ((records['time'] - start) // step).astype(np.int64)
+
+        # the first record of each bucket, records are in time order
+        edges = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+        last = np.r_[edges[1:], len(records)] - 1
+
+        def mean(column):
+            known = ~np.isnan(column)
+            sums = np.add.reduceat(np.where(known, column, 0), edges, axis=0)
+            counts = np.add.reduceat(known, edges, axis=0)
+
+            with np.errstate(invalid='ignore', divide='ignore'):
+                return sums / counts
+
+        return {
+            'time': start + buckets[edges] * step,
+            'cpu': mean(records['cpu']),
+            'temp': mean(records['temp']),
+            'job': records['job'][last],
+            'running': mean(records['running']),
+            'pending': mean(records['pending']),
+        }
@@ -0,0 +1,173 @@
+import os
+import json
+import hashlib
+
+import utils
+
+
+class UploadError(Exception):
+    """
+    A chunk was refused. `code` is the HTTP status to respond with and
+    `status` the status of the upload (see `ResumableUpload.status`).
+    """
+
+    def __init__(self, message, code, status):
+        super().__init__(message)
+        self.code = code
+        self.status = status
+
+
+class ResumableUpload:
+    """
+    Upload of a file at `filepath` in chunks, which can be resumed after a
+    dropped connection.
+
+    Chunks are appended to a hidden part file next to `filepath`. Each chunk
+    is sent with its offset in the file and its SHA-256 checksum, and is
+    only written once the checksum matches. The expected total size is kept
+    in a small state file. When the part file reaches that size, it is
+    renamed to `filepath`, so the file appears whole or not at all, and
+    `on_complete()` is called.
+
+    A completed upload is recorded in a marker file, with the identity of the
+    file written and the checksum of its last chunk. A file of the same size
+    written some other way isn't taken for a completed upload.
+    """
+
+    def __init__(self, filepath, on_complete=None):
+        self.filepath = filepath
+        self.on_complete = on_complete
+
+        directory, filename = os.path.split(filepath)
+        self.part_file = os.path.join(directory, '.upload-' + filename)
+        self.state_file = self.part_file + '.json'
+        self.done_file = self.part_file + '.done'
+
+    def _locked(self):
+        return utils.file_lock(self.part_file + '.lock')
+
+    def _expected_size(self):
+        try:
+            with open(self.state_file) as f:
+                return json.load(f)['size']
+        except FileNotFoundError:
+            return None
+
+    def _file_stamp(self):
+        try:
+            stat = os.stat(self.filepath)
+        except FileNotFoundError:
+            return None
+
+        return [stat.st_ino, stat.st_size, stat.st_mtime_ns]
+
+    def _completed(self):
+        """
+        Returns the marker of the completed upload, or None if the file at
+        `filepath` wasn't written by a completed upload
+        """
+        try:
+            with open(self.done_file) as f:
+                done = json.load(f)
+        except FileNotFoundError:
+            return None
+
+        if done['stamp'] != self._file_stamp():
+            return None
+
+        return done
+
+    def _offset(self):
+        try:
+            return os.path.getsize(self.part_file)
+        except FileNotFoundError:
+            return 0
+
+    def _status(self, size=None):
+        expected = self._expected_size()
+
+        if expected is not None and (size is None or size == expected):
+            return {'offset': self._offset(), 'size': expected, 'complete': False}
+
+        # no upload in progress, but the file may have been uploaded before
+        done = self._completed()
+
+        if done is not None and (size is None or size == done['size']):
+            return {'offset': done['size'], 'size': done['size'], 'complete': True}
+
+        return {'offset': 0, 'size': size, 'complete': False}
+
+    def status(self, size=None):
+        """
+        Returns the offset from which to continue an upload of `size` bytes,
+        and whether the file is already complete
+        """
+        with self._locked():
+            return self._status(size)
+
+    def _start(self, size):
+        if os.path.isfile(self.done_file):
+            os.remove(self.done_file)
+
+        with open(self.part_file, 'wb'):
+            pass
+
+        utils.atomic_write(self.state_file, json.dumps({'size': size}))
+
+    def write_chunk(self, offset, size, data, checksum):
+        """
+        Appends the chunk `data` at `offset` of a file of `size` bytes. Returns
+        the new status, see `status`. Raises UploadError if the chunk is not at
+        the current offset or doesn't match `checksum`.
+        """
+        with self._locked():
+            status = self._status(size)
+
+            # the last chunk again, its response was lost
+            if status['complete'] and offset + len(data) == size and \
+                    checksum == self._completed()['last_chunk']:
+                return status
+
+            # a different file, or a new upload from the start
+            if offset == 0 and (status['complete'] or self._expected_size() != size):
+                self._start(size)
+                status = self._status(size)
+
+            if offset != status['offset'] or status['complete']:
+                raise UploadError('upload continues from offset {offset}'.format(
+                    offset=status['offset']), code=409, status=status)
+
+            if offset + len(data) > size:
+                raise UploadError('chunk ends after the end of the file',
+                                  code=400,
+                                  status=status)
+
+            if hashlib.sha256(data).hexdigest() != checksum:
+                raise UploadError('chunk checksum mismatch', code=400, status=status)
+
+            with open(self.part_file, 'ab') as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+
+            offset += len(data)
+
+            if offset < size:
+                return {'offset': offset, 'size': size, 'complete': False}
+
+            os.rename(self.part_file, self.filepath)
+
+            utils.atomic_write(
+                self.done_file,
+                json.dumps({
+                    'size': size,
+                    'last_chunk': checksum,
+                    'stamp': self._file_stamp()
+                }))
+
+            os.remove(self.state_file)
+
+            if self.on_complete is not None:
+                self.on_complete()
+
+            return {'offset': offset, 'size': size, 'complete': True}
@@ -1,4 +1,6 @@
 import os
+import fcntl
+from contextlib import contextmanager
 
 def ensure_exists(directory):
     "Creates a directory unless it exists"
@@ -8,3 +10,30 @@ def ensure_exists(directory):
             os.makedirs(directory)
         except OSError as e:
             print('directory creation failed: {directory}'.format(directory=directory))
+
+
+@contextmanager
+def file_lock(filename):
+    """
+    Holds an exclusive lock on `filename` (created if it doesn't exist) for the
+    duration of a with block. POSIX locks are used as these also work on NFS.
+    """
+    with open(filename, 'a') as f:
+        fcntl.lockf(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.lockf(f, fcntl.LOCK_UN)
+
+
+def atomic_write(filename, data, mode='w'):
+    """
+    Writes data to filename using a temporary file, so that the file is never
+    read half-written
+    """
+    filename_tmp = filename + 'tmp'
+
+    with open(filename_tmp, mode) as f:
+        f.write(data)
+
+    os.rename(filename_tmp, filename)
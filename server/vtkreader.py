@@ -0,0 +1,144 @@
+import re
+
+import numpy as np
+
+######################################
+## Package variables
+######################################
+
+# Lines starting a section of a legacy ASCII VTK file, as written by
+# cfd/elmerpostprocess*.cpp. The numbers between two of them are the data of
+# the first one.
+SECTION = re.compile(
+    r'^[ \t]*(POINTS|CELLS|CELL_TYPES|CELL_DATA|POINT_DATA|SCALARS|LOOKUP_TABLE|VECTORS)'
+    r'\b(.*)$', re.MULTILINE)
+
+# numpy types of the VTK data types
+DATA_TYPES = {
+    'float': np.float64,
+    'double': np.float64,
+    'int': np.int32,
+    'unsigned_char': np.uint8,
+}
+
+######################################
+## Reader
+######################################
+
+
+class UnstructuredGrid:
+    """
+    Contents of a legacy VTK file of an unstructured grid: the coordinates of
+    the points (npoints, 3), the point indices of the cells (ncells, nodes per
+    cell), the VTK cell types, and the cell and point data by name (arrays of
+    (ncells, ) or (npoints, ) for scalars, and (npoints, 3) for vectors).
+    """
+
+    def __init__(self, points, cells, cell_types, cell_data, point_data):
+        self.points = points
+        self.cells = cells
+        self.cell_types = cell_types
+        self.cell_data = cell_data
+        self.point_data = point_data
+
+    @property
+    def nprocs(self):
+        """
+        Number of partitions of the mesh. Parallel runs write the partition of
+        each cell as the cell data "procid", serial runs have no cell data.
+        """
+        if 'procid' not in self.cell_data:
+            return 1
+
+        return len(np.unique(self.cell_data['procid']))
+
+
+def parse_numbers(text, dtype, count, section):
+    values = np.fromstring(text, dtype=dtype, sep=' ')
+
+    if len(values) != count:
+        raise ValueError('{section}: expected {count} values, found {found}'.format(
+            section=section, count=count, found=len(values)))
+
+    return values
+
+
+def parse_cells(text, ncells, size):
+    """
+    Returns the point indices of the cells, from "<n> <index>..." per cell
+    """
+    values = parse_numbers(text, np.int32, size, 'CELLS')
+
+    if ncells == 0:
+        return np.zeros((0, 0), dtype=np.int32)
+
+    # all the cells of our meshes have the same number of points
+    width = values[0] + 1
+
+    if size != ncells * width or not (values[::width] == values[0]).all():
+        raise ValueError('CELLS: cells of different sizes are not supported')
+
+    return values.reshape(ncells, width)[:, 1:]
+
+
+def read_vtk(filename):
+    """
+    Reads a legacy ASCII VTK file of an unstructured grid (see UnstructuredGrid).
+    The numbers of each section are parsed in bulk by numpy.
+    """
+    with open(filename) as f:
+        text = f.read()
+
+    matches = list(SECTION.finditer(text))
+
+    points = None
+    cells = None
+    cell_types = None
+    cell_data = {}
+    point_data = {}
+
+    # the data the current section fills, and the number of points or cells
+    target = None
+    count = 0
+
+    for i, match in enumerate(matches):
+        keyword = match.group(1)
+        args = match.group(2).split()
+
+        end = matches[i + 1].start() if i + 1 < len(matches) else len(text)
+        body = text[match.end():end]
+
+        if keyword == 'POINTS':
+            npoints = int(args[0])
+            points = parse_numbers(body, np.float64, npoints * 3, keyword).reshape(npoints, 3)
+
+        elif keyword == 'CELLS':
+            cells = parse_cells(body, int(args[0]), int(args[1]))
+
+        elif keyword == 'CELL_TYPES':
+            cell_types = parse_numbers(body, np.uint8, int(args[0]), keyword)
+
+        elif keyword in ('CELL_DATA', 'POINT_DATA'):
+            target = cell_data if keyword == 'CELL_DATA' else point_data
+            count = int(args[0])
+
+        elif keyword == 'SCALARS':
+            # the values follow the LOOKUP_TABLE line
+            name, dtype = args[0], DATA_TYPES[args[1]]
+            components = int(args[2]) if len(args) > 2 else 1
+
+        elif keyword == 'LOOKUP_TABLE':
+            values = parse_numbers(body, dtype, count * components, name)
+            target[name] = values.reshape(count, components) if components > 1 else values
+
+        elif keyword == 'VECTORS':
+            values = parse_numbers(body, DATA_TYPES[args[1]], count * 3, args[0])
+            target[args[0]] = values.reshape(count, 3)
+
+    if points is None or cells is None:
+        raise ValueError('{filename}: not an unstructured grid'.format(filename=filename))
+
+    if cell_types is None:
+        cell_types = np.zeros(len(cells), dtype=np.uint8)
+
+    return UnstructuredGrid(points, cells, cell_types, cell_data, point_data)